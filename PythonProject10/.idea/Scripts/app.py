@@ -1,77 +1,109 @@
+import logging
 import os
 import random
 import datetime
-import psycopg2
-from flask import Flask, request, jsonify
+import io
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
-from twilio.rest import Client
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from dotenv import load_dotenv
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import ssl
-import smtplib
+from pydantic_core import from_json
+import bulk_import
+import logging_setup
+import metrics
+import server_timing
+import tracing
+from db import db_connection, read_connection, mark_written, replicas_enabled
+import queries
+import schemas
+from investor_ids import allocator as investor_id_allocator
+from sms import otp_sms_body
+from mailer import RESET_PASSWORD_SUBJECT, VERIFY_EMAIL_SUBJECT, otp_email_body, welcome_email
+from hashing import get_hasher, needs_rehash, HashingOverloaded
+from bloom import signup_filter, refresh_signup_filter
 
 # Load environment variables
 load_dotenv()
+logging_setup.configure_logging()
+log = logging.getLogger(__name__)
+
+
+class JSONProvider(DefaultJSONProvider):
+    # jsonify() and get_json() on pydantic_core's encoder and decoder; jsonify()
+    # also takes the response models in schemas.
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        return schemas.dump(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return from_json(s)
+
 
 app = Flask(__name__)
+app.json = JSONProvider(app)
 CORS(app)
 
 # JWT Configuration
 app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY", "super-secret-key")
 jwt = JWTManager(app)
 
-# Twilio Configuration
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+@app.before_request
+def assign_request_id():
+    logging_setup.bind_request_id(request.headers.get('X-Request-ID'))
 
-# Database Connection
-def get_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DATABASE_NAME", "realoneinvest"),
-        user=os.getenv("DATABASE_USER", "karthik1"),
-        password=os.getenv("DATABASE_PASSWORD", "Info123tech"),
-        host=os.getenv("DATABASE_HOST", "localhost"),
-        port=os.getenv("DATABASE_PORT", "5433")
-    )
 
+@app.after_request
+def return_request_id(response):
+    response.headers['X-Request-ID'] = logging_setup.request_id.get()
+    return response
 
-# Ensure Users Table Exists
-def create_users_table():
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            first_name VARCHAR(100) NOT NULL,
-            last_name VARCHAR(100) NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            phone_number VARCHAR(20) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            email_otp VARCHAR(6),
-            email_otp_expiry TIMESTAMP,
-            phone_otp VARCHAR(6),
-            phone_otp_expiry TIMESTAMP,
-            email_verified BOOLEAN DEFAULT FALSE,
-            phone_verified BOOLEAN DEFAULT FALSE,
-            investor_id VARCHAR(10) UNIQUE,
-            interested_in VARCHAR(50)
-        );
-        """)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("✅ Users table checked/created successfully.")
-    except Exception as e:
-        print(f"❌ Error creating users table: {e}")
+
+def _route():
+    # The rule, not the path, so every /api/... URL is one series and unknown URLs share one
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(_route())
+    server_timing.begin(request.headers.get(server_timing.REQUEST_HEADER))
+    g.trace_span = tracing.start_trace(f"{request.method} {_route()}", request.headers.get('traceparent'),
+                                       attributes={"http.request.method": request.method, "http.route": _route()})
+    g.trace_span.__enter__()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        route, status = _route(), str(response.status_code)
+        metrics.HTTP_IN_FLIGHT.dec(route)
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route, request.method, status)
+        metrics.HTTP_REQUESTS.inc(route, request.method, status)
+        timings = server_timing.header(elapsed)
+        if timings is not None:
+            response.headers['Server-Timing'] = timings
+            response.headers['Timing-Allow-Origin'] = '*'
+    span = g.get('trace_span')
+    if span is not None:
+        span.set_attribute("http.response.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.fail(response.status)
+    return response
+
+
+@app.teardown_request
+def end_trace_span(exc):
+    span = g.pop('trace_span', None)
+    if span is not None:
+        span.__exit__(type(exc) if exc else None, exc, None)
 
 
 # Helper Functions
@@ -79,279 +111,228 @@ def generate_otp():
     return str(random.randint(100000, 999999))
 
 
-def generate_investor_id():
-    return f"I{random.randint(1000, 9999)}"
+def purge_expired_otps():
+    # Codes that were never used or resent would otherwise stay in otp_codes
+    interval = int(os.getenv("OTP_PURGE_INTERVAL", "300"))
+    while True:
+        time.sleep(interval)
+        try:
+            with db_connection() as conn, conn.cursor() as cursor:
+                queries.purge_expired_otps(cursor, datetime.datetime.now())
+        except Exception:
+            log.exception("Error purging expired OTPs")
 
 
-def send_email(to_email, subject, body):
-    try:
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 465  # SSL port for Gmail
-        sender_email = os.getenv("EMAIL_APPCODE")  # Your Gmail email address
-        password = os.getenv("APP_PASSWORD")  # Your Google App Password
-
-        # Create the email content
-        message = MIMEMultipart()
-        message["From"] = sender_email
-        message["To"] = to_email
-        message["Subject"] = subject
-        message.attach(MIMEText(body, "plain"))
-
-        # Establish a secure SSL connection with the Gmail SMTP server
-        context = ssl.create_default_context()
-        with smtplib.SMTP_SSL(smtp_server, smtp_port, context=context) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, to_email, message.as_string())
-
-        print(f"✅ Email sent to {to_email} via Gmail SMTP.")
-    except Exception as e:
-        print(f"❌ Error sending email to {to_email}: {e}")
+def start_background_tasks():
+    threading.Thread(target=purge_expired_otps, daemon=True).start()
+    threading.Thread(target=refresh_signup_filter, daemon=True).start()
+    metrics.start_flusher()
+
+
+def load_login_user(email, primary=False):
+    connection = db_connection() if primary else read_connection(sticky_key=email)
+    with connection as conn, conn.cursor() as cursor:
+        return queries.get_login_user(cursor, email)
 
 
-def send_sms(phone_number, otp):
+def rehash_password(email, password, old_hash):
+    # Runs after the login response; if skipped or lost it happens on a later login
     try:
-        message = twilio_client.messages.create(
-            body=f"Your OTP for phone verification is: {otp}",
-            from_=TWILIO_PHONE_NUMBER,
-            to=phone_number
-        )
-        print(f"✅ SMS sent to {phone_number}. SID: {message.sid}")
-    except Exception as e:
-        print(f"❌ Error sending SMS to {phone_number}: {e}")
+        new_hash = get_hasher().generate_password_hash(password)
+        with db_connection() as conn, conn.cursor() as cursor:
+            queries.rehash_password(cursor, email, old_hash, new_hash)
+        mark_written(email)
+    except HashingOverloaded:
+        pass
+    except Exception:
+        log.exception("Error rehashing password", extra={"email": email})
+
+
+def request_body(model):
+    # The raw bytes go straight to pydantic_core; no intermediate dict
+    return schemas.parse(model, request.get_data(cache=False))
+
+
+@app.errorhandler(schemas.InvalidRequest)
+def invalid_request(e):
+    return jsonify(schemas.ErrorResponse(error=str(e))), 400
+
+
+def overloaded_response():
+    # Too many password hashes queued; better to refuse now than answer in seconds
+    response = jsonify({"error": "Server is busy. Please try again shortly."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 # API Routes
 
 @app.route('/api/signup', methods=['POST'])
 def signup_user():
+    data = request_body(schemas.SignupRequest)
     try:
-        data = request.get_json()
-        first_name = data['first_name']
-        last_name = data['last_name']
-        email = data['email']
-        phone_number = data['phone_number']
-        password = data['password']
-        reenter_password = data['reenter_password']
-        interested_in = data['interested_in']
-
-        if password != reenter_password:
+        email, phone_number = data.email, data.phone_number
+
+        if data.password != data.reenter_password:
             return jsonify({"error": "Passwords do not match"}), 400
 
-        hashed_password = generate_password_hash(password)
+        # Turn away likely duplicates before paying for the password hash
+        if signup_filter.might_exist(email, phone_number):
+            with read_connection(sticky_key=email) as conn, conn.cursor() as cursor:
+                email_taken, phone_taken = queries.signup_conflicts(cursor, email, phone_number)
+            signup_filter.record(email_taken or phone_taken)
+            if email_taken:
+                return jsonify({"error": "Email already registered."}), 409
+            if phone_taken:
+                return jsonify({"error": "Phone number already registered."}), 409
+
+        hashed_password = get_hasher().generate_password_hash(data.password)
         email_otp = generate_otp()
         phone_otp = generate_otp()
         otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
 
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-        INSERT INTO users (first_name, last_name, email, phone_number, password, email_otp, email_otp_expiry, phone_otp, phone_otp_expiry, email_verified, phone_verified, investor_id, interested_in)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, FALSE, FALSE, NULL, %s)
-        """, (first_name, last_name, email, phone_number, hashed_password, email_otp, otp_expiry, phone_otp, otp_expiry,
-              interested_in))
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-
-        send_email(email, "Verify Your Email - Real One Invest", f"Your OTP: {email_otp}")
-        send_sms(phone_number, phone_otp)
-
-        return jsonify({"message": "Signup successful. OTPs sent for email and phone."}), 201
+        with db_connection() as conn, conn.cursor() as cursor:
+            queries.insert_user(cursor, data.first_name, data.last_name, email, phone_number, hashed_password,
+                                email_otp, phone_otp, otp_expiry, data.interested_in)
+            # Queued in the same transaction; outbox_worker.py delivers after commit
+            queries.enqueue_email(cursor, email, VERIFY_EMAIL_SUBJECT, otp_email_body(email_otp))
+            queries.enqueue_sms(cursor, phone_number, otp_sms_body(phone_otp))
+        mark_written(email, phone_number)
+        signup_filter.add(email, phone_number)
+
+        return jsonify(schemas.MessageResponse(message="Signup successful. OTPs sent for email and phone.")), 201
+    except HashingOverloaded:
+        return overloaded_response()
     except Exception as e:
+        log.exception("Signup failed")
         return jsonify({"error": f"Signup failed: {str(e)}"}), 500
 
 
 @app.route('/api/verify-email', methods=['POST'])
 def verify_email():
+    data = request_body(schemas.VerifyEmailRequest)
     try:
-        data = request.get_json()
-        print(f"Request Data: {data}")  # Debugging line
-
-        email = data['email']
-        otp = data['otp']
-
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # Fetch the stored OTP for the given email
-        cursor.execute("SELECT email_otp FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-
-        if not user:
-            return jsonify({"error": "User not found."}), 404
-
-        stored_otp = user[0]
-        print(f"Stored OTP for {email}: {stored_otp}")  # Debugging line
-
-        # Verify if the OTP matches
-        if stored_otp != otp:
-            return jsonify({"error": "Invalid OTP"}), 400
-
-        # If OTP is valid, update the email_verified field
-        cursor.execute("UPDATE users SET email_verified = TRUE WHERE email = %s", (email,))
-        conn.commit()
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({"message": "Email verified successfully."}), 200
-
-    except Exception as e:
-        print(f"Error during email verification: {str(e)}")  # Log the actual error for debugging
+        log.debug("verify-email request", extra={"body": data})  # OTP is redacted
+
+        email, otp = data.email, data.otp
+
+        now = datetime.datetime.now()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Mark the email verified only if the OTP matches and has not expired
+            if not queries.verify_email(cursor, email, otp, now):
+                failure = queries.otp_failure(cursor, 'email', email, queries.VERIFY_EMAIL, now)
+                if failure == 'not_found':
+                    return jsonify({"error": "User not found."}), 404
+                if failure == 'expired':
+                    return jsonify({"error": "OTP has expired."}), 400
+                return jsonify({"error": "Invalid OTP"}), 400
+        mark_written(email)
+
+        return jsonify(schemas.MessageResponse(message="Email verified successfully.")), 200
+
+    except Exception:
+        log.exception("Email verification failed")
         return jsonify({"error": "Email verification failed"}), 500
 
 
 @app.route('/api/verify-phone', methods=['POST'])
 def verify_phone():
+    data = request_body(schemas.VerifyPhoneRequest)
     try:
-        data = request.get_json()
-        phone_number = data['phone_number']
-        otp = data['otp']
-
-        # Database connection
-        conn = get_connection()
-        cursor = conn.cursor()
+        phone_number, otp = data.phone_number, data.otp
 
-        # Fetch the stored OTP for the given phone number
-        cursor.execute("SELECT phone_otp, email FROM users WHERE phone_number = %s", (phone_number,))
-        user = cursor.fetchone()
+        new_investor_id = investor_id_allocator.next_id()
+        now = datetime.datetime.now()
 
-        if not user:
-            return jsonify({"error": "User not found."}), 404
-
-        stored_otp, email = user
-        print(f"Stored OTP for {phone_number}: {stored_otp}")  # Debugging line
-
-        # Verify if the OTP matches
-        if stored_otp != otp:
-            return jsonify({"error": "Invalid OTP"}), 400
-
-        # If OTP is valid, generate investor_id and update user
-        investor_id = generate_investor_id()
-
-        # Update phone_verified and assign investor_id
-        cursor.execute("UPDATE users SET phone_verified = TRUE, investor_id = %s WHERE phone_number = %s",
-                       (investor_id, phone_number))
-        conn.commit()
-
-        send_welcome_email(email, investor_id)
-
-        cursor.close()
-        conn.close()
-
-        return jsonify({"message": "Phone verified successfully.", "investor_id": investor_id}), 200
-
-    except Exception as e:
-        print(f"Error during phone verification: {str(e)}")  # Log the actual error for debugging
+        # Database connection
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Mark the phone verified and assign investor_id if the OTP matches and has not expired
+            user = queries.verify_phone(cursor, phone_number, otp, now, new_investor_id)
+            if user is None:
+                investor_id_allocator.release(new_investor_id)
+                failure = queries.otp_failure(cursor, 'phone_number', phone_number, queries.VERIFY_PHONE, now)
+                if failure == 'not_found':
+                    return jsonify({"error": "User not found."}), 404
+                if failure == 'expired':
+                    return jsonify({"error": "OTP has expired."}), 400
+                return jsonify({"error": "Invalid OTP"}), 400
+            email, investor_id = user
+            enqueue_welcome_email(cursor, email, investor_id)
+        if investor_id != new_investor_id:
+            # Verified before; keep the ID the user already has
+            investor_id_allocator.release(new_investor_id)
+        mark_written(phone_number, email)
+
+        return jsonify(schemas.VerifyPhoneResponse(message="Phone verified successfully.",
+                                                   investor_id=investor_id)), 200
+
+    except Exception:
+        log.exception("Phone verification failed")
         return jsonify({"error": "Phone verification failed"}), 500
 
-def send_welcome_email(email, investor_id):
-    try:
-        subject = "Welcome to Real One Invest!"
-        body = f"""
-        Hello,
-
-        Welcome to Real One Invest! Your investor ID is: {investor_id}.
-
-        Thank you for joining us!
-
-        Best regards,
-        The Real Invest Team 💼
-
-        Note: This is an automated email. Please do not reply to this email.
-        """
-
-        send_email(email, subject, body)
-    except Exception as e:
-        print(f"❌ Error sending welcome email to {email}: {e}")
+def enqueue_welcome_email(cursor, email, investor_id):
+    subject, body = welcome_email(investor_id)
+    queries.enqueue_email(cursor, email, subject, body)
 
 @app.route('/api/resend-email-otp', methods=['POST'])
 def resend_email_otp():
+    data = request_body(schemas.ResendEmailOtpRequest)
     try:
-        data = request.get_json()
-        email = data['email']
-
-        # Check if the user exists in the database
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT email FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-
-        if not user:
-            return jsonify({"error": "User not found."}), 404
+        email = data.email
 
         # Generate a new OTP and set the expiry time
         new_email_otp = generate_otp()
         otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
 
-        # Update the OTP and expiry time in the database
-        cursor.execute("UPDATE users SET email_otp = %s, email_otp_expiry = %s WHERE email = %s",
-                       (new_email_otp, otp_expiry, email))
-        conn.commit()
-
-        # Send the new OTP to the user's email
-        send_email(email, "Verify Your Email - Real One Invest", f"Your new OTP: {new_email_otp}")
-
-        cursor.close()
-        conn.close()
+        # Update the OTP and expiry time in the database; no row means no such user
+        with db_connection() as conn, conn.cursor() as cursor:
+            if not queries.set_otp(cursor, 'email', email, queries.VERIFY_EMAIL, new_email_otp, otp_expiry):
+                return jsonify({"error": "User not found."}), 404
+            # Queue the new OTP for the user's email
+            queries.enqueue_email(cursor, email, VERIFY_EMAIL_SUBJECT, f"Your new OTP: {new_email_otp}")
 
-        return jsonify({"message": "New OTP sent successfully."}), 200
+        return jsonify(schemas.MessageResponse(message="New OTP sent successfully.")), 200
 
-    except Exception as e:
-        print(f"❌ Error resending email OTP: {str(e)}")
+    except Exception:
+        log.exception("Error resending email OTP")
         return jsonify({"error": "Failed to resend OTP."}), 500
 
 @app.route('/api/resend-phone-otp', methods=['POST'])
 def resend_phone_otp():
+    data = request_body(schemas.ResendPhoneOtpRequest)
     try:
-        data = request.get_json()
-        phone_number = data['phone_number']
-
-        # Check if the user exists in the database
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT phone_number FROM users WHERE phone_number = %s", (phone_number,))
-        user = cursor.fetchone()
-
-        if not user:
-            return jsonify({"error": "User not found."}), 404
+        phone_number = data.phone_number
 
         # Generate a new OTP and set the expiry time
         new_phone_otp = generate_otp()
         otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
 
-        # Update the OTP and expiry time in the database
-        cursor.execute("UPDATE users SET phone_otp = %s, phone_otp_expiry = %s WHERE phone_number = %s",
-                       (new_phone_otp, otp_expiry, phone_number))
-        conn.commit()
-
-        # Send the new OTP to the user's phone via SMS
-        send_sms(phone_number, new_phone_otp)
+        # Update the OTP and expiry time in the database; no row means no such user
+        with db_connection() as conn, conn.cursor() as cursor:
+            if not queries.set_otp(cursor, 'phone_number', phone_number, queries.VERIFY_PHONE, new_phone_otp, otp_expiry):
+                return jsonify({"error": "User not found."}), 404
+            # Queue the new OTP for the user's phone via SMS
+            queries.enqueue_sms(cursor, phone_number, otp_sms_body(new_phone_otp))
 
-        cursor.close()
-        conn.close()
+        return jsonify(schemas.MessageResponse(message="New OTP sent successfully.")), 200
 
-        return jsonify({"message": "New OTP sent successfully."}), 200
-
-    except Exception as e:
-        print(f"❌ Error resending phone OTP: {str(e)}")
+    except Exception:
+        log.exception("Error resending phone OTP")
         return jsonify({"error": "Failed to resend OTP."}), 500
 
 
 
 @app.route('/api/login', methods=['POST'])
 def login_user():
+    data = request_body(schemas.LoginRequest)
     try:
-        data = request.get_json()
-        email = data['email']
-        password = data['password']
+        email, password = data.email, data.password
 
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT password, email_verified, phone_verified FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
+        user = load_login_user(email)
+        # A lagging replica may not have a recent signup or verification yet,
+        # so negative answers are confirmed on the primary.
+        if replicas_enabled() and (not user or not user[1] or not user[2]):
+            user = load_login_user(email, primary=True)
 
         if not user:
             return jsonify({"error": "User not found."}), 404
@@ -364,121 +345,130 @@ def login_user():
         if not phone_verified:
             return jsonify({"error": "Phone not verified."}), 403
 
-        if not check_password_hash(db_password, password):
-            return jsonify({"error": "Invalid credentials."}), 401
+        hasher = get_hasher()
+        if not hasher.check_password_hash(db_password, password):
+            # The password may have just been reset on the primary
+            fresh = load_login_user(email, primary=True) if replicas_enabled() else None
+            if not fresh or fresh[0] == db_password or not hasher.check_password_hash(fresh[0], password):
+                return jsonify({"error": "Invalid credentials."}), 401
+            db_password = fresh[0]
+
+        if needs_rehash(db_password):
+            # Stored under an older PASSWORD_HASH_METHOD
+            threading.Thread(target=rehash_password, args=(email, password, db_password), daemon=True).start()
 
         access_token = create_access_token(identity=email)
-        return jsonify({"message": "Login successful.", "access_token": access_token}), 200
+        return jsonify(schemas.LoginResponse(message="Login successful.", access_token=access_token)), 200
 
+    except HashingOverloaded:
+        return overloaded_response()
     except Exception as e:
+        log.exception("Login failed")
         return jsonify({"error": f"Login failed: {str(e)}"}), 500
 
 @app.route('/api/forgot-password', methods=['POST'])
 def forgot_password():
+    data = request_body(schemas.ForgotPasswordRequest)
     try:
-        data = request.get_json()
-        identifier = data['identifier']  # This can be either email or phone number
+        identifier = data.identifier  # This can be either email or phone number
 
         # Check if the identifier is an email or phone number
-        if "@" in identifier:  # Email check
-            column = 'email'
-            otp_column = 'email_otp'
-            otp_expiry_column = 'email_otp_expiry'
-            value = identifier
-        else:  # Assume it's a phone number
-            column = 'phone_number'
-            otp_column = 'phone_otp'
-            otp_expiry_column = 'phone_otp_expiry'
-            value = identifier
-
-        # Check if the user exists in the database
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT {column} FROM users WHERE {column} = %s", (value,))
-        user = cursor.fetchone()
-
-        if not user:
-            return jsonify({"error": f"User with {column} not found."}), 404
+        column = queries.identifier_column(identifier)
+        value = identifier
 
         # Generate OTP and set expiry time
         reset_otp = generate_otp()
         otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=15)
 
-        # Update OTP and expiry time in the database
-        cursor.execute(f"UPDATE users SET {otp_column} = %s, {otp_expiry_column} = %s WHERE {column} = %s",
-                       (reset_otp, otp_expiry, value))
-        conn.commit()
+        # Update OTP and expiry time in the database; no row means no such user
+        with db_connection() as conn, conn.cursor() as cursor:
+            if not queries.set_otp(cursor, column, value, queries.RESET_PASSWORD, reset_otp, otp_expiry):
+                return jsonify({"error": f"User with {column} not found."}), 404
 
-        # Send the OTP to the user's email or phone
-        if column == 'email':
-            send_email(value, "Password Reset OTP - Real One Invest", f"Your OTP to reset your password: {reset_otp}")
-        else:
-            send_sms(value, reset_otp)
+            # Queue the OTP for the user's email or phone
+            if column == 'email':
+                queries.enqueue_email(cursor, value, RESET_PASSWORD_SUBJECT,
+                                      f"Your OTP to reset your password: {reset_otp}")
+            else:
+                queries.enqueue_sms(cursor, value, otp_sms_body(reset_otp))
 
-        cursor.close()
-        conn.close()
+        return jsonify(schemas.MessageResponse(message="Password reset OTP sent.")), 200
 
-        return jsonify({"message": "Password reset OTP sent."}), 200
-
-    except Exception as e:
-        print(f"❌ Error in forgot-password: {str(e)}")
+    except Exception:
+        log.exception("Error in forgot-password")
         return jsonify({"error": "Failed to send OTP for password reset."}), 500
 
 
 
 @app.route('/api/reset-password', methods=['POST'])
 def reset_password():
+    data = request_body(schemas.ResetPasswordRequest)
     try:
-        data = request.get_json()
-        identifier = data['identifier']  # This can be either email or phone number
-        otp = data['otp']
-        new_password = data['new_password']
+        identifier = data.identifier  # This can be either email or phone number
+        otp, new_password = data.otp, data.new_password
 
         # Check if the identifier is an email or phone number
-        if "@" in identifier:  # Email check
-            column = 'email'
-            otp_column = 'email_otp'
-            otp_expiry_column = 'email_otp_expiry'
-        else:  # Assume it's a phone number
-            column = 'phone_number'
-            otp_column = 'phone_otp'
-            otp_expiry_column = 'phone_otp_expiry'
-
-        # Check if the user exists and fetch the stored OTP
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT {otp_column}, {otp_expiry_column} FROM users WHERE {column} = %s", (identifier,))
-        user = cursor.fetchone()
+        column = queries.identifier_column(identifier)
+
+        hashed_password = get_hasher().generate_password_hash(new_password)
+        now = datetime.datetime.now()
+
+        # Update the password only if the OTP matches and has not expired
+        with db_connection() as conn, conn.cursor() as cursor:
+            if not queries.reset_password(cursor, column, identifier, otp, now, hashed_password):
+                failure = queries.otp_failure(cursor, column, identifier, queries.RESET_PASSWORD, now)
+                if failure == 'not_found':
+                    return jsonify({"error": f"User with {column} not found."}), 404
+                if failure == 'expired':
+                    return jsonify({"error": "OTP has expired."}), 400
+                return jsonify({"error": "Invalid OTP."}), 400
+        mark_written(identifier)
+
+        return jsonify(schemas.MessageResponse(message="Password reset successful.")), 200
+
+    except HashingOverloaded:
+        return overloaded_response()
+    except Exception:
+        log.exception("Error in reset-password")
+        return jsonify({"error": "Failed to reset password."}), 500
 
-        if not user:
-            return jsonify({"error": f"User with {column} not found."}), 404
 
-        stored_otp, otp_expiry = user
 
-        # Check if OTP is expired
-        if datetime.datetime.now() > otp_expiry:
-            return jsonify({"error": "OTP has expired."}), 400
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Off unless METRICS_TOKEN is set and sent (see metrics.py)
+    if not metrics.authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Not found."}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-        # Verify the OTP
-        if stored_otp != otp:
-            return jsonify({"error": "Invalid OTP."}), 400
 
-        # Update the password
-        hashed_password = generate_password_hash(new_password)
-        cursor.execute(f"UPDATE users SET password = %s WHERE {column} = %s", (hashed_password, identifier))
-        conn.commit()
+@app.route('/api/admin/import-users', methods=['POST'])
+@jwt_required()
+def import_users():
+    try:
+        admin_emails = [e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()]
+        if get_jwt_identity() not in admin_emails:
+            return jsonify({"error": "Admin access required."}), 403
 
-        cursor.close()
-        conn.close()
+        # CSV by default; JSON Lines via ?format=jsonl or an ndjson/jsonl content type
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'jsonl' if 'json' in (request.mimetype or '') else 'csv'
+        if fmt not in ('csv', 'jsonl'):
+            return jsonify({"error": "Unsupported format. Use csv or jsonl."}), 400
 
-        return jsonify({"message": "Password reset successful."}), 200
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        report = bulk_import.import_users(stream, fmt)
 
-    except Exception as e:
-        print(f"❌ Error in reset-password: {str(e)}")
-        return jsonify({"error": "Failed to reset password."}), 500
+        return jsonify(report), 200
+
+    except Exception:
+        log.exception("Error importing users")
+        return jsonify({"error": "User import failed."}), 500
 
 
 
 if __name__ == '__main__':
-    create_users_table()
+    # Schema changes are applied with `python migrate.py up`, not at startup
+    start_background_tasks()
     app.run(debug=True, host="0.0.0.0", port=5000)
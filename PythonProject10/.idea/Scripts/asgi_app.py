@@ -0,0 +1,506 @@
+"""ASGI version of the /api routes in app.py, on FastAPI.
+
+Same paths, request bodies, responses and status codes as the Flask app,
+with async handlers: queries go through async_db (asyncpg), password hashes
+are awaited on the hashing pool, and email/SMS are queued in the outbox in
+the same transaction, as in app.py. Access tokens carry the same claims as
+flask_jwt_extended's, so either app accepts the other's tokens.
+
+Reads go to the primary; async_db has no replica routing yet.
+
+Run: uvicorn asgi_app:app --workers 4
+"""
+import asyncio
+import contextlib
+import datetime
+import io
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import jwt
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+import async_db
+import bulk_import
+import logging_setup
+import metrics
+import queries
+import schemas
+import server_timing
+import tracing
+from bloom import signup_filter, refresh_signup_filter
+from hashing import get_hasher, needs_rehash, HashingOverloaded
+from investor_ids import allocator as investor_id_allocator
+from mailer import RESET_PASSWORD_SUBJECT, VERIFY_EMAIL_SUBJECT, otp_email_body, welcome_email
+from sms import otp_sms_body
+
+# Load environment variables
+load_dotenv()
+logging_setup.configure_logging()
+log = logging.getLogger(__name__)
+
+# flask_jwt_extended defaults
+JWT_ALGORITHM = "HS256"
+JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(minutes=15)
+
+_background_tasks = set()
+
+
+async def purge_expired_otps():
+    # Codes that were never used or resent would otherwise stay in otp_codes
+    interval = int(os.getenv("OTP_PURGE_INTERVAL", "300"))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with async_db.transaction() as conn:
+                await async_db.purge_expired_otps(conn, datetime.datetime.now())
+        except Exception:
+            log.exception("Error purging expired OTPs")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    purge = asyncio.create_task(purge_expired_otps())
+    threading.Thread(target=refresh_signup_filter, daemon=True).start()
+    metrics.start_flusher()
+    yield
+    purge.cancel()
+    await async_db.dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+class RequestIdMiddleware:
+    """Binds a request ID for logging and returns it as X-Request-ID.
+
+    Plain ASGI rather than @app.middleware("http"), which would run every
+    request in an extra task.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        incoming = dict(scope['headers']).get(b'x-request-id', b'').decode('latin-1')
+        header = (b'x-request-id', logging_setup.bind_request_id(incoming).encode('latin-1'))
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [*message.get('headers', ()), header]
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+app.add_middleware(RequestIdMiddleware)
+
+
+class MetricsMiddleware:
+    """Per-route request count, latency and in-flight gauge, Server-Timing and the root trace span, as in app.py."""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+        self.paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self.paths is None:
+            # Every route is a fixed path, so the path is the route label
+            self.paths = frozenset(route.path for route in self.routes)
+        route = scope['path'] if scope['path'] in self.paths else "unmatched"
+        status = "500"
+        headers = dict(scope['headers'])
+        timed = server_timing.begin(headers.get(b'x-server-timing', b'').decode('latin-1'))
+        span = tracing.start_trace(f"{scope['method']} {route}", headers.get(b'traceparent', b'').decode('latin-1'),
+                                   attributes={"http.request.method": scope['method'], "http.route": route})
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+                span.set_attribute("http.response.status_code", message['status'])
+                if message['status'] >= 500:
+                    span.fail(f"HTTP {message['status']}")
+                if timed:
+                    timings = server_timing.header(time.perf_counter() - start).encode('latin-1')
+                    message['headers'] = [*message.get('headers', ()), (b'server-timing', timings),
+                                          (b'timing-allow-origin', b'*')]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc(route)
+        start = time.perf_counter()
+        try:
+            with span:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec(route)
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route, scope['method'], status)
+            metrics.HTTP_REQUESTS.inc(route, scope['method'], status)
+
+
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
+
+# Helper Functions
+def generate_otp():
+    return str(random.randint(100000, 999999))
+
+
+class ModelResponse(JSONResponse):
+    # pydantic_core's encoder; takes the response models in schemas as well as dicts
+    def render(self, content):
+        return schemas.dump(content)
+
+
+async def request_body(request, model):
+    return schemas.parse(model, await request.body())
+
+
+@app.exception_handler(schemas.InvalidRequest)
+async def invalid_request(request, e):
+    return ModelResponse(schemas.ErrorResponse(error=str(e)), status_code=400)
+
+
+def error(message, status_code):
+    return ModelResponse(schemas.ErrorResponse(error=message), status_code=status_code)
+
+
+def overloaded_response():
+    # Too many password hashes queued; better to refuse now than answer in seconds
+    return ModelResponse(schemas.ErrorResponse(error="Server is busy. Please try again shortly."), status_code=503,
+                         headers={"Retry-After": "1"})
+
+
+def _jwt_secret():
+    return os.getenv("JWT_SECRET_KEY", "super-secret-key")
+
+
+def create_access_token(identity):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    claims = {"fresh": False, "iat": now, "jti": str(uuid.uuid4()), "type": "access", "sub": identity,
+              "nbf": now, "exp": now + JWT_ACCESS_TOKEN_EXPIRES}
+    return jwt.encode(claims, _jwt_secret(), algorithm=JWT_ALGORITHM)
+
+
+def jwt_identity(request):
+    """Return (identity, None), or (None, error response) as flask_jwt_extended would answer."""
+    header = request.headers.get("Authorization")
+    if not header:
+        return None, ModelResponse({"msg": "Missing Authorization Header"}, status_code=401)
+    scheme, _, token = header.partition(" ")
+    if scheme != "Bearer" or not token:
+        return None, ModelResponse({"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"},
+                                   status_code=422)
+    try:
+        claims = jwt.decode(token, _jwt_secret(), algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        return None, ModelResponse({"msg": "Token has expired"}, status_code=401)
+    except jwt.InvalidTokenError as e:
+        return None, ModelResponse({"msg": str(e)}, status_code=422)
+    if claims.get("type") != "access":
+        return None, ModelResponse({"msg": "Only non-refresh tokens are allowed"}, status_code=422)
+    return claims["sub"], None
+
+
+async def rehash_password(email, password, old_hash):
+    # Runs after the login response; if skipped or lost it happens on a later login
+    try:
+        new_hash = await get_hasher().generate_password_hash_async(password)
+        async with async_db.transaction() as conn:
+            await async_db.rehash_password(conn, email, old_hash, new_hash)
+    except HashingOverloaded:
+        pass
+    except Exception:
+        log.exception("Error rehashing password", extra={"email": email})
+
+
+def _in_background(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _otp_failure_response(conn, column, value, purpose, now, not_found, invalid):
+    failure = await async_db.otp_failure(conn, column, value, purpose, now)
+    if failure == 'not_found':
+        return error(not_found, 404)
+    if failure == 'expired':
+        return error("OTP has expired.", 400)
+    return error(invalid, 400)
+
+
+# API Routes
+
+@app.post('/api/signup')
+async def signup_user(request: Request):
+    data = await request_body(request, schemas.SignupRequest)
+    try:
+        email, phone_number = data.email, data.phone_number
+
+        if data.password != data.reenter_password:
+            return error("Passwords do not match", 400)
+
+        # Turn away likely duplicates before paying for the password hash
+        if signup_filter.might_exist(email, phone_number):
+            async with async_db.connection() as conn:
+                email_taken, phone_taken = await async_db.signup_conflicts(conn, email, phone_number)
+            signup_filter.record(email_taken or phone_taken)
+            if email_taken:
+                return error("Email already registered.", 409)
+            if phone_taken:
+                return error("Phone number already registered.", 409)
+
+        hashed_password = await get_hasher().generate_password_hash_async(data.password)
+        email_otp = generate_otp()
+        phone_otp = generate_otp()
+        otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
+
+        async with async_db.transaction() as conn:
+            await async_db.insert_user(conn, data.first_name, data.last_name, email, phone_number, hashed_password,
+                                       email_otp, phone_otp, otp_expiry, data.interested_in)
+            await async_db.enqueue_email(conn, email, VERIFY_EMAIL_SUBJECT, otp_email_body(email_otp))
+            await async_db.enqueue_sms(conn, phone_number, otp_sms_body(phone_otp))
+        signup_filter.add(email, phone_number)
+
+        return ModelResponse(schemas.MessageResponse(message="Signup successful. OTPs sent for email and phone."),
+                             status_code=201)
+    except HashingOverloaded:
+        return overloaded_response()
+    except Exception as e:
+        log.exception("Signup failed")
+        return error(f"Signup failed: {str(e)}", 500)
+
+
+@app.post('/api/verify-email')
+async def verify_email(request: Request):
+    data = await request_body(request, schemas.VerifyEmailRequest)
+    try:
+        email, otp = data.email, data.otp
+
+        now = datetime.datetime.now()
+        async with async_db.transaction() as conn:
+            # Mark the email verified only if the OTP matches and has not expired
+            if not await async_db.verify_email(conn, email, otp, now):
+                return await _otp_failure_response(conn, 'email', email, queries.VERIFY_EMAIL, now,
+                                                   "User not found.", "Invalid OTP")
+
+        return ModelResponse(schemas.MessageResponse(message="Email verified successfully."))
+
+    except Exception:
+        log.exception("Email verification failed")
+        return error("Email verification failed", 500)
+
+
+@app.post('/api/verify-phone')
+async def verify_phone(request: Request):
+    data = await request_body(request, schemas.VerifyPhoneRequest)
+    try:
+        phone_number, otp = data.phone_number, data.otp
+
+        # Only touches the database once per block of IDs
+        new_investor_id = await run_in_threadpool(investor_id_allocator.next_id)
+        now = datetime.datetime.now()
+
+        async with async_db.transaction() as conn:
+            # Mark the phone verified and assign investor_id if the OTP matches and has not expired
+            user = await async_db.verify_phone(conn, phone_number, otp, now, new_investor_id)
+            if user is None:
+                investor_id_allocator.release(new_investor_id)
+                return await _otp_failure_response(conn, 'phone_number', phone_number, queries.VERIFY_PHONE, now,
+                                                   "User not found.", "Invalid OTP")
+            email, investor_id = user
+            subject, body = welcome_email(investor_id)
+            await async_db.enqueue_email(conn, email, subject, body)
+        if investor_id != new_investor_id:
+            # Verified before; keep the ID the user already has
+            investor_id_allocator.release(new_investor_id)
+
+        return ModelResponse(schemas.VerifyPhoneResponse(message="Phone verified successfully.",
+                                                         investor_id=investor_id))
+
+    except Exception:
+        log.exception("Phone verification failed")
+        return error("Phone verification failed", 500)
+
+
+@app.post('/api/resend-email-otp')
+async def resend_email_otp(request: Request):
+    data = await request_body(request, schemas.ResendEmailOtpRequest)
+    try:
+        email = data.email
+
+        new_email_otp = generate_otp()
+        otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
+
+        async with async_db.transaction() as conn:
+            if not await async_db.set_otp(conn, 'email', email, queries.VERIFY_EMAIL, new_email_otp, otp_expiry):
+                return error("User not found.", 404)
+            await async_db.enqueue_email(conn, email, VERIFY_EMAIL_SUBJECT, f"Your new OTP: {new_email_otp}")
+
+        return ModelResponse(schemas.MessageResponse(message="New OTP sent successfully."))
+
+    except Exception:
+        log.exception("Error resending email OTP")
+        return error("Failed to resend OTP.", 500)
+
+
+@app.post('/api/resend-phone-otp')
+async def resend_phone_otp(request: Request):
+    data = await request_body(request, schemas.ResendPhoneOtpRequest)
+    try:
+        phone_number = data.phone_number
+
+        new_phone_otp = generate_otp()
+        otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
+
+        async with async_db.transaction() as conn:
+            if not await async_db.set_otp(conn, 'phone_number', phone_number, queries.VERIFY_PHONE,
+                                          new_phone_otp, otp_expiry):
+                return error("User not found.", 404)
+            await async_db.enqueue_sms(conn, phone_number, otp_sms_body(new_phone_otp))
+
+        return ModelResponse(schemas.MessageResponse(message="New OTP sent successfully."))
+
+    except Exception:
+        log.exception("Error resending phone OTP")
+        return error("Failed to resend OTP.", 500)
+
+
+@app.post('/api/login')
+async def login_user(request: Request):
+    data = await request_body(request, schemas.LoginRequest)
+    try:
+        email, password = data.email, data.password
+
+        async with async_db.connection() as conn:
+            user = await async_db.get_login_user(conn, email)
+
+        if not user:
+            return error("User not found.", 404)
+
+        db_password, email_verified, phone_verified = user
+
+        if not email_verified:
+            return error("Email not verified.", 403)
+
+        if not phone_verified:
+            return error("Phone not verified.", 403)
+
+        if not await get_hasher().check_password_hash_async(db_password, password):
+            return error("Invalid credentials.", 401)
+
+        if needs_rehash(db_password):
+            # Stored under an older PASSWORD_HASH_METHOD
+            _in_background(rehash_password(email, password, db_password))
+
+        access_token = create_access_token(email)
+        return ModelResponse(schemas.LoginResponse(message="Login successful.", access_token=access_token))
+
+    except HashingOverloaded:
+        return overloaded_response()
+    except Exception as e:
+        log.exception("Login failed")
+        return error(f"Login failed: {str(e)}", 500)
+
+
+@app.post('/api/forgot-password')
+async def forgot_password(request: Request):
+    data = await request_body(request, schemas.ForgotPasswordRequest)
+    try:
+        identifier = data.identifier  # This can be either email or phone number
+
+        column = queries.identifier_column(identifier)
+        reset_otp = generate_otp()
+        otp_expiry = datetime.datetime.now() + datetime.timedelta(minutes=15)
+
+        async with async_db.transaction() as conn:
+            if not await async_db.set_otp(conn, column, identifier, queries.RESET_PASSWORD, reset_otp, otp_expiry):
+                return error(f"User with {column} not found.", 404)
+            if column == 'email':
+                await async_db.enqueue_email(conn, identifier, RESET_PASSWORD_SUBJECT,
+                                             f"Your OTP to reset your password: {reset_otp}")
+            else:
+                await async_db.enqueue_sms(conn, identifier, otp_sms_body(reset_otp))
+
+        return ModelResponse(schemas.MessageResponse(message="Password reset OTP sent."))
+
+    except Exception:
+        log.exception("Error in forgot-password")
+        return error("Failed to send OTP for password reset.", 500)
+
+
+@app.post('/api/reset-password')
+async def reset_password(request: Request):
+    data = await request_body(request, schemas.ResetPasswordRequest)
+    try:
+        identifier = data.identifier  # This can be either email or phone number
+        otp, new_password = data.otp, data.new_password
+
+        column = queries.identifier_column(identifier)
+        hashed_password = await get_hasher().generate_password_hash_async(new_password)
+        now = datetime.datetime.now()
+
+        async with async_db.transaction() as conn:
+            # Update the password only if the OTP matches and has not expired
+            if not await async_db.reset_password(conn, column, identifier, otp, now, hashed_password):
+                return await _otp_failure_response(conn, column, identifier, queries.RESET_PASSWORD, now,
+                                                   f"User with {column} not found.", "Invalid OTP.")
+
+        return ModelResponse(schemas.MessageResponse(message="Password reset successful."))
+
+    except HashingOverloaded:
+        return overloaded_response()
+    except Exception:
+        log.exception("Error in reset-password")
+        return error("Failed to reset password.", 500)
+
+
+@app.get('/metrics')
+async def metrics_endpoint(request: Request):
+    # Off unless METRICS_TOKEN is set and sent (see metrics.py)
+    if not metrics.authorized(request.headers.get('authorization')):
+        return error("Not found.", 404)
+    # Reads other workers' files when METRICS_DIR is set, so off the event loop
+    return Response(await run_in_threadpool(metrics.render), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post('/api/admin/import-users')
+async def import_users(request: Request):
+    identity, response = jwt_identity(request)
+    if response is not None:
+        return response
+    try:
+        admin_emails = [e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()]
+        if identity not in admin_emails:
+            return error("Admin access required.", 403)
+
+        # CSV by default; JSON Lines via ?format=jsonl or an ndjson/jsonl content type
+        fmt = request.query_params.get('format')
+        if not fmt:
+            fmt = 'jsonl' if 'json' in request.headers.get('content-type', '') else 'csv'
+        if fmt not in ('csv', 'jsonl'):
+            return error("Unsupported format. Use csv or jsonl.", 400)
+
+        # bulk_import is synchronous (COPY via psycopg2), so it runs on a worker thread
+        stream = io.StringIO((await request.body()).decode('utf-8'), newline='')
+        report = await run_in_threadpool(bulk_import.import_users, stream, fmt)
+
+        return ModelResponse(report)
+
+    except Exception:
+        log.exception("Error importing users")
+        return error("User import failed.", 500)
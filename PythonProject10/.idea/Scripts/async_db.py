@@ -0,0 +1,154 @@
+import os
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import URL, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import metrics
+import server_timing
+import tracing
+import queries
+
+_engine = None
+_engine_pid = None
+
+
+def get_engine():
+    # One engine (and asyncpg pool) per process; asyncpg caches prepared
+    # statements per connection on its own.
+    global _engine, _engine_pid
+    if _engine is None or _engine_pid != os.getpid():
+        url = URL.create(
+            "postgresql+asyncpg",
+            username=os.getenv("DATABASE_USER", "karthik1"),
+            password=os.getenv("DATABASE_PASSWORD", "Info123tech"),
+            host=os.getenv("DATABASE_HOST", "localhost"),
+            port=int(os.getenv("DATABASE_PORT", "5433")),
+            database=os.getenv("DATABASE_NAME", "realoneinvest"),
+        )
+        _engine = create_async_engine(
+            url,
+            pool_size=int(os.getenv("DATABASE_POOL_MAX", "20")),
+            max_overflow=0,
+            pool_timeout=float(os.getenv("DATABASE_POOL_TIMEOUT", "5")),
+            pool_pre_ping=True,
+        )
+        _engine_pid = os.getpid()
+    return _engine
+
+
+async def dispose_engine():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+def _named(sql):
+    # queries.STATEMENTS use psycopg2's %s; SQLAlchemy text() wants :name binds
+    parts = sql.split("%s")
+    return text("".join(f"{part}:p{i}" for i, part in enumerate(parts[:-1], 1)) + parts[-1])
+
+
+# Compiled once; asyncpg then prepares each statement once per connection.
+STATEMENTS = {name: _named(sql) for name, sql in queries.STATEMENTS.items()}
+
+
+def _params(params):
+    return {f"p{i}": value for i, value in enumerate(params, 1)}
+
+
+@asynccontextmanager
+async def _acquired(context):
+    # The engine's pool checkout happens on entry and the commit on exit;
+    # timed like ConnectionPool.getconn() and connection()
+    start = time.perf_counter()
+    async with context as conn:
+        waited = time.perf_counter() - start
+        metrics.DB_ACQUIRE_SECONDS.observe(waited, "async")
+        server_timing.record("db-acquire", waited)
+        yield conn
+        committing = time.perf_counter()
+    server_timing.record("db-commit", time.perf_counter() - committing)
+
+
+def transaction():
+    """``async with transaction() as conn``: commits on success, like db_connection()."""
+    return _acquired(get_engine().begin())
+
+
+def connection():
+    return _acquired(get_engine().connect())
+
+
+async def _fetchone(conn, name, params):
+    with metrics.DB_QUERY_SECONDS.time(name), server_timing.phase(f"db.{name}"), \
+            tracing.span(f"db.{name}", tracing.CLIENT, {"db.system": "postgresql"}):
+        result = await conn.execute(STATEMENTS[name], _params(params))
+    return result.first()
+
+
+async def _execute(conn, name, params):
+    with metrics.DB_QUERY_SECONDS.time(name), server_timing.phase(f"db.{name}"), \
+            tracing.span(f"db.{name}", tracing.CLIENT, {"db.system": "postgresql"}):
+        result = await conn.execute(STATEMENTS[name], _params(params))
+    return result.rowcount
+
+
+# Each function mirrors the one of the same name in queries.py, with an
+# AsyncConnection from transaction()/connection() in place of the cursor.
+async def insert_user(conn, first_name, last_name, email, phone_number, hashed_password,
+                      email_otp, phone_otp, otp_expiry, interested_in):
+    await _execute(conn, 'insert_user', (first_name, last_name, email, phone_number, hashed_password, interested_in,
+                                         email_otp, otp_expiry, phone_otp, otp_expiry))
+
+
+async def signup_conflicts(conn, email, phone_number):
+    return await _fetchone(conn, 'signup_conflicts', (email, phone_number))
+
+
+async def get_login_user(conn, email):
+    return await _fetchone(conn, 'login_user', (email,))
+
+
+async def rehash_password(conn, email, old_hash, new_hash):
+    return await _execute(conn, 'rehash_password', (new_hash, email, old_hash)) == 1
+
+
+async def verify_email(conn, email, otp, now):
+    return await _fetchone(conn, 'verify_email', (email, otp, now)) is not None
+
+
+async def verify_phone(conn, phone_number, otp, now, investor_id):
+    return await _fetchone(conn, 'verify_phone', (phone_number, otp, now, investor_id))
+
+
+async def set_otp(conn, column, value, purpose, otp, otp_expiry):
+    return await _fetchone(conn, f'set_otp_{column}', (purpose, otp, otp_expiry, value)) is not None
+
+
+async def reset_password(conn, column, value, otp, now, hashed_password):
+    return await _fetchone(conn, f'reset_password_{column}', (value, otp, now, hashed_password)) is not None
+
+
+async def otp_failure(conn, column, value, purpose, now):
+    row = await _fetchone(conn, f'otp_state_{column}', (purpose, value))
+    if not row:
+        return 'not_found'
+    expires_at = row[0]
+    if expires_at is not None and now >= expires_at:
+        return 'expired'
+    return 'invalid'
+
+
+async def purge_expired_otps(conn, now):
+    return await _execute(conn, 'purge_expired_otps', (now,))
+
+
+async def enqueue_email(conn, to_email, subject, body):
+    await _execute(conn, 'enqueue_message', queries.enqueue_params('email', to_email, subject, body))
+
+
+async def enqueue_sms(conn, phone_number, body):
+    await _execute(conn, 'enqueue_message', queries.enqueue_params('sms', phone_number, None, body))
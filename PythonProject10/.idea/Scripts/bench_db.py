@@ -0,0 +1,233 @@
+"""Database microbenchmarks against the database in .env.
+
+Each scenario runs the same work the way the routes used to do it and the
+way they do it now, from --concurrency threads for --seconds, and reports
+operations/s and latency percentiles.
+
+Scenarios:
+    pool   a login lookup on a new connection per request (get_connection(),
+           what every route did) vs on a pooled connection (db_connection())
+    otp    the success path of verify-email, resend-email-otp and
+           reset-password: SELECT, compare in Python, then UPDATE on the
+           users row's OTP columns, vs the one statement in queries.py. A
+           code that the call consumes is put back, untimed, before each
+           call, so only latency is reported. Calls share one user, so this
+           one runs at --concurrency 1.
+    prepare
+           registry statements through queries.execute() on one connection,
+           as plain statements (DATABASE_PREPARE_STATEMENTS=0, parsed and
+           planned on every call) vs PREPAREd once and EXECUTEd by name.
+           Runs at --concurrency 1, one connection each.
+
+Usage: python bench_db.py {pool,otp,prepare} [--concurrency 1,8,32 (pool only)] [--seconds 5]
+"""
+import argparse
+import datetime
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import queries
+from db import db_connection, get_connection, get_pool
+
+BENCH_EMAIL = "bench-db@example.com"
+BENCH_PHONE = "+10000000002"
+
+
+def seed_user():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE email = %s", (BENCH_EMAIL,))
+        queries.insert_user(cursor, "Bench", "User", BENCH_EMAIL, BENCH_PHONE, "not a hash", "111111", "222222",
+                            "2100-01-01", "bench")
+
+
+def cleanup():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE email = %s", (BENCH_EMAIL,))
+        cursor.execute("DELETE FROM otp_codes WHERE identifier IN (%s, %s)", (BENCH_EMAIL, BENCH_PHONE))
+
+
+def run(operation, concurrency, seconds, setup=None):
+    """Call ``operation()`` in a loop on ``concurrency`` threads; returns ops/s, p50 and p99 in ms.
+
+    ``setup()``, if given, runs untimed before each call (but within the
+    wall time that ops/s is computed from).
+    """
+    latencies = []
+    deadline = time.monotonic() + seconds
+
+    def client():
+        own = []
+        while time.monotonic() < deadline:
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            operation()
+            own.append(time.perf_counter() - start)
+        latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def _login_lookup(cursor):
+    cursor.execute(queries.STATEMENTS['login_user'], (BENCH_EMAIL,))
+    cursor.fetchone()
+
+
+def login_per_connection():
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            _login_lookup(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def login_pooled():
+    with db_connection() as conn, conn.cursor() as cursor:
+        _login_lookup(cursor)
+
+
+def _expiry():
+    return datetime.datetime.now() + datetime.timedelta(minutes=5)
+
+
+def arm_users_otp():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("UPDATE users SET email_otp = %s, email_otp_expiry = %s WHERE email = %s",
+                       ("111111", _expiry(), BENCH_EMAIL))
+
+
+def arm_otp(purpose):
+    def arm():
+        with db_connection() as conn, conn.cursor() as cursor:
+            queries.set_otp(cursor, 'email', BENCH_EMAIL, purpose, "111111", _expiry())
+    return arm
+
+
+def verify_email_two_trips():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT email_otp FROM users WHERE email = %s", (BENCH_EMAIL,))
+        if cursor.fetchone()[0] == "111111":
+            cursor.execute("UPDATE users SET email_verified = TRUE WHERE email = %s", (BENCH_EMAIL,))
+
+
+def verify_email_one_statement():
+    with db_connection() as conn, conn.cursor() as cursor:
+        assert queries.verify_email(cursor, BENCH_EMAIL, "111111", datetime.datetime.now())
+
+
+def resend_two_trips():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT email FROM users WHERE email = %s", (BENCH_EMAIL,))
+        if cursor.fetchone():
+            cursor.execute("UPDATE users SET email_otp = %s, email_otp_expiry = %s WHERE email = %s",
+                           ("222222", _expiry(), BENCH_EMAIL))
+
+
+def resend_one_statement():
+    with db_connection() as conn, conn.cursor() as cursor:
+        assert queries.set_otp(cursor, 'email', BENCH_EMAIL, queries.VERIFY_EMAIL, "222222", _expiry())
+
+
+def reset_two_trips():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT email_otp, email_otp_expiry FROM users WHERE email = %s", (BENCH_EMAIL,))
+        stored_otp, otp_expiry = cursor.fetchone()
+        if datetime.datetime.now() <= otp_expiry and stored_otp == "111111":
+            cursor.execute("UPDATE users SET password = %s WHERE email = %s", ("not a hash", BENCH_EMAIL))
+
+
+def reset_one_statement():
+    with db_connection() as conn, conn.cursor() as cursor:
+        assert queries.reset_password(cursor, 'email', BENCH_EMAIL, "111111", datetime.datetime.now(),
+                                      "not a hash")
+
+
+def _connect(prepare):
+    # get_connection() picks the connection class from this setting
+    os.environ["DATABASE_PREPARE_STATEMENTS"] = "1" if prepare else "0"
+    conn = get_connection()
+    conn.autocommit = True
+    return conn
+
+
+def prepare_cases():
+    now = datetime.datetime.now()
+    # Statements the routes run on every call that can be repeated without changing state
+    calls = [
+        ('login_user', (BENCH_EMAIL,)),
+        ('signup_conflicts', (BENCH_EMAIL, BENCH_PHONE)),
+        ('set_otp_email', (queries.VERIFY_EMAIL, "111111", _expiry(), BENCH_EMAIL)),
+        ('verify_email', (BENCH_EMAIL, "000000", now)),  # a wrong code, so nothing changes
+        ('reset_password_email', (BENCH_EMAIL, "000000", now, "not a hash")),
+        ('otp_state_email', (queries.VERIFY_EMAIL, BENCH_EMAIL)),
+    ]
+    cases = []
+    for prepare in (False, True):
+        cursor = _connect(prepare).cursor()
+        for name, params in calls:
+            def call(name=name, params=params, cursor=cursor):
+                queries.execute(cursor, name, params)
+                cursor.fetchall()
+            cases.append((f"{name}: {'prepared' if prepare else 'plain'}", call, None))
+    # Each statement plain, then prepared
+    return [case for pair in zip(cases[:len(calls)], cases[len(calls):]) for case in pair]
+
+
+# label, operation, untimed setup before each call
+SCENARIOS = {
+    'pool': lambda: [("new connection per request", login_per_connection, None),
+                     ("pooled connection", login_pooled, None)],
+    'otp': lambda: [("verify-email: two round trips", verify_email_two_trips, arm_users_otp),
+                    ("verify-email: one statement", verify_email_one_statement, arm_otp(queries.VERIFY_EMAIL)),
+                    ("resend-email: two round trips", resend_two_trips, None),
+                    ("resend-email: one statement", resend_one_statement, None),
+                    ("reset-password: two round trips", reset_two_trips, arm_users_otp),
+                    ("reset-password: one statement", reset_one_statement, arm_otp(queries.RESET_PASSWORD))],
+    'prepare': prepare_cases,
+}
+SINGLE_THREADED = ('otp', 'prepare')
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark database access patterns, before and after.")
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--concurrency', help="Comma-separated thread counts (default: 1,8,32, or 1 for "
+                                              f"{' and '.join(SINGLE_THREADED)})")
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    if args.concurrency is None:
+        args.concurrency = "1" if args.scenario in SINGLE_THREADED else "1,8,32"
+    elif args.scenario in SINGLE_THREADED and args.concurrency != "1":
+        parser.error(f"{args.scenario} runs at --concurrency 1")
+
+    seed_user()
+    try:
+        cases = SCENARIOS[args.scenario]()
+        for concurrency in (int(n) for n in args.concurrency.split(",")):
+            for label, operation, setup in cases:
+                run(operation, concurrency, 0.5, setup)  # warm the pool and the server's caches
+                rate, p50, p99 = run(operation, concurrency, args.seconds, setup)
+                throughput = "" if setup else f"{rate:7.0f} ops/s, "
+                print(f"{label:<32} c={concurrency:<3} {throughput}p50 {p50:6.2f} ms, p99 {p99:6.2f} ms")
+    finally:
+        cleanup()
+        get_pool().closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Benchmark the email backends against local stand-ins.
+
+sendgrid: a stand-in for mail/send answers after --latency seconds and
+rejects a request with 400 naming the personalization when any recipient
+address contains "invalid", as SendGrid does for a bad address, so the
+backend's narrowing of a rejected batch down to the bad address is exercised.
+
+smtp: a stand-in SMTP server that takes --connect-latency seconds to greet
+(standing in for the TCP, TLS and AUTH round trips to the real server) and
+--latency seconds to accept each message. Compares SMTPConnectionPool with a
+new connection per message, which is what send_email did before the pool.
+
+Usage: python bench_email.py [--backend sendgrid|smtp] [--messages 5000] [--latency 0.2]
+                             [--batch-sizes 1,100,1000] [--invalid 3] [--connect-latency 0.3]
+"""
+import argparse
+import asyncio
+import smtplib
+import socketserver
+import threading
+import time
+
+from aiohttp import web
+
+from mailer import SendGridBackend, SMTPConnectionPool
+
+
+def _start_stand_in(latency, stats):
+    """Serve a fake /v3/mail/send on a background thread; returns its base URL."""
+
+    async def mail_send(request):
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        stats['requests'] += 1
+        recipients = [p['to'][0]['email'] for p in payload['personalizations']]
+        errors = [{"message": "Invalid email", "field": f"personalizations.{i}.to.0.email"}
+                  for i, email in enumerate(recipients) if 'invalid' in email]
+        if errors:
+            return web.json_response({"errors": errors}, status=400)
+        stats['delivered'] += len(recipients)
+        return web.Response(status=202)
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/v3/mail/send', mail_send)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def _start_smtp_stand_in(connect_latency, latency, stats):
+    """Serve a fake SMTP server on a background thread; returns its port."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(line.encode() + b"\r\n")
+
+        def handle(self):
+            time.sleep(connect_latency)
+            stats['connections'] += 1
+            self.reply("220 stand-in ESMTP")
+            for line in self.rfile:
+                verb = line.split(b" ", 1)[0].strip().upper()
+                if verb == b"DATA":
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    for data in iter(self.rfile.readline, b".\r\n"):
+                        pass
+                    time.sleep(latency)
+                    stats['delivered'] += 1
+                    self.reply("250 OK queued")
+                elif verb == b"QUIT":
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("250 OK")
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def bench_smtp(args):
+    stats = {}
+    port = _start_smtp_stand_in(args.connect_latency, args.latency, stats)
+    messages = [("bench@example.com", f"user{i}@example.com", f"Subject: OTP\r\n\nYour OTP: {100000 + i}")
+                for i in range(args.messages)]
+
+    def per_message(batch):
+        for message in batch:
+            server = smtplib.SMTP("127.0.0.1", port, timeout=30)
+            server.sendmail(*message)
+            server.quit()
+
+    pool = SMTPConnectionPool("127.0.0.1", port, None, None, use_ssl=False)
+    for label, send in (("connection per message", per_message), ("SMTPConnectionPool", pool.send_many)):
+        stats.update(connections=0, delivered=0)
+        start = time.perf_counter()
+        send(messages)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {len(messages)} messages in {elapsed:.2f}s ({len(messages) / elapsed * 60:.0f}/min), "
+              f"{stats['connections']} connections, {stats['delivered']} delivered")
+    pool.closeall()
+
+
+def bench_sendgrid(args):
+    stats = {}
+    host = _start_stand_in(args.latency, stats)
+    messages = [(f"user{i}@example.com", "Verify Your Email - Real One Invest", f"Your OTP: {100000 + i}")
+                for i in range(args.messages)]
+    step = max(1, args.messages // (args.invalid + 1))
+    for n in range(1, args.invalid + 1):
+        messages[n * step] = (f"invalid{n}", messages[n * step][1], messages[n * step][2])
+
+    for batch_size in (int(n) for n in args.batch_sizes.split(",")):
+        stats.update(requests=0, delivered=0)
+        backend = SendGridBackend("SG.bench", "bench@example.com", host=host, batch_size=batch_size)
+        # Keep the one-at-a-time run short; it takes latency x messages
+        batch = messages if batch_size > 1 else messages[:min(len(messages), 50)]
+        start = time.perf_counter()
+        failures = backend.send_many(batch)
+        elapsed = time.perf_counter() - start
+        print(f"batch {batch_size}: {len(batch)} messages in {elapsed:.2f}s "
+              f"({len(batch) / elapsed * 60:.0f}/min), {stats['requests']} requests, "
+              f"{stats['delivered']} delivered, {len(failures)} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email backends against local stand-ins.")
+    parser.add_argument('--backend', choices=('sendgrid', 'smtp'), default='sendgrid')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.2, help="Stand-in response time in seconds")
+    parser.add_argument('--batch-sizes', default="1,100,1000")
+    parser.add_argument('--invalid', type=int, default=3, help="Invalid addresses mixed into the messages")
+    parser.add_argument('--connect-latency', type=float, default=0.3,
+                        help="SMTP stand-in's delay before its greeting, in seconds")
+    args = parser.parse_args()
+    if args.backend == 'smtp':
+        bench_smtp(args)
+    else:
+        bench_sendgrid(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark password checks per second (one login each) against core count.
+
+Runs --threads request threads for --seconds against check_password_hash,
+first inline on the threads and then through HashingService with 1, 2, 4, ...
+worker processes up to the core count. With --max-pending set low, also
+shows how many logins admission control turns away.
+
+Usage: python bench_hashing.py [--seconds 5] [--threads 32] [--max-pending 0]
+"""
+import argparse
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from hashing import HashingOverloaded, HashingService
+
+
+def _run(check, threads, seconds):
+    counts = {"ok": 0, "rejected": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        ok = rejected = 0
+        while time.perf_counter() < deadline:
+            try:
+                check()
+                ok += 1
+            except HashingOverloaded:
+                rejected += 1
+                time.sleep(0.01)
+        with lock:
+            counts["ok"] += ok
+            counts["rejected"] += rejected
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return counts["ok"] / seconds, counts["rejected"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark logins/sec against hashing worker count.")
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--max-pending', type=int, default=0, help="0 means workers x 8")
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash("correct horse battery staple")
+
+    rate, _ = _run(lambda: check_password_hash(pwhash, "correct horse battery staple"), args.threads, args.seconds)
+    print(f"inline:    {rate:.1f} logins/s")
+
+    cores = os.cpu_count() or 1
+    counts = sorted({1, cores} | {n for n in (2, 4, 8, 16, 32, 64) if n < cores})
+    for workers in counts:
+        hasher = HashingService(workers, args.max_pending or None)
+        hasher.check_password_hash(pwhash, "warm up")  # start the worker processes
+        rate, rejected = _run(lambda: hasher.check_password_hash(pwhash, "correct horse battery staple"),
+                              args.threads, args.seconds)
+        hasher.shutdown()
+        print(f"{workers:>2} workers: {rate:.1f} logins/s, {rejected} rejected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Side-by-side HTTP benchmark of the Flask app (app.py) and the ASGI app (asgi_app.py).
+
+Starts each server in turn against the database in .env, drives the same
+scenario at the same concurrency with an aiohttp client and reports
+requests/s and latency percentiles. With --server-timing the servers time
+each request's phases (server_timing.py) and the mean of each is reported too.
+
+Scenarios:
+    verify-email   wrong OTP for an existing user: one UPDATE plus one SELECT
+    resend         resend-email-otp: OTP upsert and an outbox insert
+    login          a verified user's login: one SELECT and a password check
+
+Usage: python bench_http.py [--scenario verify-email] [--concurrency 50] [--seconds 10] [--servers flask,asgi]
+                            [--server-timing]
+"""
+import argparse
+import asyncio
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+import aiohttp
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+import queries
+from db import db_connection
+from hashing import hash_method
+
+BENCH_EMAIL = "bench-user@example.com"
+BENCH_PHONE = "+10000000001"
+BENCH_PASSWORD = "bench password"
+
+SERVERS = {
+    # What `python app.py` runs, minus the debugger and reloader
+    'flask': [sys.executable, "-c", "from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'asgi': [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", "{port}",
+             "--log-level", "warning", "--no-access-log"],
+}
+
+SCENARIOS = {
+    'verify-email': ('/api/verify-email', {"email": BENCH_EMAIL, "otp": "000000"}),
+    'resend': ('/api/resend-email-otp', {"email": BENCH_EMAIL}),
+    'login': ('/api/login', {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}),
+}
+
+
+def seed_user():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE email = %s", (BENCH_EMAIL,))
+        queries.insert_user(cursor, "Bench", "User", BENCH_EMAIL, BENCH_PHONE,
+                            generate_password_hash(BENCH_PASSWORD, hash_method()), "111111", "222222",
+                            "2100-01-01", "bench")
+        cursor.execute("UPDATE users SET email_verified = TRUE, phone_verified = TRUE WHERE email = %s",
+                       (BENCH_EMAIL,))
+
+
+def cleanup():
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM users WHERE email = %s", (BENCH_EMAIL,))
+        cursor.execute("DELETE FROM otp_codes WHERE identifier IN (%s, %s)", (BENCH_EMAIL, BENCH_PHONE))
+        cursor.execute("DELETE FROM outbox WHERE recipient = %s", (BENCH_EMAIL,))
+
+
+async def _wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.post(url + SCENARIOS['verify-email'][0], json={}):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def _add_phases(phases, header):
+    # "db.verify_email;dur=1.2, hash;dur=40.0;desc=\"2x\", total;dur=45.1"
+    for entry in header.split(","):
+        name, *params = entry.strip().split(";")
+        for param in params:
+            if param.startswith("dur="):
+                phases.setdefault(name, []).append(float(param[4:]))
+
+
+async def drive(url, scenario, concurrency, seconds, timing_token=None):
+    path, body = SCENARIOS[scenario]
+    headers = {"X-Server-Timing": timing_token} if timing_token else None
+    latencies, errors, rejected, phases = [], 0, 0, {}
+    deadline = time.monotonic() + seconds
+
+    async def client(session):
+        nonlocal errors, rejected
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                async with session.post(url + path, json=body, headers=headers) as response:
+                    await response.read()
+                    if 'Server-Timing' in response.headers:
+                        _add_phases(phases, response.headers['Server-Timing'])
+                    if response.status == 503:
+                        rejected += 1  # hashing admission control
+                    elif response.status >= 500:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "rps": len(latencies) / seconds,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": errors,
+        "rejected": rejected,
+        "phases": {name: sum(values) / len(values) for name, values in phases.items()},
+    }
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark the Flask and ASGI apps side by side.")
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='verify-email')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--servers', default="flask,asgi")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server-timing', action='store_true', help="Report the servers' per-phase timings")
+    args = parser.parse_args()
+
+    timing_token = None
+    if args.server_timing:
+        timing_token = os.environ["SERVER_TIMING_TOKEN"] = secrets.token_hex(16)  # inherited by the servers
+
+    seed_user()
+    try:
+        for name in args.servers.split(","):
+            command = [part.replace("{port}", str(args.port)) for part in SERVERS[name]]
+            server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                url = f"http://127.0.0.1:{args.port}"
+                asyncio.run(_wait_until_up(url))
+                asyncio.run(drive(url, args.scenario, args.concurrency, 1))  # warm pools
+                result = asyncio.run(drive(url, args.scenario, args.concurrency, args.seconds, timing_token))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name:>5} {args.scenario}: {result['rps']:.0f} req/s, p50 {result['p50']:.1f} ms, "
+                  f"p99 {result['p99']:.1f} ms, {result['errors']} errors, {result['rejected']} rejected with 503 "
+                  f"(concurrency {args.concurrency})")
+            if result['phases']:
+                print("      mean ms: " + ", ".join(f"{name} {ms:.1f}" for name, ms in result['phases'].items()))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Users/minute of bulk_import.py against replaying signups one row at a time.
+
+Generates --rows synthetic users and loads them into the database in .env
+twice: once the way partner files used to go in, one signup per row (hash,
+insert_user, and the OTP email and SMS queued in the outbox, in one
+transaction per row, which is what /api/signup does in the database), and
+once with bulk_import.import_users(). Afterwards it deletes the users it
+created, by their exact emails, with the OTP codes and outbox messages for
+those users' email addresses and phone numbers.
+
+Password hashing dominates at werkzeug's scrypt cost; --hash-method
+pbkdf2:sha256:1000 takes it out to show what the database side can do.
+
+Usage: python bench_import.py [--rows 2000] [--hash-method pbkdf2:sha256:1000] [--batch-size 5000]
+"""
+import argparse
+import datetime
+import io
+import os
+import time
+
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash
+
+import queries
+from db import db_connection, get_pool
+from mailer import VERIFY_EMAIL_SUBJECT, otp_email_body
+from sms import otp_sms_body
+
+EMAIL_DOMAIN = "bench-import.example"
+
+
+def make_csv(rows, offset):
+    lines = ["first_name,last_name,email,phone_number,password,interested_in"]
+    lines += [f"Bench,User{i},user{i}@{EMAIL_DOMAIN},+1666{i:07d},password {i},bench"
+              for i in range(offset, offset + rows)]
+    return "\n".join(lines) + "\n"
+
+
+def signup_per_row(rows, offset, method):
+    expiry = datetime.datetime.now() + datetime.timedelta(minutes=5)
+    for i in range(offset, offset + rows):
+        email, phone = f"user{i}@{EMAIL_DOMAIN}", f"+1666{i:07d}"
+        hashed = generate_password_hash(f"password {i}", method)
+        with db_connection() as conn, conn.cursor() as cursor:
+            queries.insert_user(cursor, "Bench", f"User{i}", email, phone, hashed, "111111", "222222", expiry,
+                                "bench")
+            queries.enqueue_email(cursor, email, VERIFY_EMAIL_SUBJECT, otp_email_body("111111"))
+            queries.enqueue_sms(cursor, phone, otp_sms_body("222222"))
+
+
+def cleanup(rows):
+    emails = [f"user{i}@{EMAIL_DOMAIN}" for i in range(rows)]
+    with db_connection() as conn, conn.cursor() as cursor:
+        # Only phone numbers that belong to a benchmark user; a generated number
+        # that collided with a real user's was not imported
+        cursor.execute("DELETE FROM users WHERE email = ANY(%s) RETURNING email, phone_number", (emails,))
+        identifiers = [value for row in cursor.fetchall() for value in row]
+        cursor.execute("DELETE FROM otp_codes WHERE identifier = ANY(%s)", (identifiers,))
+        cursor.execute("DELETE FROM outbox WHERE recipient = ANY(%s)", (identifiers,))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark bulk_import against one signup per row.")
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--hash-method', help="PASSWORD_HASH_METHOD for both runs (default: the app's)")
+    parser.add_argument('--batch-size', type=int, help="IMPORT_BATCH_SIZE")
+    args = parser.parse_args()
+    if args.hash_method:
+        os.environ["PASSWORD_HASH_METHOD"] = args.hash_method
+    if args.batch_size:
+        os.environ["IMPORT_BATCH_SIZE"] = str(args.batch_size)
+
+    import bulk_import
+    from hashing import hash_method
+
+    # Both runs together use emails user0 to user{2 * rows - 1}
+    cleanup(2 * args.rows)
+    try:
+        start = time.perf_counter()
+        signup_per_row(args.rows, 0, hash_method())
+        elapsed = time.perf_counter() - start
+        print(f"one signup per row: {args.rows} users in {elapsed:.2f}s ({args.rows / elapsed * 60:,.0f}/min)")
+
+        stream = io.StringIO(make_csv(args.rows, args.rows))
+        start = time.perf_counter()
+        report = bulk_import.import_users(stream, 'csv')
+        elapsed = time.perf_counter() - start
+        print(f"bulk_import:        {report['imported']} users in {elapsed:.2f}s "
+              f"({report['imported'] / elapsed * 60:,.0f}/min), {len(report['conflicts'])} conflicts, "
+              f"{len(report['invalid'])} invalid")
+    finally:
+        cleanup(2 * args.rows)
+        get_pool().closeall()
+
+
+if __name__ == '__main__':
+    main()
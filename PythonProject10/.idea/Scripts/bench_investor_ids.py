@@ -0,0 +1,118 @@
+"""Investor ID allocation under concurrent verifications.
+
+Assigns --ids IDs from --concurrency threads, each assignment an INSERT into
+a scratch table with a UNIQUE investor_id (standing in for verify_phone's
+UPDATE of users), in two ways:
+
+    random      generate_investor_id() before migration 0006: a random
+                I1000-I9999, retried on a unique violation
+    allocator   investor_ids.allocator, blocks of numbers from investor_id_seq
+
+--existing IDs of the old scheme are inserted first, as a table part way
+to the 9,000 the old scheme can hold. The allocator takes its blocks from
+the real investor_id_seq, so the numbers it uses are skipped afterwards.
+
+Usage: python bench_investor_ids.py [--ids 2000] [--existing 0,5000] [--concurrency 1,8,32]
+"""
+import argparse
+import random
+import threading
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from db import PoolTimeout, db_connection, get_pool
+from investor_ids import allocator
+
+TABLE = "bench_investor_ids"
+MAX_TRIES = 100
+
+
+def random_investor_id():
+    return f"I{random.randint(1000, 9999)}"
+
+
+def assign(next_id, count, concurrency):
+    """Insert ``count`` IDs from ``next_id()``.
+
+    Returns (seconds, p99 ms per assignment, unique violations retried, IDs
+    that failed). An ID fails after MAX_TRIES unique violations, or when it
+    waits out the pool timeout, which verify_phone would answer with a 500.
+    """
+    remaining = iter(range(count))
+    lock = threading.Lock()
+    latencies = []
+    retried, failed = 0, 0
+
+    def client():
+        nonlocal retried, failed
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            for _ in range(MAX_TRIES):
+                # Taken before the connection, as verify_phone does
+                investor_id = next_id()
+                try:
+                    with db_connection() as conn, conn.cursor() as cursor:
+                        cursor.execute(f"INSERT INTO {TABLE} (investor_id) VALUES (%s)", (investor_id,))
+                    break
+                except psycopg2.errors.UniqueViolation:
+                    with lock:
+                        retried += 1
+                except PoolTimeout:
+                    with lock:
+                        failed += 1
+                    break
+            else:
+                with lock:
+                    failed += 1
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies[int(len(latencies) * 0.99)] * 1000, retried, failed
+
+
+def reset_table(existing):
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {TABLE}")
+        cursor.execute(f"INSERT INTO {TABLE} (investor_id) SELECT 'I' || n FROM generate_series(1000, 9999) AS n "
+                       f"ORDER BY random() LIMIT %s", (existing,))
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark investor ID allocation under concurrency.")
+    parser.add_argument('--ids', type=int, default=2000)
+    parser.add_argument('--existing', default="0,5000")
+    parser.add_argument('--concurrency', default="1,8,32")
+    args = parser.parse_args()
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (investor_id VARCHAR(10) PRIMARY KEY)")
+    try:
+        for existing in (int(n) for n in args.existing.split(",")):
+            for concurrency in (int(n) for n in args.concurrency.split(",")):
+                for label, next_id in (("random", random_investor_id), ("allocator", allocator.next_id)):
+                    reset_table(existing)
+                    elapsed, p99, retried, failed = assign(next_id, args.ids, concurrency)
+                    print(f"{label:<9} existing={existing:<5} c={concurrency:<3} "
+                          f"{args.ids / elapsed:6.0f} IDs/s, p99 {p99:6.2f} ms, "
+                          f"{retried} unique violations retried, {failed} failed")
+    finally:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        get_pool().closeall()
+
+
+if __name__ == '__main__':
+    main()
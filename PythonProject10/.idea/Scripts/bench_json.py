@@ -0,0 +1,61 @@
+"""Microbenchmark of request parsing and response encoding, per call.
+
+Compares what the views did before schemas.py (Flask's default JSON provider:
+json.loads, then a dict lookup per field; json.dumps with sorted keys for
+jsonify) with the pydantic_core path they use now (validate_json straight
+from bytes into a model; to_json).
+
+Usage: python bench_json.py [--iterations 100000]
+"""
+import argparse
+import json
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import schemas
+
+SIGNUP_BODY = json.dumps({
+    "first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "phone_number": "+15550000000",
+    "password": "correct horse battery staple", "reenter_password": "correct horse battery staple",
+    "interested_in": "bonds",
+}).encode()
+ACCESS_TOKEN = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 280
+
+
+def _per_call(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Flask's JSON against schemas.py.")
+    parser.add_argument('--iterations', type=int, default=100_000)
+    args = parser.parse_args()
+
+    flask_json = DefaultJSONProvider(Flask(__name__))
+    fields = list(schemas.SignupRequest.model_fields)
+    login = schemas.LoginResponse(message="Login successful.", access_token=ACCESS_TOKEN)
+    login_dict = login.model_dump()
+
+    def flask_parse():
+        data = flask_json.loads(SIGNUP_BODY)
+        return [data[field] for field in fields]
+
+    cases = [
+        ("signup body: Flask json.loads + lookups", flask_parse),
+        ("signup body: SignupRequest validate_json", lambda: schemas.parse(schemas.SignupRequest, SIGNUP_BODY)),
+        ("login response: Flask json.dumps", lambda: flask_json.dumps(login_dict)),
+        ("login response: to_json (dict)", lambda: schemas.dump(login_dict)),
+        ("login response: to_json (LoginResponse)", lambda: schemas.dump(login)),
+    ]
+    for label, fn in cases:
+        print(f"{label:<44} {_per_call(fn, args.iterations):6.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Per-request logging cost: print() to stdout against logging_setup's queue.
+
+stdout is a pipe drained at --drain-rate bytes/s, standing in for a terminal,
+container log driver or log shipper that cannot keep up with a burst. Each
+simulated request logs one line with its payload, as verify_email's print()
+did, around --work-ms of waiting that stands in for the database. Reports
+the time spent in the logging call on the request thread and requests/s.
+
+Usage: python bench_logging.py [--threads 1,32] [--requests 20000] [--work-ms 2] [--drain-rate 500000]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+
+def _drain(fd, rate):
+    chunk = 4096
+    while True:
+        data = os.read(fd, chunk)
+        if not data:
+            return
+        time.sleep(len(data) / rate)
+
+
+def _run(log_call, threads, requests, work):
+    per_thread = requests // threads
+    latencies = [[] for _ in range(threads)]
+
+    def client(samples):
+        payload = {"email": "ada@example.com", "otp": "123456"}
+        for _ in range(per_thread):
+            time.sleep(work)
+            start = time.perf_counter()
+            log_call(payload)
+            samples.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=client, args=(samples,)) for samples in latencies]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    samples = sorted(s for thread_samples in latencies for s in thread_samples)
+    return elapsed, sum(samples) / len(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark print() against queued structured logging.")
+    parser.add_argument('--threads', default="1,32")
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--work-ms', type=float, default=2, help="Time per request outside logging")
+    parser.add_argument('--drain-rate', type=float, default=500_000, help="Bytes per second the reader takes")
+    args = parser.parse_args()
+
+    report = sys.stderr
+    read_fd, write_fd = os.pipe()
+    threading.Thread(target=_drain, args=(read_fd, args.drain_rate), daemon=True).start()
+    # Line-buffered like a terminal, so every print() is a write() that can block on the pipe
+    sys.stdout = open(write_fd, 'w', buffering=1)
+
+    os.environ.setdefault("LOG_LEVEL", "DEBUG")
+    import logging
+    import logging_setup
+    logging_setup.configure_logging()
+    log = logging.getLogger("bench")
+
+    modes = {
+        'print': lambda payload: print(f"Request Data: {payload}"),
+        'logging': lambda payload: log.debug("verify-email request", extra={"body": payload}),
+    }
+    for threads in (int(t) for t in args.threads.split(",")):
+        for name, log_call in modes.items():
+            dropped = logging_setup.stats()["dropped"]
+            elapsed, mean, p99 = _run(log_call, threads, args.requests, args.work_ms / 1000)
+            dropped = logging_setup.stats()["dropped"] - dropped
+            print(f"{name:>7}, {threads:>2} threads: {mean:7.1f} µs mean, {p99:8.1f} µs p99 per call on the request "
+                  f"thread; {args.requests / elapsed:8.0f} requests/s; {dropped} dropped", file=report)
+            # Let the writer catch up so the next run starts with an empty pipe and queue
+            while logging_setup.stats()["queued"]:
+                time.sleep(0.05)
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Cost of recording a metric on the request thread, per call.
+
+Compares metrics.py's per-thread shards with one dict behind a lock shared
+by all threads (what a simple registry would do), for a counter increment
+and a histogram observation, at 1 and at --threads threads. Also times one
+render() of what was recorded.
+
+Usage: python bench_metrics.py [--threads 1,16] [--iterations 200000]
+"""
+import argparse
+import bisect
+import threading
+import time
+
+import metrics
+
+BUCKETS = metrics.DEFAULT_BUCKETS
+
+
+class LockedRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels):
+        with self.lock:
+            key = ('counter', labels)
+            self.values[key] = self.values.get(key, 0) + 1
+
+    def observe(self, value, *labels):
+        with self.lock:
+            key = ('histogram', labels)
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+            series[bisect.bisect_left(BUCKETS, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+
+def _per_call(fn, threads, iterations):
+    per_thread = iterations // threads
+
+    def client():
+        for _ in range(per_thread):
+            fn()
+
+    workers = [threading.Thread(target=client) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metric recording.")
+    parser.add_argument('--threads', default="1,16")
+    parser.add_argument('--iterations', type=int, default=200_000)
+    args = parser.parse_args()
+
+    locked = LockedRegistry()
+    cases = [
+        ("counter: locked dict", lambda: locked.inc("/api/login", "POST", "200")),
+        ("counter: metrics.Counter", lambda: metrics.HTTP_REQUESTS.inc("/api/login", "POST", "200")),
+        ("histogram: locked dict", lambda: locked.observe(0.004, "/api/login", "POST", "200")),
+        ("histogram: metrics.Histogram",
+         lambda: metrics.HTTP_REQUEST_SECONDS.observe(0.004, "/api/login", "POST", "200")),
+    ]
+    for threads in (int(t) for t in args.threads.split(",")):
+        for label, fn in cases:
+            print(f"{label:<30} {threads:>2} threads: {_per_call(fn, threads, args.iterations):6.0f} ns")
+
+    start = time.perf_counter()
+    metrics.render()
+    print(f"render(): {(time.perf_counter() - start) * 1e3:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""users-table write volume of OTP traffic: OTP columns on users vs otp_codes.
+
+Seeds --users users, then runs --rounds rounds of what each of them does
+around an OTP: resend the email code, resend the phone code, ask for a
+password reset code, and verify the email. It does this once with the
+statements the routes ran before migration 0005, where every step updates
+the users row, and once with queries.py, where codes live in the UNLOGGED
+otp_codes table and only the verification writes users.
+
+For each run it reports rows updated in users (and how many were HOT),
+dead tuples left in users and otp_codes, WAL generated, and how long the
+VACUUM of users then takes.
+
+It never touches the real tables: everything runs in a scratch schema with
+copies of users and otp_codes (columns, indexes and constraints), created
+with autovacuum off so the dead tuples are all still there to count, and
+dropped at the end. A run that was killed leaves the schema behind; the
+next run drops it first.
+
+Usage: python bench_otp_store.py [--users 1000] [--rounds 5]
+"""
+import argparse
+import datetime
+import time
+
+from dotenv import load_dotenv
+
+import queries
+from db import get_connection
+
+EMAIL_DOMAIN = "bench-otp.example"
+SCHEMA = "bench_otp_store"
+TABLES = ('users', 'otp_codes')
+
+
+def _identifiers(count):
+    return [(f"user{i}@{EMAIL_DOMAIN}", f"+1555{i:07d}") for i in range(count)]
+
+
+def _expiry():
+    return datetime.datetime.now() + datetime.timedelta(minutes=5)
+
+
+def otp_columns_on_users(cursor, email, phone):
+    # The routes before migration 0005, one transaction each
+    cursor.execute("SELECT email FROM users WHERE email = %s", (email,))
+    cursor.execute("UPDATE users SET email_otp = %s, email_otp_expiry = %s WHERE email = %s",
+                   ("111111", _expiry(), email))
+    cursor.connection.commit()
+    cursor.execute("SELECT phone_number FROM users WHERE phone_number = %s", (phone,))
+    cursor.execute("UPDATE users SET phone_otp = %s, phone_otp_expiry = %s WHERE phone_number = %s",
+                   ("222222", _expiry(), phone))
+    cursor.connection.commit()
+    cursor.execute("SELECT email FROM users WHERE email = %s", (email,))
+    cursor.execute("UPDATE users SET email_otp = %s, email_otp_expiry = %s WHERE email = %s",
+                   ("333333", _expiry(), email))
+    cursor.connection.commit()
+    cursor.execute("SELECT email_otp FROM users WHERE email = %s", (email,))
+    cursor.execute("UPDATE users SET email_verified = TRUE WHERE email = %s", (email,))
+    cursor.connection.commit()
+
+
+def otp_codes_table(cursor, email, phone):
+    queries.set_otp(cursor, 'email', email, queries.VERIFY_EMAIL, "111111", _expiry())
+    cursor.connection.commit()
+    queries.set_otp(cursor, 'phone_number', phone, queries.VERIFY_PHONE, "222222", _expiry())
+    cursor.connection.commit()
+    queries.set_otp(cursor, 'email', email, queries.RESET_PASSWORD, "333333", _expiry())
+    cursor.connection.commit()
+    queries.verify_email(cursor, email, "111111", datetime.datetime.now())
+    cursor.connection.commit()
+
+
+def create_schema(cursor):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.users (LIKE public.users INCLUDING ALL) "
+                   f"WITH (autovacuum_enabled = false)")
+    # The copied id default would draw from public.users_id_seq
+    cursor.execute(f"CREATE SEQUENCE {SCHEMA}.users_id_seq OWNED BY {SCHEMA}.users.id")
+    cursor.execute(f"ALTER TABLE {SCHEMA}.users ALTER COLUMN id SET DEFAULT nextval('{SCHEMA}.users_id_seq')")
+    # Storage settings as in migration 0005, which LIKE does not copy
+    cursor.execute(f"CREATE UNLOGGED TABLE {SCHEMA}.otp_codes (LIKE public.otp_codes INCLUDING ALL) "
+                   f"WITH (fillfactor = 70, autovacuum_enabled = false)")
+    # queries.py names tables unqualified, so they resolve to the copies
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+
+
+def table_stats(cursor):
+    # Counters reach pg_stat_user_tables once the backend has flushed them
+    cursor.execute("SELECT pg_stat_force_next_flush()")
+    cursor.connection.commit()
+    time.sleep(0.2)
+    cursor.execute("SELECT pg_stat_clear_snapshot()")
+    cursor.execute("SELECT relname, n_tup_upd, n_tup_hot_upd, n_dead_tup FROM pg_stat_user_tables "
+                   "WHERE schemaname = %s AND relname = ANY(%s)", (SCHEMA, list(TABLES)))
+    stats = {name: row for name, *row in cursor.fetchall()}
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    lsn = cursor.fetchone()[0]
+    cursor.connection.commit()
+    return stats, lsn
+
+
+def measure(conn, label, steps, identifiers, rounds):
+    cursor = conn.cursor()
+    before, start_lsn = table_stats(cursor)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for email, phone in identifiers:
+            steps(cursor, email, phone)
+    elapsed = time.perf_counter() - start
+    after, end_lsn = table_stats(cursor)
+    cursor.execute("SELECT pg_wal_lsn_diff(%s, %s)", (end_lsn, start_lsn))
+    wal = cursor.fetchone()[0]
+    conn.commit()
+
+    conn.autocommit = True
+    vacuum_start = time.perf_counter()
+    cursor.execute("VACUUM users")
+    vacuum = time.perf_counter() - vacuum_start
+    conn.autocommit = False
+
+    updated, hot, _ = (a - b for a, b in zip(after['users'], before['users']))
+    print(f"{label}: {elapsed:.2f}s, users: {updated} rows updated ({hot} HOT), "
+          f"{after['users'][2]} dead tuples; otp_codes: {after['otp_codes'][2]} dead tuples; "
+          f"WAL {wal / 1024 / 1024:.1f} MiB; VACUUM users {vacuum * 1000:.0f} ms")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark users-table writes from OTP traffic.")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    identifiers = _identifiers(args.users)
+    # Its own connection, so the search_path cannot leak into a pooled one
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        create_schema(cursor)
+        for email, phone in identifiers:
+            queries.insert_user(cursor, "Bench", "User", email, phone, "not a hash", "111111", "222222", _expiry(),
+                                "bench")
+        conn.commit()
+        conn.autocommit = True
+        for table in TABLES:
+            cursor.execute(f"VACUUM {table}")
+        conn.autocommit = False
+
+        measure(conn, "OTP columns on users", otp_columns_on_users, identifiers, args.rounds)
+        conn.autocommit = True
+        cursor.execute("VACUUM otp_codes")
+        conn.autocommit = False
+        measure(conn, "otp_codes table     ", otp_codes_table, identifiers, args.rounds)
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
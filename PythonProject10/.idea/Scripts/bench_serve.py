@@ -0,0 +1,85 @@
+"""Measure serve.py: memory per worker, requests/s, and errors across a reload.
+
+Starts serve.py with and without gc.freeze(), drives bench_http's
+verify-email scenario, sends SIGHUP halfway through the run, and reads each
+worker's PSS and private memory from /proc (Linux only).
+
+Usage: python bench_serve.py [--workers 4] [--threads 16] [--concurrency 50] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+import bench_http
+
+
+def _memory_kb(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields.get("Pss", 0), fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+
+
+def _workers(master_pid):
+    # Direct children only; the hashing pool's processes are the workers' children
+    output = subprocess.run(["ps", "--ppid", str(master_pid), "-o", "pid="], capture_output=True, text=True)
+    return [int(line.split()[0]) for line in output.stdout.splitlines() if line.strip()]
+
+
+def run(freeze, args):
+    command = [sys.executable, "serve.py", "--bind", f"127.0.0.1:{args.port}", "--workers", str(args.workers),
+               "--threads", str(args.threads)]
+    if not freeze:
+        command.append("--no-gc-freeze")
+    master = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://127.0.0.1:{args.port}"
+        asyncio.run(bench_http._wait_until_up(url))
+        asyncio.run(bench_http.drive(url, 'verify-email', args.concurrency, 2))  # warm every worker
+        memory = [_memory_kb(pid) for pid in _workers(master.pid)]
+
+        reload = threading.Timer(args.seconds / 2, master.send_signal, (signal.SIGHUP,))
+        reload.start()
+        result = asyncio.run(bench_http.drive(url, 'verify-email', args.concurrency, args.seconds))
+        reload.join()
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=60)
+
+    pss = sum(m[0] for m in memory) / len(memory) / 1024
+    private = sum(m[1] for m in memory) / len(memory) / 1024
+    label = "gc.freeze" if freeze else "no freeze"
+    print(f"{label:>9}: {args.workers} workers, PSS {pss:.1f} MiB and private {private:.1f} MiB per worker; "
+          f"{result['rps']:.0f} req/s, p99 {result['p99']:.1f} ms, {result['errors']} errors across a SIGHUP reload")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark serve.py memory per worker and throughput.")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    bench_http.seed_user()
+    try:
+        for freeze in (False, True):
+            run(freeze, args)
+    finally:
+        bench_http.cleanup()
+
+
+if __name__ == '__main__':
+    main()
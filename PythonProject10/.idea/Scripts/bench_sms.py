@@ -0,0 +1,116 @@
+"""Benchmark SMS sending against a local stand-in for the Twilio API.
+
+The stand-in answers Messages.json after --latency seconds, so the numbers
+show how many sends one process keeps in flight, not Twilio's own speed.
+
+    python bench_sms.py concurrency [--messages 500] [--latency 0.1] [--concurrency 100]
+        sync send_sms vs AsyncSMSSender
+    python bench_sms.py senders [--messages 200] [--rate 20] [--senders 1,2,4,8]
+        throughput of a SenderPool as senders are added; the stand-in
+        counts sends that arrived faster than --rate for their From number
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from aiohttp import web
+
+import sms
+
+
+def _start_stand_in(latency, arrivals):
+    """Serve a fake Messages endpoint on a background thread; returns its base URL.
+
+    Arrival times are appended to ``arrivals[From]``.
+    """
+    count = 0
+
+    async def create_message(request):
+        nonlocal count
+        form = await request.post()
+        arrivals.setdefault(form.get("From"), []).append(time.monotonic())
+        await asyncio.sleep(latency)
+        count += 1
+        return web.json_response({"sid": f"SM{count:032d}", "to": form.get("To"), "from": form.get("From"),
+                                  "body": form.get("Body"), "status": "queued"}, status=201)
+
+    app = web.Application()
+    app.router.add_post('/2010-04-01/Accounts/{account_sid}/Messages.json', create_message)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def bench_sync(messages):
+    start = time.perf_counter()
+    for phone_number, body in messages:
+        sms.send_sms(phone_number, body)
+    return time.perf_counter() - start
+
+
+async def bench_async(messages, concurrency, sender_pool):
+    sender = sms.AsyncSMSSender(os.environ["TWILIO_ACCOUNT_SID"], os.environ["TWILIO_AUTH_TOKEN"],
+                                sender_pool, max_concurrency=concurrency)
+    try:
+        start = time.perf_counter()
+        failures = await sender.send_many(messages)
+        elapsed = time.perf_counter() - start
+    finally:
+        await sender.close()
+    if failures:
+        raise failures[0][1]
+    return elapsed
+
+
+def _too_fast(arrivals, rate):
+    # Allow 20% jitter between the client's clock and the stand-in's
+    min_gap = 0.8 / rate
+    return sum(1 for times in arrivals.values() for a, b in zip(times, times[1:]) if b - a < min_gap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SMS sending against a local Twilio stand-in.")
+    parser.add_argument('mode', choices=('concurrency', 'senders'))
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.1, help="Stand-in response time in seconds")
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--sync-messages', type=int, default=50,
+                        help="Messages for the sync run, which takes latency x messages")
+    parser.add_argument('--rate', type=float, default=20, help="Per-sender messages per second")
+    parser.add_argument('--senders', default="1,2,4,8", help="Sender counts to compare")
+    args = parser.parse_args()
+
+    arrivals = {}
+    os.environ["TWILIO_API_BASE_URL"] = _start_stand_in(args.latency, arrivals)
+    os.environ["TWILIO_ACCOUNT_SID"] = "AC" + "0" * 32
+    os.environ["TWILIO_AUTH_TOKEN"] = "bench"
+    os.environ["TWILIO_PHONE_NUMBER"] = "+15005550006"
+    messages = [(f"+1555{i:07d}", sms.otp_sms_body(123456)) for i in range(args.messages)]
+
+    if args.mode == 'concurrency':
+        os.environ["TWILIO_SENDER_RATE"] = "1000000"
+        elapsed = bench_sync(messages[:args.sync_messages])
+        print(f"sync:  {args.sync_messages} messages in {elapsed:.2f}s ({args.sync_messages / elapsed:.0f}/s)")
+        pool = sms.SenderPool([{"from_": os.environ["TWILIO_PHONE_NUMBER"]}], rate=1_000_000)
+        elapsed = asyncio.run(bench_async(messages, args.concurrency, pool))
+        print(f"async: {args.messages} messages in {elapsed:.2f}s ({args.messages / elapsed:.0f}/s, "
+              f"concurrency {args.concurrency})")
+        return
+
+    for count in (int(n) for n in args.senders.split(",")):
+        arrivals.clear()
+        pool = sms.SenderPool([{"from_": f"+1500555{i:04d}"} for i in range(count)], rate=args.rate)
+        elapsed = asyncio.run(bench_async(messages, args.concurrency, pool))
+        print(f"{count} senders: {args.messages} messages in {elapsed:.2f}s ({args.messages / elapsed:.0f}/s, "
+              f"{_too_fast(arrivals, args.rate)} over rate)")
+
+
+if __name__ == '__main__':
+    main()
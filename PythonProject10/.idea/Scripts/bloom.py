@@ -0,0 +1,124 @@
+"""Bloom filter of registered emails and phone numbers.
+
+signup_user asks it before hashing the password: a "no" is certain as far
+as this process knows, so the signup goes ahead; a "maybe" is confirmed with
+an indexed EXISTS query and a real duplicate is rejected without paying for
+scrypt. The filter is warmed from users in the background, gets every
+signup this process makes, and is rebuilt every BLOOM_REFRESH_INTERVAL
+seconds to pick up other processes' signups and to grow with the table.
+Anything it misses just falls through to the UNIQUE constraints as before.
+
+/metrics shows how often it was asked, how many hashes it saved and how
+many "maybe"s were false positives (signup_filter{stat=...}).
+"""
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+import metrics
+import queries
+from db import db_connection
+
+log = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1000)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SignupFilter:
+    def __init__(self):
+        self._filter = None
+        self._lock = threading.Lock()
+        self._checks = 0
+        self._maybe = 0
+        self._hashes_saved = 0
+        self._false_positives = 0
+
+    @staticmethod
+    def _keys(email, phone_number):
+        return f"e:{email}", f"p:{phone_number}"
+
+    def warm(self):
+        """Build a new filter from the users table and swap it in."""
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                queries.execute(cursor, 'estimate_users')
+                estimate = int(cursor.fetchone()[0] or 0)
+            # Two keys per user, with room for the table to double before the next rebuild
+            bloom = BloomFilter(2 * estimate * 2, float(os.getenv("BLOOM_ERROR_RATE", "0.01")))
+            # Server-side cursor so a large table is streamed, not loaded at once
+            with conn.cursor(name='signup_filter_warm') as cursor:
+                cursor.itersize = 10_000
+                cursor.execute(queries.STATEMENTS['known_identifiers'])
+                for email, phone_number in cursor:
+                    for key in self._keys(email, phone_number):
+                        bloom.add(key)
+        with self._lock:
+            self._filter = bloom
+
+    def add(self, email, phone_number):
+        bloom = self._filter
+        if bloom is not None:
+            for key in self._keys(email, phone_number):
+                bloom.add(key)
+
+    def might_exist(self, email, phone_number):
+        bloom = self._filter
+        maybe = bloom is not None and any(key in bloom for key in self._keys(email, phone_number))
+        with self._lock:
+            self._checks += 1
+            self._maybe += maybe
+        return maybe
+
+    def record(self, duplicate):
+        # Outcome of the EXISTS query for a "maybe"
+        with self._lock:
+            if duplicate:
+                self._hashes_saved += 1
+            else:
+                self._false_positives += 1
+
+    def stats(self):
+        with self._lock:
+            return {"checks": self._checks, "maybe": self._maybe, "hashes_saved": self._hashes_saved,
+                    "false_positives": self._false_positives, "warm": self._filter is not None}
+
+
+signup_filter = SignupFilter()
+
+metrics.GaugeCallback("signup_filter", "Signup bloom filter checks and outcomes since start; warm is 1 once loaded.",
+                      ("stat",), lambda: {(stat,): int(value) for stat, value in signup_filter.stats().items()})
+
+
+def refresh_signup_filter():
+    interval = int(os.getenv("BLOOM_REFRESH_INTERVAL", "3600"))
+    while True:
+        try:
+            signup_filter.warm()
+        except Exception:
+            log.exception("Error warming signup filter")
+        time.sleep(interval)
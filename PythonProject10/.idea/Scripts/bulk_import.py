@@ -0,0 +1,219 @@
+"""Bulk user import from partner spreadsheets.
+
+Rows are streamed from CSV or JSON Lines, passwords are hashed in a process
+pool, and each batch is loaded with COPY into a temporary staging table and
+moved into users with a single INSERT ... ON CONFLICT DO NOTHING. Rows that
+collide with the email/phone unique constraints are reported back instead of
+failing the batch. OTP messages go into the outbox in the same statement and
+are delivered by outbox_worker.py once the batch has committed.
+
+Usage: python bulk_import.py users.csv [--format csv|jsonl] [--no-otp]
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from werkzeug.security import generate_password_hash
+
+import queries
+import schemas
+from db import db_connection
+from hashing import get_hasher, hash_method
+from mailer import VERIFY_EMAIL_SUBJECT, otp_email_body
+from sms import otp_sms_body
+
+REQUIRED_FIELDS = ('first_name', 'last_name', 'email', 'phone_number', 'password')
+
+STAGING_COLUMNS = ('row_number', 'first_name', 'last_name', 'email', 'phone_number', 'password',
+                   'email_otp', 'phone_otp', 'otp_expiry', 'interested_in', 'email_body', 'sms_body')
+
+_hash_executor = None
+_hash_executor_pid = None
+
+
+def _get_hash_executor():
+    # Not the hasher's own pool, so an import does not queue ahead of logins;
+    # spawn and HASH_WORKERS for the same reasons as there (see hashing.py).
+    global _hash_executor, _hash_executor_pid
+    if _hash_executor is None or _hash_executor_pid != os.getpid():
+        _hash_executor = ProcessPoolExecutor(max_workers=get_hasher().workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        _hash_executor_pid = os.getpid()
+    return _hash_executor
+
+
+def read_rows(stream, fmt):
+    """Yield (row_number, dict) pairs from a text stream of CSV or JSON Lines.
+
+    A JSON line that does not parse yields its ValueError in place of the
+    dict, so the rest of the file is still read.
+    """
+    if fmt == 'csv':
+        for row_number, row in enumerate(csv.DictReader(stream), 1):
+            yield row_number, row
+    elif fmt == 'jsonl':
+        for row_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield row_number, json.loads(line)
+                except ValueError as e:
+                    yield row_number, e
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _generate_otp():
+    return str(random.randint(100000, 999999))
+
+
+def _load_batch(batch, report, send_otps):
+    hashes = _get_hash_executor().map(partial(generate_password_hash, method=hash_method()),
+                                      [row.password for _, row in batch], chunksize=64)
+    # Imported users may wait behind a large outbox backlog, so their OTPs live
+    # longer than the 5 minutes given at signup.
+    now = datetime.datetime.now()
+    otp_expiry = now + datetime.timedelta(minutes=int(os.getenv("IMPORT_OTP_EXPIRY_MINUTES", "60")))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    staged = 0
+    for (row_number, row), hashed_password in zip(batch, hashes):
+        email_otp, phone_otp = _generate_otp(), _generate_otp()
+        writer.writerow((row_number, row.first_name, row.last_name, row.email, row.phone_number,
+                         hashed_password, email_otp, phone_otp, otp_expiry, row.interested_in or '',
+                         otp_email_body(email_otp), otp_sms_body(phone_otp)))
+        staged += 1
+    buffer.seek(0)
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+        CREATE TEMP TABLE import_users (
+            row_number INTEGER, first_name VARCHAR(100), last_name VARCHAR(100), email VARCHAR(100),
+            phone_number VARCHAR(20), password VARCHAR(255), email_otp VARCHAR(6), phone_otp VARCHAR(6),
+            otp_expiry TIMESTAMP, interested_in VARCHAR(50), email_body TEXT, sms_body TEXT
+        ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(f"COPY import_users ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                           buffer)
+        # Rows are unique within the batch (see import_users), so any staged
+        # email missing from the INSERT's RETURNING hit an existing user.
+        cursor.execute(f"""
+        WITH inserted AS (
+            INSERT INTO users (first_name, last_name, email, phone_number, password, email_verified, phone_verified, investor_id, interested_in)
+            SELECT first_name, last_name, email, phone_number, password, FALSE, FALSE, NULL, interested_in
+            FROM import_users
+            ON CONFLICT DO NOTHING
+            RETURNING email
+        ), otps AS (
+            INSERT INTO otp_codes (identifier, purpose, code, expires_at)
+            SELECT s.email, '{queries.VERIFY_EMAIL}', s.email_otp, s.otp_expiry
+            FROM import_users s JOIN inserted i ON i.email = s.email
+            UNION ALL
+            SELECT s.phone_number, '{queries.VERIFY_PHONE}', s.phone_otp, s.otp_expiry
+            FROM import_users s JOIN inserted i ON i.email = s.email
+            ON CONFLICT (identifier, purpose) DO UPDATE SET code = EXCLUDED.code, expires_at = EXCLUDED.expires_at
+        ), messages AS (
+            INSERT INTO outbox (channel, recipient, subject, body, available_at, created_at)
+            SELECT 'email', s.email, %(email_subject)s, s.email_body, %(now)s, %(now)s
+            FROM import_users s JOIN inserted i ON i.email = s.email
+            WHERE %(send_otps)s
+            UNION ALL
+            SELECT 'sms', s.phone_number, NULL, s.sms_body, %(now)s, %(now)s
+            FROM import_users s JOIN inserted i ON i.email = s.email
+            WHERE %(send_otps)s
+        )
+        SELECT s.row_number, s.email,
+               EXISTS (SELECT 1 FROM users u WHERE u.email = s.email),
+               EXISTS (SELECT 1 FROM users u WHERE u.phone_number = s.phone_number)
+        FROM import_users s
+        WHERE s.email NOT IN (SELECT email FROM inserted)
+        ORDER BY s.row_number
+        """, {"send_otps": send_otps, "now": now, "email_subject": VERIFY_EMAIL_SUBJECT})
+        conflicts = cursor.fetchall()
+        if send_otps:
+            cursor.execute("SELECT pg_notify('outbox', '')")
+
+    for row_number, email, email_taken, phone_taken in conflicts:
+        reasons = [name for name, taken in (('email_exists', email_taken), ('phone_exists', phone_taken)) if taken]
+        # Nothing visible means it lost a race with a concurrent signup
+        report['conflicts'].append({"row": row_number, "email": email, "reasons": reasons or ['conflict']})
+    report['imported'] += staged - len(conflicts)
+
+
+def import_users(stream, fmt='csv', send_otps=True):
+    """Import users from ``stream`` and return a report of what happened.
+
+    The report has the number of imported rows plus per-row ``conflicts``
+    (existing email/phone) and ``invalid`` rows (malformed JSON, missing
+    fields, values that are not strings or do not fit their users column, or
+    an email or phone number repeated earlier in the same file).
+    """
+    batch_size = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+    report = {"imported": 0, "conflicts": [], "invalid": []}
+    seen_emails, seen_phones = set(), set()
+    batch = []
+
+    for row_number, row in read_rows(stream, fmt):
+        if isinstance(row, ValueError):
+            report['invalid'].append({"row": row_number, "error": f"Row is not valid JSON: {row}"})
+            continue
+        if not isinstance(row, dict):
+            report['invalid'].append({"row": row_number, "error": "Row must be a JSON object"})
+            continue
+        missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+        if missing:
+            report['invalid'].append({"row": row_number, "error": f"Missing fields: {', '.join(missing)}"})
+            continue
+        # Checked here, with signup's bounds, so one bad value cannot fail the COPY of its batch
+        try:
+            row = schemas.adapter(schemas.ImportUserRow).validate_python(row)
+        except ValidationError as e:
+            report['invalid'].append({"row": row_number, "error": schemas.describe(e)})
+            continue
+        if row.email in seen_emails or row.phone_number in seen_phones:
+            report['invalid'].append({"row": row_number, "error": "Duplicate email or phone number in import"})
+            continue
+        seen_emails.add(row.email)
+        seen_phones.add(row.phone_number)
+
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            _load_batch(batch, report, send_otps)
+            batch = []
+
+    if batch:
+        _load_batch(batch, report, send_otps)
+    return report
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV or JSON Lines.")
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('--no-otp', action='store_true', help="Do not send verification OTPs")
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(args.path, newline='', encoding='utf-8') as stream:
+        report = import_users(stream, fmt, send_otps=not args.no_otp)
+
+    print(f"✅ Imported {report['imported']} users, {len(report['conflicts'])} conflicts, "
+          f"{len(report['invalid'])} invalid rows.")
+    for conflict in report['conflicts']:
+        print(f"❌ Row {conflict['row']} ({conflict['email']}): {', '.join(conflict['reasons'])}")
+    for invalid in report['invalid']:
+        print(f"❌ Row {invalid['row']}: {invalid['error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+import metrics
+import server_timing
+
+log = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ReplicaUnavailable(Exception):
+    pass
+
+
+class PreparingConnection(extensions.connection):
+    """Connection that remembers which registry statements it has PREPAREd.
+
+    See queries.execute(); prepared statements live as long as the session.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def _connection_factory():
+    # Server-side PREPARE does not work behind a transaction-pooling proxy
+    # such as PgBouncer, so it can be switched off.
+    if os.getenv("DATABASE_PREPARE_STATEMENTS", "1") == "1":
+        return PreparingConnection
+    return None
+
+
+# Database Connection
+def get_connection():
+    return psycopg2.connect(
+        dbname=os.getenv("DATABASE_NAME", "realoneinvest"),
+        user=os.getenv("DATABASE_USER", "karthik1"),
+        password=os.getenv("DATABASE_PASSWORD", "Info123tech"),
+        host=os.getenv("DATABASE_HOST", "localhost"),
+        port=os.getenv("DATABASE_PORT", "5433"),
+        connection_factory=_connection_factory()
+    )
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are checked out with ``pool.connection()``, which commits on a
+    clean exit, rolls back on an exception and always returns the connection.
+
+    Idle connections are pinged with ``SELECT 1`` on checkout once they have
+    been idle for ``ping_after`` seconds (0 pings on every checkout).
+    """
+
+    def __init__(self, connect, min_size=2, max_size=20, timeout=5.0, ping_after=10.0, name="primary"):
+        self._connect = connect
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, returned_at), most recently returned last
+        self._size = 0
+        self._closed = False
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.ping_failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+            self._size += 1
+
+    def _new_connection(self):
+        conn = self._connect()
+        self.connects += 1
+        return conn
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            self.ping_failures += 1
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    conn, returned_at = None, None
+                    self._size += 1  # reserve the slot before connecting outside the lock
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"no database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._new_connection()
+            elif not self._healthy(conn, time.monotonic() - returned_at):
+                self._close_quietly(conn)
+                conn = self._new_connection()
+        except Exception:
+            # Give the reserved slot back so waiters are not starved.
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        metrics.DB_ACQUIRE_SECONDS.observe(waited, self.name)
+        server_timing.record("db-acquire", waited)
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def putconn(self, conn):
+        status = conn.info.transaction_status if not conn.closed else None
+        if status is None or status == extensions.TRANSACTION_STATUS_UNKNOWN or self._closed:
+            self._discard(conn)
+            return
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+            with server_timing.phase("db-commit"):
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "ping_failures": self.ping_failures,
+                "wait_seconds_total": self.wait_total,
+                "wait_seconds_max": self.wait_max,
+            }
+
+
+def _pool_settings():
+    return {
+        "min_size": int(os.getenv("DATABASE_POOL_MIN", "2")),
+        "max_size": int(os.getenv("DATABASE_POOL_MAX", "20")),
+        "timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", "5")),
+        "ping_after": float(os.getenv("DATABASE_POOL_PING_AFTER", "10")),
+    }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Created lazily and per process so forked workers never share sockets.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(get_connection, **_pool_settings())
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def db_connection():
+    return get_pool().connection()
+
+
+# Read Replicas
+class Replica:
+    """A read replica from DATABASE_REPLICA_URLS with its own pool.
+
+    A replica that fails to connect is skipped for DATABASE_REPLICA_RETRY_AFTER
+    seconds. Every DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds a checkout also
+    measures replay lag, and a replica further behind than
+    DATABASE_REPLICA_MAX_LAG seconds is skipped until the next check.
+    """
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.pool = None
+        self.down_until = 0.0
+        self.lag_checked_at = 0.0
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, connection_factory=_connection_factory())
+
+    def mark_down(self, seconds, reason):
+        self.down_until = time.monotonic() + seconds
+        log.warning("Replica skipped", extra={"replica": self.dsn.split('@')[-1], "seconds": seconds, "reason": reason})
+
+    def getconn(self):
+        if self.pool is None:
+            with _pool_lock:
+                if self.pool is None:
+                    # min_size=0 so an unreachable replica fails on checkout, not here
+                    self.pool = ConnectionPool(self._connect, name=self.dsn.split('@')[-1],
+                                               **dict(_pool_settings(), min_size=0))
+        conn = self.pool.getconn()
+
+        check_interval = float(os.getenv("DATABASE_REPLICA_LAG_CHECK_INTERVAL", "5"))
+        if time.monotonic() - self.lag_checked_at < check_interval:
+            return conn
+        self.lag_checked_at = time.monotonic()
+        try:
+            with conn.cursor() as cursor:
+                # Zero when the replica has replayed everything it received, so
+                # an idle primary does not look like lag.
+                cursor.execute("""
+                SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+                """)
+                lag = float(cursor.fetchone()[0])
+            conn.rollback()
+        except psycopg2.Error:
+            self.pool.putconn(conn)
+            raise
+        max_lag = float(os.getenv("DATABASE_REPLICA_MAX_LAG", "2"))
+        if lag > max_lag:
+            self.pool.putconn(conn)
+            self.mark_down(check_interval, f"replication lag {lag:.1f}s")
+            raise ReplicaUnavailable(f"replica lag {lag:.1f}s exceeds {max_lag}s")
+        return conn
+
+
+_replicas = None
+_replicas_pid = None
+_replica_turn = itertools.count()
+_written = {}  # identifier -> monotonic time until which reads go to the primary
+_written_lock = threading.Lock()
+
+
+def get_replicas():
+    global _replicas, _replicas_pid
+    if _replicas is None or _replicas_pid != os.getpid():
+        with _pool_lock:
+            if _replicas is None or _replicas_pid != os.getpid():
+                dsns = [dsn.strip() for dsn in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if dsn.strip()]
+                _replicas = [Replica(dsn) for dsn in dsns]
+                _replicas_pid = os.getpid()
+    return _replicas
+
+
+def mark_written(*keys):
+    """Route reads for these identifiers to the primary for a short while.
+
+    Call after a write so the same user's next read sees it even if the
+    replicas have not caught up (read-your-writes within this process).
+    """
+    until = time.monotonic() + float(os.getenv("DATABASE_REPLICA_STICKY_SECONDS", "5"))
+    with _written_lock:
+        for key in keys:
+            if key:
+                _written[key] = until
+        if len(_written) > 10000:
+            now = time.monotonic()
+            for key in [k for k, v in _written.items() if v <= now]:
+                del _written[key]
+
+
+def _recently_written(key):
+    with _written_lock:
+        until = _written.get(key)
+    return until is not None and until > time.monotonic()
+
+
+def _pick_replica():
+    replicas = get_replicas()
+    now = time.monotonic()
+    for _ in range(len(replicas)):
+        replica = replicas[next(_replica_turn) % len(replicas)]
+        if replica.down_until <= now:
+            return replica
+    return None
+
+
+@contextmanager
+def read_connection(sticky_key=None):
+    """Connection for read-only queries.
+
+    Uses the replicas round-robin, and falls back to the primary when none are
+    configured or usable, or when ``sticky_key`` was written recently.
+    """
+    replica = None
+    if not (sticky_key and _recently_written(sticky_key)):
+        replica = _pick_replica()
+
+    conn = None
+    if replica is not None:
+        try:
+            conn = replica.getconn()
+        except ReplicaUnavailable:
+            pass
+        except (psycopg2.Error, PoolTimeout) as e:
+            replica.mark_down(float(os.getenv("DATABASE_REPLICA_RETRY_AFTER", "30")), e)
+
+    if conn is None:
+        with db_connection() as conn:
+            yield conn
+        return
+
+    try:
+        yield conn
+        conn.commit()
+    except psycopg2.OperationalError as e:
+        replica.mark_down(float(os.getenv("DATABASE_REPLICA_RETRY_AFTER", "30")), e)
+        raise
+    finally:
+        replica.pool.putconn(conn)
+
+
+def replicas_enabled():
+    return bool(get_replicas())
+
+
+def _pool_connections():
+    pools = []
+    if _pool is not None and _pool_pid == os.getpid():
+        pools.append(_pool)
+    if _replicas is not None and _replicas_pid == os.getpid():
+        pools.extend(replica.pool for replica in _replicas if replica.pool is not None)
+    values = {}
+    for pool in pools:
+        stats = pool.stats()
+        values[(pool.name, "idle")] = stats["idle"]
+        values[(pool.name, "in_use")] = stats["size"] - stats["idle"]
+    return values
+
+
+metrics.GaugeCallback("db_pool_connections", "Open pooled database connections.", ("pool", "state"),
+                      _pool_connections)
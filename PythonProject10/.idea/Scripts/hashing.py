@@ -0,0 +1,207 @@
+"""Password hashing off the request thread.
+
+werkzeug's scrypt takes tens of milliseconds of CPU per call. HashingService
+runs generate_password_hash / check_password_hash in a process pool sized to
+the cores, so request threads only wait on a future. At most ``max_pending``
+jobs may be queued or running; past that HashingOverloaded is raised at once
+and routes answer 503, instead of letting every login's latency grow.
+
+New hashes use PASSWORD_HASH_METHOD (a werkzeug method string such as
+"scrypt:16384:8:1" or "pbkdf2:sha256:600000"). Hashes stored under any other
+method still verify, and needs_rehash() tells login to replace them.
+
+Usage: python hashing.py calibrate [--target-ms 50] [--method scrypt|pbkdf2]
+"""
+import argparse
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+import metrics
+import server_timing
+import tracing
+
+DEFAULT_METHOD = "scrypt:32768:8:1"  # werkzeug's own default
+
+
+def _normalized(method):
+    # Spell out the parameters werkzeug fills in, as they appear in stored hashes
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return DEFAULT_METHOD
+    if name == "pbkdf2" and len(args) < 2:
+        return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def hash_method():
+    return _normalized(os.getenv("PASSWORD_HASH_METHOD", DEFAULT_METHOD))
+
+
+def needs_rehash(pwhash, method=None):
+    """True when ``pwhash`` was not made with the current hash policy."""
+    return pwhash.split("$", 1)[0] != (method or hash_method())
+
+
+class HashingOverloaded(Exception):
+    pass
+
+
+class HashingService:
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 8
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, not fork: the web process has threads and open sockets
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _done(self, future, operation, start):
+        metrics.HASH_SECONDS.observe(time.perf_counter() - start, operation)
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args)`` on the pool; raises HashingOverloaded when full."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashingOverloaded(f"{self._pending} hashing jobs pending")
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        # generate_password_hash -> "generate", check_password_hash -> "check"
+        future.add_done_callback(functools.partial(self._done, operation=fn.__name__.split('_')[0], start=start))
+        return future
+
+    # Timed for Server-Timing and tracing as the request sees it, waiting for a free worker included
+
+    def generate_password_hash(self, password, method=None):
+        with server_timing.phase("hash"), tracing.span("hash.generate"):
+            return self.submit(generate_password_hash, password, method or hash_method()).result()
+
+    def check_password_hash(self, pwhash, password):
+        with server_timing.phase("hash"), tracing.span("hash.check"):
+            return self.submit(check_password_hash, pwhash, password).result()
+
+    async def generate_password_hash_async(self, password, method=None):
+        with server_timing.phase("hash"), tracing.span("hash.generate"):
+            return await asyncio.wrap_future(self.submit(generate_password_hash, password, method or hash_method()))
+
+    async def check_password_hash_async(self, pwhash, password):
+        with server_timing.phase("hash"), tracing.span("hash.check"):
+            return await asyncio.wrap_future(self.submit(check_password_hash, pwhash, password))
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending, "pending": self._pending,
+                    "completed": self._completed, "rejected": self._rejected}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+_hasher = None
+_hasher_pid = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    # Per process, like the database pool; the worker processes are not shared across a fork.
+    global _hasher, _hasher_pid
+    if _hasher is None or _hasher_pid != os.getpid():
+        with _hasher_lock:
+            if _hasher is None or _hasher_pid != os.getpid():
+                workers = int(os.getenv("HASH_WORKERS", "0")) or None
+                max_pending = int(os.getenv("HASH_MAX_PENDING", "0")) or None
+                _hasher = HashingService(workers, max_pending)
+                _hasher_pid = os.getpid()
+    return _hasher
+
+
+def _hashing_jobs():
+    if _hasher is None or _hasher_pid != os.getpid():
+        return {}
+    stats = _hasher.stats()
+    return {("pending",): stats["pending"], ("rejected",): stats["rejected"]}
+
+
+metrics.GaugeCallback("password_hash_jobs", "Hashing jobs queued or running, and refused with 503 so far.",
+                      ("state",), _hashing_jobs)
+
+
+def _time_hash(method, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        generate_password_hash("calibration password", method)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def calibrate(target_ms, family):
+    """Return [(method, ms per hash)] tried, costliest last, within ``target_ms``."""
+    results = []
+    if family == 'scrypt':
+        # Cost doubles with n; r=8, p=1 as werkzeug uses. Memory is 128 * n * r bytes.
+        n = 2 ** 12
+        while n <= 2 ** 20:
+            method = f"scrypt:{n}:8:1"
+            ms = _time_hash(method, 3)
+            if ms > target_ms:
+                break
+            results.append((method, ms))
+            n *= 2
+    else:
+        # pbkdf2 cost is linear in iterations; measure once and scale
+        probe = 100_000
+        ms = _time_hash(f"pbkdf2:sha256:{probe}", 3)
+        iterations = int(probe * target_ms / ms) // 10_000 * 10_000
+        method = f"pbkdf2:sha256:{max(iterations, 10_000)}"
+        results.append((method, _time_hash(method, 3)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest PASSWORD_HASH_METHOD for a target hash time.")
+    parser.add_argument('command', choices=('calibrate',))
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--method', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    args = parser.parse_args()
+
+    results = calibrate(args.target_ms, args.method)
+    for method, ms in results:
+        print(f"{method}: {ms:.1f} ms per hash")
+    if not results:
+        print(f"❌ Even the cheapest {args.method} setting takes longer than {args.target_ms:.0f} ms here.")
+        raise SystemExit(1)
+    method, ms = results[-1]
+    cores = os.cpu_count() or 1
+    print(f"✅ PASSWORD_HASH_METHOD={method}  (~{1000 / ms * cores:.0f} logins/s on {cores} cores)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import threading
+
+from db import db_connection
+
+# Must match INCREMENT BY of investor_id_seq (migration 0006)
+BLOCK_SIZE = 100
+
+
+def format_investor_id(number):
+    # I + 8 digits fits the VARCHAR(10) column and leaves room for 99,999,999 IDs
+    return f"I{number:08d}"
+
+
+class InvestorIdAllocator:
+    """Hands out investor IDs from blocks reserved with a single nextval().
+
+    Each process reserves BLOCK_SIZE numbers at a time, so allocation costs one
+    round trip per block rather than per ID, and IDs never collide. Numbers
+    left in a block when the process exits are simply skipped.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._returned = []
+        self._pid = None
+
+    def _reserve_block(self):
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT nextval('investor_id_seq')")
+            start = cursor.fetchone()[0]
+        self._next, self._end = start, start + self.block_size
+        self._returned = []
+        self._pid = os.getpid()
+
+    def next_id(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not reuse its parent's block
+                self._reserve_block()
+            if self._returned:
+                return format_investor_id(self._returned.pop())
+            if self._next >= self._end:
+                self._reserve_block()
+            number = self._next
+            self._next += 1
+        return format_investor_id(number)
+
+    def release(self, investor_id):
+        """Give back an ID that was allocated but not assigned to anyone."""
+        with self._lock:
+            self._returned.append(int(investor_id[1:]))
+
+
+allocator = InvestorIdAllocator()
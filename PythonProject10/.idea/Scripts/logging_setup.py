@@ -0,0 +1,244 @@
+"""Structured logging that never blocks a request on stdout.
+
+configure_logging() adds a single queue handler to the root logger, next to
+any handler the host (or pytest's caplog) has put there already. Request
+threads (or the event loop) only copy the record onto a bounded queue; a
+background writer thread wakes every LOG_FLUSH_INTERVAL seconds, turns what
+has queued up into JSON lines and writes them to stdout in one go. When the
+queue is full, the record is dropped and counted, so the caller is never kept
+waiting on a slow terminal or log shipper.
+
+Every record gets the current request ID, which app.py and asgi_app.py bind
+per request from X-Request-ID (or a fresh one) and echo back in the response,
+and the trace ID when the request is being traced (tracing.py).
+Extra fields go in ``extra=``. Values under sensitive keys (OTPs, passwords,
+tokens) are replaced with "***", both in fields and in ``key=value`` or
+``key: value`` text inside the message.
+
+Environment:
+    LOG_LEVEL          root level (INFO)
+    LOG_LEVELS         per-logger levels, e.g. "app=DEBUG,outbox_worker=WARNING"
+    LOG_DEBUG_SAMPLE   fraction of DEBUG records kept (1.0)
+    LOG_QUEUE_SIZE     records held for the writer before dropping (10000)
+    LOG_FLUSH_INTERVAL seconds between writes (0.05)
+"""
+import atexit
+import collections
+import contextvars
+import copy
+import datetime
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import uuid
+
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+import metrics
+import tracing
+
+REDACTED = "***"
+SENSITIVE_KEYS = frozenset({
+    'otp', 'email_otp', 'phone_otp', 'reset_otp', 'password', 'new_password', 'reenter_password',
+    'hashed_password', 'access_token', 'auth_token', 'api_key',
+})
+_SENSITIVE_TEXT = re.compile(
+    r"(\b(?:%s)\b['\"]?\s*[:=]\s*)(['\"]?)[^\s,'\"}]+" % '|'.join(sorted(SENSITIVE_KEYS, key=len, reverse=True)),
+    re.IGNORECASE)
+
+# werkzeug colours its access lines for terminals
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+_writer = None
+_handler = None
+_lock = threading.Lock()
+
+
+def bind_request_id(incoming=None):
+    """Use the caller's X-Request-ID if it looks sane, else a new one; returns it."""
+    if incoming and len(incoming) <= 64 and incoming.isprintable() and ' ' not in incoming:
+        value = incoming
+    else:
+        value = uuid.uuid4().hex
+    request_id.set(value)
+    return value
+
+
+def redact(value):
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in SENSITIVE_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return _SENSITIVE_TEXT.sub(rf"\g<1>\g<2>{REDACTED}", value)
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(_ANSI_ESCAPE.sub("", record.getMessage())),
+            "pid": record.process,
+            "request_id": getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = REDACTED if key.lower() in SENSITIVE_KEYS else redact(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return to_json(entry, fallback=str).decode()
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps the request ID and samples DEBUG records, on the calling thread."""
+
+    def __init__(self, debug_sample=1.0):
+        super().__init__()
+        self.debug_sample = debug_sample
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample < 1.0 and random.random() >= self.debug_sample:
+            return False
+        record.request_id = request_id.get()
+        trace_id = tracing.current_trace_id()
+        if trace_id is not None:
+            record.trace_id = trace_id
+        return True
+
+
+class NonBlockingQueueHandler(logging.Handler):
+    """Appends records to a bounded in-memory queue for the writer thread.
+
+    The queue is a deque, so a request thread never takes a lock that the
+    writer holds or wakes the writer up; the writer drains it on a timer.
+    """
+
+    def __init__(self, max_queued=10000):
+        super().__init__()
+        self.records = collections.deque()
+        self.max_queued = max_queued
+        self.dropped = 0
+        self.wake = threading.Event()
+
+    def prepare(self, record):
+        # Only the cheap part happens on the caller's thread: fix the message
+        # text (args may be mutated later) and render any traceback while it
+        # still exists. JSON encoding and redaction are the writer's job.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        queued = len(self.records)
+        if queued >= self.max_queued:
+            self.dropped += 1
+            return
+        self.records.append(self.prepare(record))
+        if queued == self.max_queued // 2:
+            self.wake.set()  # Filling up faster than the flush interval; drain now
+
+
+class _Writer(threading.Thread):
+    def __init__(self, handler, stream, interval):
+        super().__init__(name="log-writer", daemon=True)
+        self.handler = handler
+        self.stream = stream
+        self.interval = interval
+        self.formatter = JSONFormatter()
+        self.stopping = False
+
+    def drain(self):
+        records = self.handler.records
+        lines = []
+        while records:
+            try:
+                lines.append(self.formatter.format(records.popleft()))
+            except Exception:
+                lines.append(to_json({"level": "ERROR", "logger": __name__, "msg": "Unformattable log record"}).decode())
+        if lines:
+            # One write for the whole batch
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def run(self):
+        while not self.stopping:
+            self.handler.wake.wait(self.interval)
+            self.handler.wake.clear()
+            try:
+                self.drain()
+            except Exception:
+                pass  # stdout gone (closed pipe); keep the requests going regardless
+        self.drain()
+
+    def stop(self):
+        self.stopping = True
+        self.handler.wake.set()
+        self.join()
+
+
+def _start_writer():
+    global _writer
+    _writer = _Writer(_handler, sys.stdout, float(os.getenv("LOG_FLUSH_INTERVAL", "0.05")))
+    _writer.start()
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork(); the child gets its own, and
+    # the parent's writer still owns whatever was queued before the fork
+    if _handler is not None:
+        _handler.records.clear()
+        _start_writer()
+
+
+def configure_logging():
+    """Install the queue handler on the root logger; safe to call more than once."""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        root = logging.getLogger()
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        for item in os.getenv("LOG_LEVELS", "").split(","):
+            name, _, level = item.partition("=")
+            if name.strip() and level.strip():
+                logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+        _handler = NonBlockingQueueHandler(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _handler.addFilter(RequestContextFilter(float(os.getenv("LOG_DEBUG_SAMPLE", "1.0"))))
+        _start_writer()
+        root.addHandler(_handler)
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Write out whatever is still queued."""
+    if _writer is not None and _writer.is_alive():
+        _writer.stop()
+
+
+def stats():
+    return {"dropped": _handler.dropped if _handler else 0,
+            "queued": len(_handler.records) if _handler else 0}
+
+
+metrics.GaugeCallback("log_records", "Log records waiting for the writer, and dropped because the queue was full.",
+                      ("state",), lambda: {(state,): value for state, value in stats().items()})
@@ -0,0 +1,389 @@
+import abc
+import json
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+
+import metrics
+import tracing
+
+# email.mime and sendgrid are imported by the backends that use them, so
+# importing this module for welcome_email() stays cheap.
+
+log = logging.getLogger(__name__)
+
+
+def _should_reconnect(error):
+    # Errors after which a session is thrown away and the message retried once
+    # on a fresh one: dropped connections, socket/SSL errors and timeouts, and
+    # "421 service not available". (SMTPException is itself an OSError.)
+    if isinstance(error, smtplib.SMTPServerDisconnected) or getattr(error, 'smtp_code', None) == 421:
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class _Session:
+    def __init__(self, server):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions open and reuses them across messages.
+
+    At most ``max_size`` sessions are open at once. A session idle for longer
+    than ``noop_after`` seconds is checked with NOOP before reuse, one idle for
+    longer than ``max_idle`` is closed, and one that has sent ``max_messages``
+    is retired (Gmail caps messages per connection).
+    """
+
+    def __init__(self, host, port, username, password, use_ssl=True, max_size=4, max_idle=60.0,
+                 noop_after=5.0, max_messages=100, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_idle = max_idle
+        self.noop_after = noop_after
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._context = ssl.create_default_context()
+        self._lock = threading.Lock()
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self):
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, context=self._context, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.username:
+            try:
+                server.login(self.username, self.password)
+            except BaseException:
+                server.close()
+                raise
+        return _Session(server)
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.server.quit()
+        except (smtplib.SMTPException, OSError):
+            session.server.close()
+
+    def _usable(self, session):
+        idle_for = time.monotonic() - session.last_used
+        if idle_for > self.max_idle:
+            return False
+        if idle_for < self.noop_after:
+            return True
+        try:
+            return session.server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                return self._connect()
+            if self._usable(session):
+                return session
+            self._close(session)
+
+    def _checkin(self, session):
+        session.last_used = time.monotonic()
+        if session.sent >= self.max_messages:
+            self._close(session)
+            return
+        with self._lock:
+            self._idle.append(session)
+
+    def send_many(self, messages):
+        """Send (sender, recipients, message_string) tuples over one session.
+
+        Returns [(index, error)] for the messages that could not be sent.
+        If no session can be opened, the rest of the batch fails at once
+        rather than waiting out the connect timeout once per message.
+        """
+        failures = []
+        self._slots.acquire()
+        try:
+            session = None
+            connect_error = None
+            for index, message in enumerate(messages):
+                for attempt in range(2):
+                    if session is None:
+                        try:
+                            session = self._checkout()
+                        except Exception as e:
+                            connect_error = e
+                            break
+                    try:
+                        with metrics.EMAIL_SECONDS.time("smtp"), \
+                                tracing.span("email.send", tracing.CLIENT, {"email.backend": "smtp"}):
+                            session.server.sendmail(*message)
+                        session.sent += 1
+                        if session.sent >= self.max_messages:
+                            self._close(session)
+                            session = None
+                        break
+                    except Exception as e:
+                        reconnect = _should_reconnect(e)
+                        if session is not None and reconnect:
+                            session.server.close()
+                            session = None
+                        if attempt == 1 or not reconnect:
+                            failures.append((index, e))
+                            break
+                if connect_error is not None:
+                    failures.extend((rest, connect_error) for rest in range(index, len(messages)))
+                    break
+            if session is not None:
+                self._checkin(session)
+        finally:
+            self._slots.release()
+        if failures:
+            metrics.EMAIL_ERRORS.inc("smtp", amount=len(failures))
+        return failures
+
+    def send(self, sender, recipients, message_string):
+        failures = self.send_many([(sender, recipients, message_string)])
+        if failures:
+            raise failures[0][1]
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            self._close(session)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    # Per process, like the database pool, so forked workers never share sockets.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = SMTPConnectionPool(
+                    os.getenv("SMTP_HOST", "smtp.gmail.com"),
+                    int(os.getenv("SMTP_PORT", "465")),  # SSL port for Gmail
+                    os.getenv("EMAIL_APPCODE"),  # Your Gmail email address
+                    os.getenv("APP_PASSWORD"),  # Your Google App Password
+                    use_ssl=os.getenv("SMTP_SSL", "1") == "1",
+                    max_size=int(os.getenv("SMTP_POOL_SIZE", "4")),
+                    max_idle=float(os.getenv("SMTP_MAX_IDLE", "60")),
+                    max_messages=int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", "100")),
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def build_message(sender_email, to_email, subject, body):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart()
+    message["From"] = sender_email
+    message["To"] = to_email
+    message["Subject"] = subject
+    message.attach(MIMEText(body, "plain"))
+    return message.as_string()
+
+
+class EmailBackend(abc.ABC):
+    """Delivers batches of (to_email, subject, body) messages."""
+
+    name = None
+
+    @abc.abstractmethod
+    def send_many(self, messages):
+        """Returns [(index, error)] for the messages that could not be sent."""
+
+
+class SMTPBackend(EmailBackend):
+    name = 'smtp'
+
+    def __init__(self, pool, sender_email):
+        self.pool = pool
+        self.sender_email = sender_email
+
+    def send_many(self, messages):
+        return self.pool.send_many([(self.sender_email, to_email, build_message(self.sender_email, to_email, subject, body))
+                                    for to_email, subject, body in messages])
+
+
+class SendGridBackend(EmailBackend):
+    """Sends through the SendGrid v3 mail/send API, many messages per request.
+
+    Each message is one personalization with its own subject; the body goes
+    in through a substitution so the request carries a single content block.
+    A 400 that names personalizations fails just those messages and the rest
+    are posted again; any other error fails the whole request.
+    """
+
+    name = 'sendgrid'
+    MAX_PERSONALIZATIONS = 1000  # SendGrid's limit per request
+    BODY_TAG = '-body-'
+
+    def __init__(self, api_key, sender_email, host='https://api.sendgrid.com', batch_size=MAX_PERSONALIZATIONS):
+        from sendgrid import SendGridAPIClient
+
+        self.client = SendGridAPIClient(api_key, host=host)
+        self.sender_email = sender_email
+        self.batch_size = min(batch_size, self.MAX_PERSONALIZATIONS)
+
+    def _post(self, batch):
+        request_body = {
+            "from": {"email": self.sender_email},
+            "personalizations": [{"to": [{"email": to_email}], "subject": subject,
+                                  "substitutions": {self.BODY_TAG: body}}
+                                 for to_email, subject, body in batch],
+            "content": [{"type": "text/plain", "value": self.BODY_TAG}],
+        }
+        with metrics.EMAIL_SECONDS.time(self.name), \
+                tracing.span("email.send", tracing.CLIENT, {"email.backend": self.name, "email.messages": len(batch)}):
+            self.client.client.mail.send.post(request_body=request_body)
+
+    def _try_post(self, messages, indexes):
+        """Post the messages at ``indexes``; returns the error, or None once accepted."""
+        try:
+            self._post([messages[index] for index in indexes])
+        except Exception as e:
+            return e
+        return None
+
+    @staticmethod
+    def _rejected_positions(error, count):
+        # Positions of the personalizations a 400 pins its errors on ("personalizations.3.to.0.email").
+        # Empty for any other error (sender, content, key, 429, 5xx), which fails every message alike.
+        if getattr(error, 'status_code', None) != 400:
+            return set()
+        try:
+            errors = json.loads(error.body).get("errors") or []
+        except (TypeError, ValueError, AttributeError):
+            return set()
+        positions = set()
+        for item in errors:
+            parts = str(item.get("field") or "").split(".")
+            if len(parts) > 1 and parts[0] == "personalizations" and parts[1].isdigit() and int(parts[1]) < count:
+                positions.add(int(parts[1]))
+        return positions
+
+    def _send_batch(self, messages, indexes, failures):
+        while indexes:
+            error = self._try_post(messages, indexes)
+            if error is None:
+                return
+            rejected = self._rejected_positions(error, len(indexes))
+            if not rejected or len(rejected) == len(indexes):
+                failures.extend((index, error) for index in indexes)
+                return
+            # Only the named addresses are bad: fail those and post the rest again
+            failures.extend((indexes[position], error) for position in sorted(rejected))
+            indexes = [index for position, index in enumerate(indexes) if position not in rejected]
+
+    def send_many(self, messages):
+        failures = []
+        for start in range(0, len(messages), self.batch_size):
+            self._send_batch(messages, list(range(start, min(start + self.batch_size, len(messages)))), failures)
+        if failures:
+            metrics.EMAIL_ERRORS.inc(self.name, amount=len(failures))
+        return failures
+
+
+class FallbackBackend(EmailBackend):
+    """Tries each backend in turn with whatever the previous one failed to send."""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.name = ','.join(backend.name for backend in backends)
+
+    def send_many(self, messages):
+        pending = list(range(len(messages)))
+        failures = []
+        for backend in self.backends:
+            failures = [(pending[index], e) for index, e in backend.send_many([messages[i] for i in pending])]
+            pending = [index for index, _ in failures]
+            if not pending:
+                break
+        return failures
+
+
+_backend = None
+_backend_pid = None
+# Not _pool_lock: building the smtp backend takes that one in get_smtp_pool()
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name):
+    if name == 'smtp':
+        return SMTPBackend(get_smtp_pool(), os.getenv("EMAIL_APPCODE"))
+    if name == 'sendgrid':
+        return SendGridBackend(
+            os.getenv("SENDGRID_API_KEY"),
+            os.getenv("SENDGRID_EMAIL"),
+            host=os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com"),
+            batch_size=int(os.getenv("SENDGRID_BATCH_SIZE", str(SendGridBackend.MAX_PERSONALIZATIONS))),
+        )
+    raise ValueError(f"Unknown email backend: {name}")
+
+
+def get_email_backend():
+    # EMAIL_BACKEND is a comma-separated list tried in order, e.g. "sendgrid,smtp"
+    global _backend, _backend_pid
+    if _backend is None or _backend_pid != os.getpid():
+        with _backend_lock:
+            if _backend is None or _backend_pid != os.getpid():
+                names = [n.strip() for n in os.getenv("EMAIL_BACKEND", "smtp").split(",") if n.strip()]
+                backends = [_create_backend(name) for name in names]
+                _backend = backends[0] if len(backends) == 1 else FallbackBackend(backends)
+                _backend_pid = os.getpid()
+    return _backend
+
+
+VERIFY_EMAIL_SUBJECT = "Verify Your Email - Real One Invest"
+RESET_PASSWORD_SUBJECT = "Password Reset OTP - Real One Invest"
+
+
+def otp_email_body(otp):
+    return f"Your OTP: {otp}"
+
+
+def welcome_email(investor_id):
+    """Return (subject, body) of the email sent once the phone is verified."""
+    subject = "Welcome to Real One Invest!"
+    body = f"""
+    Hello,
+
+    Welcome to Real One Invest! Your investor ID is: {investor_id}.
+
+    Thank you for joining us!
+
+    Best regards,
+    The Real Invest Team 💼
+
+    Note: This is an automated email. Please do not reply to this email.
+    """
+    return subject, body
+
+
+def send_email(to_email, subject, body):
+    # Raises on failure so the outbox worker can record the attempt
+    backend = get_email_backend()
+    failures = backend.send_many([(to_email, subject, body)])
+    if failures:
+        raise failures[0][1]
+    log.info("Email sent", extra={"to_email": to_email, "backend": backend.name})
@@ -0,0 +1,365 @@
+"""Counters, gauges and histograms served at /metrics in Prometheus text format.
+
+Recording takes no lock: every thread adds into its own shard (a dict kept
+in a threading.local), and a scrape sums the shards. Copying a dict or list
+is a single C call under the GIL, so the reader never sees one half-updated.
+When a thread exits, its shard is folded into a retired total and dropped,
+so short-lived threads (request threads, rehash threads, AnyIO's
+threadpool) do not pile up shards.
+
+With prefork workers (serve.py, uvicorn --workers) each process only sees
+its own shards. When METRICS_DIR is set, every process also writes its
+snapshot to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL seconds and
+on exit, and a scrape adds up the files of the other processes. The outbox
+worker writes there too, so its email and SMS timings show up on the web
+app's /metrics. Counters and histograms of exited processes keep counting,
+so totals never go backwards; their gauges are dropped. When a new process
+gets the PID of an exited one, the old file is first renamed to
+retired-<pid>-<ns>.json, so its totals are kept rather than overwritten.
+Other files in METRICS_DIR are ignored.
+
+/metrics shows internals (routes, statement names, pool sizes), so the
+routes answer 404 unless the request carries METRICS_TOKEN (and that is
+set) as a bearer token, e.g. Prometheus' ``authorization: {credentials: ...}``.
+"""
+import atexit
+import bisect
+import glob
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+# Seconds; from fast queries up to slow password hashes and provider calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = {}
+_callbacks = []
+_shards = []
+_retired = {}  # what exited threads recorded, summed
+_generation = 0
+_local = threading.local()
+_lock = threading.Lock()
+_flusher_started_pid = None
+_flushed_pid = None  # The process that last wrote METRICS_DIR/<pid>.json from here
+_flush_lock = threading.Lock()
+
+
+class _ThreadShard:
+    # Held only by the thread's threading.local, so it is freed when the thread exits
+    __slots__ = ('values', 'generation', '__weakref__')
+
+    def __init__(self, values, generation):
+        self.values = values
+        self.generation = generation
+
+
+def _merge(total, values):
+    for key, value in values.items():
+        current = total.get(key)
+        if current is None:
+            total[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            total[key] = [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = current + value
+
+
+def _shard():
+    # One dict per thread (and per process: a forked child starts empty)
+    shard = getattr(_local, 'shard', None)
+    if shard is not None and shard.generation == _generation:
+        return shard.values
+    values = {}
+    shard = _local.shard = _ThreadShard(values, _generation)
+    weakref.finalize(shard, _retire, values, _generation)
+    with _lock:
+        _shards.append(values)
+    return values
+
+
+def _retire(values, generation):
+    # The thread has exited. Both globals are replaced, never changed in place,
+    # so a snapshot() that already took them keeps a consistent pair.
+    global _shards, _retired
+    with _lock:
+        if generation != _generation:
+            return  # Recorded before a fork; this process never counted it
+        retired = dict(_retired)
+        _merge(retired, values)
+        _retired = retired
+        _shards = [shard for shard in _shards if shard is not values]
+
+
+def _reset_after_fork():
+    global _generation, _shards, _retired, _flusher_started_pid
+    _generation += 1
+    _shards = []
+    _retired = {}
+    _flusher_started_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        values = _shard()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    """Summed across threads and live processes, so inc() and dec() may happen on different threads."""
+
+    type = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = _shard()
+        key = (self.name, labels)
+        series = values.get(key)
+        if series is None:
+            # Per-bucket counts (not cumulative), then +Inf, sum and count
+            series = values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class GaugeCallback(_Metric):
+    """A gauge read at scrape time; ``collect()`` returns {label values tuple: value}."""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames, collect):
+        super().__init__(name, help, labelnames)
+        _callbacks.append((name, collect))
+
+
+def snapshot():
+    """This process's series as {"name\\x00label\\x00...": value or histogram list}."""
+    merged = {}
+    with _lock:
+        shards, retired = _shards, _retired
+    for values in [retired] + shards:
+        for (name, labels), value in dict(values).items():
+            key = "\x00".join((name,) + tuple(map(str, labels)))
+            if isinstance(value, list):
+                total = merged.get(key)
+                merged[key] = list(value) if total is None else [a + b for a, b in zip(total, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    for name, collect in _callbacks:
+        try:
+            for labels, value in collect().items():
+                merged["\x00".join((name,) + tuple(map(str, labels)))] = value
+        except Exception:
+            log.exception("Error collecting metric", extra={"metric": name})
+    return merged
+
+
+def _add(total, snap, include_gauges=True):
+    for key, value in snap.items():
+        metric = _registry.get(key.split("\x00", 1)[0])
+        if metric is None or (metric.type == 'gauge' and not include_gauges):
+            continue
+        current = total.get(key)
+        if current is None:
+            total[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            total[key] = [a + b for a, b in zip(current, value)]
+        else:
+            total[key] = current + value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect_all():
+    """This process's snapshot plus the other processes' files in METRICS_DIR."""
+    total = {}
+    _add(total, snapshot())
+    directory = os.getenv("METRICS_DIR")
+    if not directory:
+        return total
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        name = os.path.basename(path)[:-5]
+        if name.isdigit():
+            pid = int(name)
+            if pid == os.getpid():
+                continue
+            include_gauges = _alive(pid)
+        elif name.startswith("retired-"):
+            include_gauges = False
+        else:
+            continue  # Not ours
+        try:
+            with open(path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue  # Being replaced right now; it will be there next scrape
+        _add(total, snap, include_gauges=include_gauges)
+    return total
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def authorized(authorization):
+    """Whether an Authorization header value is ``Bearer <METRICS_TOKEN>``."""
+    expected = os.getenv("METRICS_TOKEN")
+    scheme, _, token = (authorization or "").partition(" ")
+    return (bool(expected and token) and scheme.lower() == "bearer"
+            and hmac.compare_digest(token.encode(), expected.encode()))
+
+
+def render(total=None):
+    """The Prometheus text exposition (format 0.0.4) of collect_all()."""
+    total = collect_all() if total is None else total
+    by_metric = {}
+    for key, value in total.items():
+        name, *labels = key.split("\x00")
+        by_metric.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_metric):
+        metric = _registry[name]
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, value in sorted(by_metric[name]):
+            if metric.type != 'histogram':
+                lines.append(f"{name}{_labels(metric.labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(metric.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labelnames, labels)} {value[-2]}")
+            lines.append(f"{name}_count{_labels(metric.labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR (no-op when unset)."""
+    global _flushed_pid
+    directory = os.getenv("METRICS_DIR")
+    if not directory:
+        return
+    pid = os.getpid()
+    path = os.path.join(directory, f"{pid}.json")
+    with _flush_lock:
+        if _flushed_pid != pid:
+            # A file here already is from an exited process that had this PID
+            try:
+                os.rename(path, os.path.join(directory, f"retired-{pid}-{time.time_ns()}.json"))
+            except FileNotFoundError:
+                pass
+            _flushed_pid = pid
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception:
+            log.exception("Error writing metrics snapshot")
+
+
+def start_flusher():
+    """Start writing snapshots to METRICS_DIR in the background, once per process."""
+    global _flusher_started_pid
+    if not os.getenv("METRICS_DIR") or _flusher_started_pid == os.getpid():
+        return
+    _flusher_started_pid = os.getpid()
+    interval = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+    threading.Thread(target=_flush_forever, args=(interval,), name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+
+# What the app records; the stats() of the pools are added by the modules that own them
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status.",
+                        ("route", "method", "status"))
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request latency.",
+                                 ("route", "method", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled.", ("route",))
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Time to execute a registry statement.",
+                             ("statement",))
+DB_ACQUIRE_SECONDS = Histogram("db_connection_acquire_seconds", "Time waiting for a pooled database connection.",
+                               ("pool",))
+HASH_SECONDS = Histogram("password_hash_duration_seconds",
+                         "Password hash or check, from submission to result (queueing included).",
+                         ("operation",), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+EMAIL_SECONDS = Histogram("email_send_duration_seconds", "Email provider call latency.", ("backend",))
+EMAIL_ERRORS = Counter("email_send_errors_total", "Emails the provider did not accept.", ("backend",))
+SMS_SECONDS = Histogram("sms_send_duration_seconds", "Twilio call latency.", ("provider",))
+SMS_ERRORS = Counter("sms_send_errors_total", "SMS Twilio did not accept.", ("provider",))
@@ -0,0 +1,155 @@
+"""Versioned schema migrations.
+
+Each migration is a pair of files in migrations/: NNNN_name.up.sql and
+NNNN_name.down.sql. Applied versions are recorded in schema_version.
+Migrations that use CONCURRENTLY run outside a transaction, one statement at a
+time, so index builds do not block writes. A concurrent build that fails
+leaves an INVALID index behind, which IF NOT EXISTS would then skip on the
+rerun; such an index is dropped and built again.
+
+Usage:
+    python migrate.py status
+    python migrate.py up [--to VERSION]
+    python migrate.py down [--to VERSION]   (default: undo the latest one)
+"""
+import argparse
+import os
+import re
+
+from dotenv import load_dotenv
+
+from db import get_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Arbitrary key so two deploys never migrate at the same time
+ADVISORY_LOCK_KEY = 7_200_001
+
+_FILENAME = re.compile(r"^(\d+)_(\w+)\.(up|down)\.sql$")
+_CONCURRENT_INDEX = re.compile(r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)",
+                               re.IGNORECASE)
+
+
+def load_migrations():
+    """Return [(version, name, up_sql, down_sql)] sorted by version."""
+    found = {}
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version, name, direction = int(match.group(1)), match.group(2), match.group(3)
+        with open(os.path.join(MIGRATIONS_DIR, filename), encoding='utf-8') as f:
+            found.setdefault(version, {"name": name})[direction] = f.read()
+    return [(version, m["name"], m.get("up"), m.get("down")) for version, m in sorted(found.items())]
+
+
+def _statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [statement.strip() for statement in "\n".join(lines).split(";") if statement.strip()]
+
+
+def _drop_invalid_index(cursor, statement):
+    # Left INVALID by an earlier concurrent build that failed part way
+    match = _CONCURRENT_INDEX.match(statement)
+    if not match:
+        return
+    cursor.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (match.group(1),))
+    row = cursor.fetchone()
+    if row and row[0]:
+        print(f"⚠️ Rebuilding invalid index {match.group(1)}")
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """)
+        cursor.execute("SELECT version FROM schema_version")
+        versions = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return versions
+
+
+def _run(conn, version, name, sql, direction):
+    if direction == "up":
+        record = ("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, name))
+    else:
+        record = ("DELETE FROM schema_version WHERE version = %s", (version,))
+
+    if "CONCURRENTLY" in sql.upper():
+        # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                for statement in _statements(sql):
+                    _drop_invalid_index(cursor, statement)
+                    cursor.execute(statement)
+                cursor.execute(*record)
+        finally:
+            conn.autocommit = False
+    else:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+            cursor.execute(*record)
+        conn.commit()
+    print(f"✅ {direction} {version:04d}_{name}")
+
+
+def migrate_up(conn, target=None):
+    applied = applied_versions(conn)
+    for version, name, up_sql, _ in load_migrations():
+        if target is not None and version > target:
+            break
+        if version not in applied:
+            _run(conn, version, name, up_sql, "up")
+
+
+def migrate_down(conn, target=None):
+    applied = applied_versions(conn)
+    pending = [m for m in reversed(load_migrations()) if m[0] in applied]
+    if target is None:
+        pending = pending[:1]
+    for version, name, _, down_sql in pending:
+        if target is not None and version <= target:
+            break
+        if down_sql is None:
+            raise RuntimeError(f"Migration {version:04d}_{name} has no down script")
+        _run(conn, version, name, down_sql, "down")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply or roll back schema migrations.")
+    parser.add_argument('command', choices=('status', 'up', 'down'))
+    parser.add_argument('--to', type=int, help="Target version")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        conn.commit()
+
+        if args.command == 'up':
+            migrate_up(conn, args.to)
+        elif args.command == 'down':
+            migrate_down(conn, args.to)
+        else:
+            applied = applied_versions(conn)
+            for version, name, _, _ in load_migrations():
+                state = "applied" if version in applied else "pending"
+                print(f"{version:04d}_{name}: {state}")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
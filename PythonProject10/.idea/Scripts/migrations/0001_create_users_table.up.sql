@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100) NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    phone_number VARCHAR(20) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    email_otp VARCHAR(6),
+    email_otp_expiry TIMESTAMP,
+    phone_otp VARCHAR(6),
+    phone_otp_expiry TIMESTAMP,
+    email_verified BOOLEAN DEFAULT FALSE,
+    phone_verified BOOLEAN DEFAULT FALSE,
+    investor_id VARCHAR(10) UNIQUE,
+    interested_in VARCHAR(50)
+);
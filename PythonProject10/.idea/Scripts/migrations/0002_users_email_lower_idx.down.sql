@@ -0,0 +1 @@
+DROP INDEX CONCURRENTLY IF EXISTS users_email_lower_idx;
@@ -0,0 +1,2 @@
+-- Case-insensitive email lookups
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users (lower(email));
@@ -0,0 +1 @@
+DROP INDEX CONCURRENTLY IF EXISTS users_login_covering_idx;
@@ -0,0 +1,4 @@
+-- Lets the login lookup (password, email_verified, phone_verified by email)
+-- be answered from the index alone.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_login_covering_idx
+    ON users (email) INCLUDE (password, email_verified, phone_verified);
@@ -0,0 +1,2 @@
+DROP INDEX CONCURRENTLY IF EXISTS users_phone_unverified_idx;
+DROP INDEX CONCURRENTLY IF EXISTS users_email_unverified_idx;
@@ -0,0 +1,5 @@
+-- Small indexes over the users still waiting on an OTP
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_email_unverified_idx
+    ON users (email) WHERE NOT email_verified;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_phone_unverified_idx
+    ON users (phone_number) WHERE NOT phone_verified;
@@ -0,0 +1 @@
+DROP TABLE IF EXISTS otp_codes;
@@ -0,0 +1,22 @@
+-- OTP state lives outside the wide users row so issuing, resending and
+-- consuming codes does not rewrite users. UNLOGGED: no WAL, not replicated,
+-- and emptied after a crash (users just request a new code). The lower
+-- fillfactor leaves room for HOT updates when a code is resent.
+CREATE UNLOGGED TABLE IF NOT EXISTS otp_codes (
+    identifier VARCHAR(100) NOT NULL,
+    purpose VARCHAR(20) NOT NULL,
+    code VARCHAR(6) NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (identifier, purpose)
+) WITH (fillfactor = 70);
+
+-- Carry over codes that are still outstanding
+INSERT INTO otp_codes (identifier, purpose, code, expires_at)
+SELECT email, 'verify_email', email_otp, email_otp_expiry FROM users
+WHERE email_otp IS NOT NULL AND email_otp_expiry > LOCALTIMESTAMP AND NOT email_verified
+ON CONFLICT DO NOTHING;
+
+INSERT INTO otp_codes (identifier, purpose, code, expires_at)
+SELECT phone_number, 'verify_phone', phone_otp, phone_otp_expiry FROM users
+WHERE phone_otp IS NOT NULL AND phone_otp_expiry > LOCALTIMESTAMP AND NOT phone_verified
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,4 @@
+UPDATE users SET investor_id = 'I' || ltrim(substring(investor_id FROM 2), '0')
+WHERE investor_id ~ '^I0[0-9]+$';
+
+DROP SEQUENCE IF EXISTS investor_id_seq;
@@ -0,0 +1,13 @@
+-- Investor IDs come from a sequence; INCREMENT BY is the block each worker
+-- reserves per nextval() and must match investor_ids.BLOCK_SIZE.
+CREATE SEQUENCE IF NOT EXISTS investor_id_seq START WITH 10000 INCREMENT BY 100;
+
+-- Start past every ID handed out by the old random I1000-I9999 scheme
+SELECT setval('investor_id_seq',
+              GREATEST(10000, COALESCE((SELECT MAX(substring(investor_id FROM 2)::BIGINT) FROM users
+                                        WHERE investor_id ~ '^I[0-9]+$'), 0) + 1),
+              false);
+
+-- Reformat existing IDs to the fixed-width scheme, keeping their numbers
+UPDATE users SET investor_id = 'I' || lpad(substring(investor_id FROM 2), 8, '0')
+WHERE investor_id ~ '^I[0-9]{1,7}$';
@@ -0,0 +1,18 @@
+-- Transactional outbox: routes insert messages in the same transaction as
+-- their users/otp_codes write, and outbox_worker.py delivers them.
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+    channel VARCHAR(10) NOT NULL,
+    recipient VARCHAR(100) NOT NULL,
+    subject VARCHAR(255),
+    body TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    available_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    delivered_at TIMESTAMP,
+    failed_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS outbox_pending_idx ON outbox (available_at)
+    WHERE delivered_at IS NULL AND failed_at IS NULL;
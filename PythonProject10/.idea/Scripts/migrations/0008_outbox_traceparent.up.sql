@@ -0,0 +1,3 @@
+-- W3C traceparent of the request that queued the message, so outbox_worker
+-- can record its delivery in the same trace (NULL when it was not sampled)
+ALTER TABLE outbox ADD COLUMN IF NOT EXISTS traceparent VARCHAR(55);
@@ -0,0 +1,185 @@
+"""Delivers email and SMS messages queued in the outbox table.
+
+Run one or more copies next to the web app:
+
+    python outbox_worker.py [--batch-size 50]
+
+Each worker claims a batch with FOR UPDATE SKIP LOCKED and leases it for
+OUTBOX_LEASE_SECONDS, so any number of workers can run without delivering the
+same message concurrently, and a crashed worker's batch is retried once the
+lease runs out. Failed deliveries are retried with exponential backoff until
+OUTBOX_MAX_ATTEMPTS; a message whose last attempt was lost with its worker
+is marked failed by the hourly purge. Workers sleep on LISTEN outbox between batches.
+
+SMS are paced by the sender pool in sms.py, so keep the lease longer than a
+batch takes at the configured sender rate.
+
+With tracing on, each batch is a trace of its own (the provider calls are
+its spans) and every message queued by a traced request also gets an
+outbox.deliver span in that request's trace, linked to the batch, with how
+long it waited in the outbox.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import select
+import signal
+import time
+
+from dotenv import load_dotenv
+
+import logging_setup
+import metrics
+import queries
+import tracing
+from db import db_connection, get_connection
+from mailer import get_email_backend
+from sms import get_async_sms_sender
+
+log = logging.getLogger(__name__)
+
+
+def _retry_delay(attempts):
+    base = int(os.getenv("OUTBOX_RETRY_BASE", "5"))
+    return datetime.timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def _max_attempts():
+    return int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+
+def claim_batch(batch_size):
+    now = datetime.datetime.now()
+    lease = datetime.timedelta(seconds=int(os.getenv("OUTBOX_LEASE_SECONDS", "60")))
+    with db_connection() as conn, conn.cursor() as cursor:
+        queries.execute(cursor, 'claim_messages', (now + lease, now, _max_attempts(), batch_size))
+        return cursor.fetchall()
+
+
+def deliver(rows, loop, sms_sender):
+    """Deliver claimed rows; returns {message id: exception or None}."""
+    results = {}
+
+    emails = [row for row in rows if row[1] == 'email']
+    if emails:
+        # One SendGrid request or pooled SMTP session for the whole batch
+        failures = dict(get_email_backend().send_many(
+            [(recipient, subject, body) for _, _, recipient, subject, body, *_ in emails]))
+        for index, row in enumerate(emails):
+            results[row[0]] = failures.get(index)
+
+    texts = [row for row in rows if row[1] == 'sms']
+    if texts:
+        # Sent concurrently over one aiohttp session
+        failures = dict(loop.run_until_complete(
+            sms_sender.send_many([(recipient, body) for _, _, recipient, _, body, *_ in texts])))
+        for index, row in enumerate(texts):
+            results[row[0]] = failures.get(index)
+
+    return results
+
+
+def record_results(rows, results):
+    now = datetime.datetime.now()
+    max_attempts = _max_attempts()
+    delivered = [message_id for message_id, error in results.items() if error is None]
+    with db_connection() as conn, conn.cursor() as cursor:
+        if delivered:
+            queries.execute(cursor, 'mark_delivered', (now, delivered))
+        for message_id, channel, recipient, _, _, attempts, *_ in rows:
+            error = results.get(message_id)
+            if error is None:
+                continue
+            queries.execute(cursor, 'mark_failed',
+                            (str(error)[:1000], now + _retry_delay(attempts), max_attempts, now, message_id))
+            log.warning("Delivery failed", extra={"channel": channel, "recipient": recipient, "attempt": attempts,
+                                                  "error": str(error)})
+    if delivered:
+        log.info("Delivered outbox messages", extra={"count": len(delivered)})
+
+
+def process_batch(rows, loop, sms_sender):
+    # Traced whenever one of its messages came from a traced request, so the links resolve
+    traced = [row for row in rows if row[7]]
+    with tracing.start_trace("outbox.batch", kind=tracing.CONSUMER, attributes={"outbox.messages": len(rows)},
+                             sampled=bool(traced)) as batch:
+        now = datetime.datetime.now()
+        deliveries = {
+            message_id: tracing.start_trace(
+                "outbox.deliver", traceparent, kind=tracing.CONSUMER, links=[batch],
+                attributes={"outbox.channel": channel, "outbox.attempt": attempts,
+                            "outbox.queued_seconds": (now - created_at).total_seconds()})
+            for message_id, channel, _, _, _, attempts, created_at, traceparent in traced
+        }
+        results = deliver(rows, loop, sms_sender)
+        record_results(rows, results)
+    for message_id, span in deliveries.items():
+        span.end(results.get(message_id))
+
+
+def purge_delivered():
+    now = datetime.datetime.now()
+    retention = datetime.timedelta(days=int(os.getenv("OUTBOX_RETENTION_DAYS", "7")))
+    with db_connection() as conn, conn.cursor() as cursor:
+        queries.execute(cursor, 'purge_delivered', (now - retention,))
+        queries.execute(cursor, 'fail_exhausted', (now, _max_attempts(), now))
+
+
+def run(batch_size, poll_interval):
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    listener = get_connection()
+    listener.autocommit = True
+    with listener.cursor() as cursor:
+        cursor.execute("LISTEN outbox")
+
+    loop = asyncio.new_event_loop()
+    sms_sender = get_async_sms_sender()
+
+    last_purge = 0.0
+    log.info("Outbox worker started")
+    while not stopping:
+        try:
+            rows = claim_batch(batch_size)
+            if rows:
+                process_batch(rows, loop, sms_sender)
+                continue
+            if time.monotonic() - last_purge > 3600:
+                purge_delivered()
+                last_purge = time.monotonic()
+        except Exception:
+            log.exception("Outbox worker error")
+
+        # Nothing to do: wait for a NOTIFY from a committed enqueue, or poll
+        if select.select([listener], [], [], poll_interval)[0]:
+            listener.poll()
+            listener.notifies.clear()
+
+    listener.close()
+    loop.run_until_complete(sms_sender.close())
+    loop.close()
+    log.info("Outbox worker stopped")
+
+
+def main():
+    load_dotenv()
+    logging_setup.configure_logging()
+    parser = argparse.ArgumentParser(description="Deliver queued outbox messages.")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv("OUTBOX_BATCH_SIZE", "50")))
+    parser.add_argument('--poll-interval', type=float, default=float(os.getenv("OUTBOX_POLL_INTERVAL", "5")))
+    args = parser.parse_args()
+    metrics.start_flusher()
+    run(args.batch_size, args.poll_interval)
+
+
+if __name__ == '__main__':
+    main()
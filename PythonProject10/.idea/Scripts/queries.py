@@ -0,0 +1,215 @@
+import datetime
+
+import metrics
+import server_timing
+import tracing
+
+# Columns a route may look a user up by when it accepts either an email or a phone number
+IDENTIFIER_COLUMNS = ('email', 'phone_number')
+
+# OTP purposes, each with its own row in otp_codes per identifier
+VERIFY_EMAIL = 'verify_email'
+VERIFY_PHONE = 'verify_phone'
+RESET_PASSWORD = 'reset'
+
+_UPSERT_OTP = """ON CONFLICT (identifier, purpose) DO UPDATE
+        SET code = EXCLUDED.code, expires_at = EXCLUDED.expires_at"""
+
+# Statement registry: every statement the routes issue, by name. execute()
+# PREPAREs each one once per pooled connection and then EXECUTEs it by name,
+# so Postgres skips parse/plan on every later call.
+#
+# Parameters in a SELECT list are CAST because PREPARE cannot infer their type.
+#
+# OTPs live in the UNLOGGED otp_codes table (migration 0005), so issuing or
+# resending one never rewrites the users row. Verification consumes the code
+# and updates users in one statement, and only when the code matches and has
+# not expired. The otp_state statements only run on the failure path to pick
+# the error message.
+STATEMENTS = {
+    'insert_user': f"""WITH new_user AS (
+            INSERT INTO users (first_name, last_name, email, phone_number, password, email_verified, phone_verified, investor_id, interested_in)
+            VALUES (%s, %s, %s, %s, %s, FALSE, FALSE, NULL, %s)
+            RETURNING email, phone_number
+        )
+        INSERT INTO otp_codes (identifier, purpose, code, expires_at)
+        SELECT email, '{VERIFY_EMAIL}', %s, CAST(%s AS TIMESTAMP) FROM new_user
+        UNION ALL
+        SELECT phone_number, '{VERIFY_PHONE}', %s, CAST(%s AS TIMESTAMP) FROM new_user
+        {_UPSERT_OTP}""",
+    'login_user': "SELECT password, email_verified, phone_verified FROM users WHERE email = %s",
+    # Signup pre-check (bloom.py); both columns have UNIQUE indexes
+    'signup_conflicts': """SELECT EXISTS (SELECT 1 FROM users WHERE email = %s),
+        EXISTS (SELECT 1 FROM users WHERE phone_number = %s)""",
+    'estimate_users': "SELECT CAST(reltuples AS BIGINT) FROM pg_class WHERE oid = CAST('users' AS regclass)",
+    # Run on a named (server-side) cursor, which cannot EXECUTE a prepared statement
+    'known_identifiers': "SELECT email, phone_number FROM users",
+    'verify_email': f"""WITH otp AS (
+            DELETE FROM otp_codes
+            WHERE identifier = %s AND purpose = '{VERIFY_EMAIL}' AND code = %s AND expires_at > %s
+            RETURNING identifier
+        )
+        UPDATE users SET email_verified = TRUE WHERE email = (SELECT identifier FROM otp) RETURNING email""",
+    'verify_phone': f"""WITH otp AS (
+            DELETE FROM otp_codes
+            WHERE identifier = %s AND purpose = '{VERIFY_PHONE}' AND code = %s AND expires_at > %s
+            RETURNING identifier
+        )
+        UPDATE users SET phone_verified = TRUE, investor_id = COALESCE(investor_id, %s)
+        WHERE phone_number = (SELECT identifier FROM otp) RETURNING email, investor_id""",
+    'purge_expired_otps': "DELETE FROM otp_codes WHERE expires_at <= %s",
+    # Only replaces the hash that was verified, so a concurrent reset wins
+    'rehash_password': "UPDATE users SET password = %s WHERE email = %s AND password = %s",
+    # Outbox (migration 0007). The NOTIFY is delivered on commit and wakes
+    # outbox_worker.py; claimed rows are leased until their available_at, so
+    # a crashed worker's messages are picked up again. traceparent (migration
+    # 0008) carries the request's trace over to the worker. Every outbox
+    # timestamp comes from the app's clock, like otp_codes.expires_at: the
+    # columns' LOCALTIMESTAMP defaults follow the session's timezone instead.
+    'enqueue_message': """WITH message AS (
+            INSERT INTO outbox (channel, recipient, subject, body, traceparent, available_at, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        )
+        SELECT pg_notify('outbox', '') FROM message""",
+    'claim_messages': """UPDATE outbox SET attempts = attempts + 1, available_at = %s
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE delivered_at IS NULL AND failed_at IS NULL AND available_at <= %s AND attempts < %s
+            ORDER BY available_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, channel, recipient, subject, body, attempts, created_at, traceparent""",
+    'mark_delivered': "UPDATE outbox SET delivered_at = %s, last_error = NULL WHERE id = ANY(%s)",
+    'mark_failed': """UPDATE outbox SET last_error = %s, available_at = %s,
+            failed_at = CASE WHEN attempts >= %s THEN CAST(%s AS TIMESTAMP) END
+        WHERE id = %s""",
+    'purge_delivered': "DELETE FROM outbox WHERE delivered_at < %s",
+    # A worker that died during the last attempt never got to mark_failed
+    'fail_exhausted': """UPDATE outbox SET failed_at = %s,
+            last_error = COALESCE(last_error, 'Lease expired on the last attempt')
+        WHERE delivered_at IS NULL AND failed_at IS NULL AND attempts >= %s AND available_at <= %s""",
+}
+for _column in IDENTIFIER_COLUMNS:
+    STATEMENTS[f'set_otp_{_column}'] = f"""INSERT INTO otp_codes (identifier, purpose, code, expires_at)
+        SELECT {_column}, %s, %s, CAST(%s AS TIMESTAMP) FROM users WHERE {_column} = %s
+        {_UPSERT_OTP}
+        RETURNING identifier"""
+    STATEMENTS[f'reset_password_{_column}'] = f"""WITH otp AS (
+            DELETE FROM otp_codes
+            WHERE identifier = %s AND purpose = '{RESET_PASSWORD}' AND code = %s AND expires_at > %s
+            RETURNING identifier
+        )
+        UPDATE users SET password = %s WHERE {_column} = (SELECT identifier FROM otp) RETURNING id"""
+    STATEMENTS[f'otp_state_{_column}'] = f"""SELECT o.expires_at FROM users u
+        LEFT JOIN otp_codes o ON o.identifier = u.{_column} AND o.purpose = %s
+        WHERE u.{_column} = %s"""
+
+
+def _numbered(sql):
+    # PREPARE takes $1, $2, ... where psycopg2 takes %s
+    parts = sql.split("%s")
+    return "".join(f"{part}${i}" for i, part in enumerate(parts[:-1], 1)) + parts[-1]
+
+
+def execute(cursor, name, params=()):
+    with metrics.DB_QUERY_SECONDS.time(name), server_timing.phase(f"db.{name}"), \
+            tracing.span(f"db.{name}", tracing.CLIENT, {"db.system": "postgresql"}):
+        prepared = getattr(cursor.connection, 'prepared', None)
+        if prepared is None:
+            # Plain connection (DATABASE_PREPARE_STATEMENTS=0)
+            cursor.execute(STATEMENTS[name], params)
+            return
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {_numbered(STATEMENTS[name])}")
+            prepared.add(name)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+
+def identifier_column(identifier):
+    # forgot/reset password accept either an email or a phone number
+    return 'email' if "@" in identifier else 'phone_number'
+
+
+def insert_user(cursor, first_name, last_name, email, phone_number, hashed_password,
+                email_otp, phone_otp, otp_expiry, interested_in):
+    execute(cursor, 'insert_user', (first_name, last_name, email, phone_number, hashed_password, interested_in,
+                                    email_otp, otp_expiry, phone_otp, otp_expiry))
+
+
+def signup_conflicts(cursor, email, phone_number):
+    """Return (email_taken, phone_taken)."""
+    execute(cursor, 'signup_conflicts', (email, phone_number))
+    return cursor.fetchone()
+
+
+def get_login_user(cursor, email):
+    execute(cursor, 'login_user', (email,))
+    return cursor.fetchone()
+
+
+def rehash_password(cursor, email, old_hash, new_hash):
+    execute(cursor, 'rehash_password', (new_hash, email, old_hash))
+    return cursor.rowcount == 1
+
+
+def verify_email(cursor, email, otp, now):
+    execute(cursor, 'verify_email', (email, otp, now))
+    return cursor.fetchone() is not None
+
+
+def verify_phone(cursor, phone_number, otp, now, investor_id):
+    """Mark the phone verified and assign investor_id unless one is already set.
+
+    Returns (email, investor_id) as stored, or None on failure.
+    """
+    execute(cursor, 'verify_phone', (phone_number, otp, now, investor_id))
+    return cursor.fetchone()
+
+
+def set_otp(cursor, column, value, purpose, otp, otp_expiry):
+    """Store a new OTP; returns False when no user has that identifier."""
+    execute(cursor, f'set_otp_{column}', (purpose, otp, otp_expiry, value))
+    return cursor.fetchone() is not None
+
+
+def reset_password(cursor, column, value, otp, now, hashed_password):
+    execute(cursor, f'reset_password_{column}', (value, otp, now, hashed_password))
+    return cursor.fetchone() is not None
+
+
+def otp_failure(cursor, column, value, purpose, now):
+    """Explain why a conditional OTP update matched no row.
+
+    Returns 'not_found', 'expired' or 'invalid'.
+    """
+    execute(cursor, f'otp_state_{column}', (purpose, value))
+    row = cursor.fetchone()
+    if not row:
+        return 'not_found'
+    expires_at = row[0]
+    if expires_at is not None and now >= expires_at:
+        return 'expired'
+    return 'invalid'
+
+
+def purge_expired_otps(cursor, now):
+    execute(cursor, 'purge_expired_otps', (now,))
+    return cursor.rowcount
+
+
+def enqueue_params(channel, recipient, subject, body):
+    now = datetime.datetime.now()
+    return channel, recipient, subject, body, tracing.current_traceparent(), now, now
+
+
+def enqueue_email(cursor, to_email, subject, body):
+    execute(cursor, 'enqueue_message', enqueue_params('email', to_email, subject, body))
+
+
+def enqueue_sms(cursor, phone_number, body):
+    execute(cursor, 'enqueue_message', enqueue_params('sms', phone_number, None, body))
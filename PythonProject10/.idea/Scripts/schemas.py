@@ -0,0 +1,138 @@
+"""Request and response bodies of the /api routes, shared by app.py and asgi_app.py.
+
+A request body is decoded and validated in one pass by pydantic_core, straight
+from the raw bytes, so a body that is not JSON, lacks a field or has a field of
+the wrong type is answered with 400 before the view opens a database
+connection or queues a password hash. Responses are encoded with
+pydantic_core's to_json.
+"""
+from functools import lru_cache
+from typing import Annotated, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from pydantic_core import to_json
+
+
+class Body(BaseModel):
+    # Unknown keys are ignored, as the dict lookups they replace did
+    model_config = ConfigDict(extra='ignore', frozen=True)
+
+
+# Signup fields are bounded by their users columns (0001_create_users_table)
+Name = Annotated[str, Field(max_length=100)]
+Email = Annotated[str, Field(max_length=100)]
+PhoneNumber = Annotated[str, Field(max_length=20)]
+InterestedIn = Annotated[str, Field(max_length=50)]
+
+
+class SignupRequest(Body):
+    first_name: Name
+    last_name: Name
+    email: Email
+    phone_number: PhoneNumber
+    password: str
+    reenter_password: str
+    interested_in: InterestedIn
+
+
+# One row of a bulk_import file; interested_in may be left out or empty
+class ImportUserRow(Body):
+    first_name: Name
+    last_name: Name
+    email: Email
+    phone_number: PhoneNumber
+    password: str
+    interested_in: Optional[InterestedIn] = None
+
+
+class VerifyEmailRequest(Body):
+    email: str
+    otp: str
+
+
+class VerifyPhoneRequest(Body):
+    phone_number: str
+    otp: str
+
+
+class ResendEmailOtpRequest(Body):
+    email: str
+
+
+class ResendPhoneOtpRequest(Body):
+    phone_number: str
+
+
+class LoginRequest(Body):
+    email: str
+    password: str
+
+
+class ForgotPasswordRequest(Body):
+    identifier: str  # Either an email or a phone number
+
+
+class ResetPasswordRequest(Body):
+    identifier: str  # Either an email or a phone number
+    otp: str
+    new_password: str
+
+
+class MessageResponse(Body):
+    message: str
+
+
+class VerifyPhoneResponse(Body):
+    message: str
+    investor_id: str
+
+
+class LoginResponse(Body):
+    message: str
+    access_token: str
+
+
+class ErrorResponse(Body):
+    error: str
+
+
+class InvalidRequest(ValueError):
+    """The request body was not JSON or did not match the route's model."""
+
+
+@lru_cache(maxsize=None)
+def adapter(model):
+    # Building a TypeAdapter compiles the validator; do it once per model
+    return TypeAdapter(model)
+
+
+def describe(error):
+    problems, missing = [], []
+    for item in error.errors(include_url=False):
+        field = '.'.join(str(part) for part in item['loc'])
+        if item['type'] == 'json_invalid':
+            problems.append("Request body is not valid JSON")
+        elif item['type'] in ('model_type', 'model_attributes_type'):
+            problems.append("Request body must be a JSON object")
+        elif item['type'] == 'missing':
+            missing.append(field)
+        else:
+            problems.append(f"Invalid field {field}: {item['msg']}")
+    if missing:
+        # Worded like bulk_import's report for a row
+        problems.insert(0, f"Missing fields: {', '.join(missing)}")
+    return "; ".join(problems)
+
+
+def parse(model, body):
+    """Validate the raw JSON ``body`` (bytes or str) as ``model``; raises InvalidRequest."""
+    try:
+        return adapter(model).validate_json(body)
+    except ValidationError as e:
+        raise InvalidRequest(describe(e)) from None
+
+
+def dump(obj):
+    """Encode a response model (or plain dict/list) as JSON bytes."""
+    return to_json(obj)
+
@@ -0,0 +1,245 @@
+"""Production launcher for app.py (POSIX only; it forks).
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers N] [--threads T]
+
+The master imports app once, then calls gc.freeze() so the objects built by
+the import stay out of the collector and their pages remain shared
+copy-on-write with the workers it forks. Every worker accepts on the same
+listening socket and runs requests on a bounded pool of T threads; when all
+threads are busy it stops accepting and connections wait in the kernel
+backlog. Database, SMTP and hashing pools are created lazily per process, so
+nothing is shared across the fork.
+
+Workers write their metrics to METRICS_DIR (a fresh temporary directory
+unless set), so /metrics on any worker reports the totals of all of them.
+
+Signals to the master:
+    SIGHUP           rolling restart: each worker is replaced by a fresh one,
+                     the old one finishing its in-flight requests first
+                     (the app code itself is preloaded, so code changes need a
+                     full restart)
+    SIGTERM, SIGINT  stop accepting, drain in-flight requests for up to
+                     --graceful-timeout seconds, then exit
+"""
+import argparse
+import gc
+import glob
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import logging_setup
+import metrics
+import tracing
+
+log = logging.getLogger(__name__)
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections give their thread back after this long (WEB_KEEPALIVE)
+    timeout = 5.0
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.draining:
+            self.close_connection = True
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's server with requests on a fixed-size thread pool."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self.draining = False
+        self._slots = threading.BoundedSemaphore(threads)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+        self._active = 0
+        self._idle = threading.Condition()
+
+    def process_request(self, request, client_address):
+        # Blocks the accept loop while every thread is busy
+        self._slots.acquire()
+        with self._idle:
+            self._active += 1
+        self._executor.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def drain(self, timeout):
+        """Wait for in-flight requests; returns how many were still running."""
+        self.draining = True
+        with self._idle:
+            self._idle.wait_for(lambda: self._active == 0, timeout)
+            return self._active
+
+
+def _run_worker(app_module, listener, threads, graceful_timeout):
+    gc.enable()
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    # Ctrl-C reaches the whole process group; the master decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    host, port = listener.getsockname()[:2]
+    server = PooledWSGIServer(host, port, app_module.app, threads, fd=listener.fileno())
+    # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    app_module.start_background_tasks()
+    server.serve_forever()
+    unfinished = server.drain(graceful_timeout)
+    if unfinished:
+        log.error("Worker exiting with requests unfinished", extra={"unfinished": unfinished})
+    # os._exit skips atexit, so write out the last metrics and spans and flush the log queue here
+    metrics.flush()
+    tracing.shutdown()
+    logging_setup.shutdown_logging()
+    os._exit(0)
+
+
+class Master:
+    def __init__(self, app_module, listener, workers, threads, graceful_timeout):
+        self.app_module = app_module
+        self.listener = listener
+        self.worker_count = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.workers = set()
+        self.retiring = set()
+        self._reload = False
+        self._stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(self.app_module, self.listener, self.threads, self.graceful_timeout)
+            finally:
+                os._exit(1)
+        self.workers.add(pid)
+        return pid
+
+    def _signal(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif pid in self.workers:
+                self.workers.discard(pid)
+                if not self._stopping:
+                    log.error("Worker died; starting a replacement", extra={"worker": pid, "status": status})
+                    self.spawn()
+
+    def rolling_restart(self):
+        for old in list(self.workers):
+            self.spawn()
+            self.workers.discard(old)
+            self.retiring.add(old)
+            self._signal([old], signal.SIGTERM)
+        log.info("Reloaded workers", extra={"workers": self.worker_count})
+
+    def run(self):
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_reload', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stopping', True))
+
+        for _ in range(self.worker_count):
+            self.spawn()
+        log.info("Serving", extra={"bind": "%s:%s" % self.listener.getsockname()[:2], "workers": self.worker_count,
+                                   "threads": self.threads})
+
+        while not self._stopping:
+            self._reap()
+            if self._reload:
+                self._reload = False
+                self.rolling_restart()
+            time.sleep(0.2)
+
+        self._signal(self.workers | self.retiring, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while (self.workers or self.retiring) and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.discard(pid)
+                self.retiring.discard(pid)
+            else:
+                time.sleep(0.1)
+        self._signal(self.workers | self.retiring, signal.SIGKILL)
+        log.info("Server stopped")
+
+
+def main():
+    load_dotenv()
+    logging_setup.configure_logging()
+    parser = argparse.ArgumentParser(description="Run app.py with prefork workers.")
+    parser.add_argument('--bind', default=os.getenv("WEB_BIND", "0.0.0.0:5000"))
+    parser.add_argument('--workers', type=int, default=int(os.getenv("WEB_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument('--threads', type=int, default=int(os.getenv("WEB_THREADS", "16")))
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv("WEB_GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument('--no-gc-freeze', action='store_true', help="For comparing memory per worker")
+    args = parser.parse_args()
+    _RequestHandler.timeout = float(os.getenv("WEB_KEEPALIVE", "5"))
+
+    host, _, port = args.bind.rpartition(":")
+    listener = socket.create_server((host or "0.0.0.0", int(port)), backlog=2048)
+    # Several workers select() on it; whoever loses the accept() race just goes back to waiting
+    listener.setblocking(False)
+    listener.set_inheritable(True)
+
+    # Each worker's /metrics adds up the others' snapshots from here. Files
+    # left by an earlier run would be counted too, so start from an empty dir.
+    if not os.getenv("METRICS_DIR"):
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    for path in glob.glob(os.path.join(os.environ["METRICS_DIR"], "*.json")):
+        os.remove(path)
+
+    # Every worker has its own hashing pool; share the cores between them
+    os.environ.setdefault("HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    gc.disable()
+    import app as app_module
+    if not args.no_gc_freeze:
+        gc.collect()
+        gc.freeze()
+
+    Master(app_module, listener, args.workers, args.threads, args.graceful_timeout).run()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Per-request phase timings in a Server-Timing response header.
+
+Off unless the request carries X-Server-Timing with the value of
+SERVER_TIMING_TOKEN (and that is set), so ordinary clients never see how
+long the password hash took. When on, the pool checkout, every registry
+statement by name, the commit and the password hash are timed for the
+request and returned as, e.g.:
+
+    Server-Timing: hash;dur=48.2, db-acquire;dur=0.1, db.insert_user;dur=2.5,
+                   db.enqueue_message;dur=1.1;desc="2x", db-commit;dur=0.3, total;dur=55.7
+
+A phase that ran more than once is summed, with the count in desc. Email
+and SMS are only queued in the outbox during a request, so they show up as
+db.enqueue_message; the SMTP and Twilio calls happen in outbox_worker and
+are in /metrics (email_send_duration_seconds, sms_send_duration_seconds).
+
+The timings live in a ContextVar, so they follow the request's thread in
+app.py and its task in asgi_app.py, and background work started from a
+request (rehash_password) is not counted.
+"""
+import contextvars
+import hmac
+import os
+import time
+
+REQUEST_HEADER = 'X-Server-Timing'
+
+_phases = contextvars.ContextVar('server_timing', default=None)
+
+
+def authorized(token):
+    expected = os.getenv("SERVER_TIMING_TOKEN")
+    return bool(expected and token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+def begin(token):
+    """Start timing this request if ``token`` matches; returns whether it does."""
+    phases = {} if authorized(token) else None
+    _phases.set(phases)
+    return phases is not None
+
+
+def record(name, seconds):
+    phases = _phases.get()
+    if phases is not None:
+        total, count = phases.get(name, (0.0, 0))
+        phases[name] = (total + seconds, count + 1)
+
+
+class _Phase:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+
+
+class _Untimed:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_UNTIMED = _Untimed()
+
+
+def phase(name):
+    """``with phase("hash"):`` times the block when this request is being timed."""
+    return _UNTIMED if _phases.get() is None else _Phase(name)
+
+
+def header(total=None):
+    """The Server-Timing value for this request, or None when it is not timed."""
+    phases = _phases.get()
+    if phases is None:
+        return None
+    entries = []
+    for name, (seconds, count) in phases.items():
+        entry = f"{name};dur={seconds * 1000:.1f}"
+        entries.append(entry if count == 1 else f'{entry};desc="{count}x"')
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
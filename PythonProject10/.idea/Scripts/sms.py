@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+import tracing
+
+# twilio and aiohttp are imported where a client is first built: importing
+# them costs more than the rest of app.py, and the web process never sends SMS.
+# Client in turn loads each REST domain on first attribute access, so .messages
+# only ever pulls in twilio.rest.api.
+
+log = logging.getLogger(__name__)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_twilio_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from twilio.rest import Client
+
+                # Twilio Configuration
+                client = Client(os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"))
+                _use_api_base_url(client)
+                _client = client
+    return _client
+
+
+def _use_api_base_url(client):
+    # TWILIO_API_BASE_URL points the client at a stand-in API (bench_sms.py)
+    base_url = os.getenv("TWILIO_API_BASE_URL")
+    if base_url:
+        client.api.base_url = base_url
+
+
+class _Sender:
+    """A sender number (or Messaging Service) with its own token bucket.
+
+    Tokens go negative when sends are reserved ahead of the refill, so
+    -tokens / rate is how long the sender's queue is.
+    """
+
+    def __init__(self, params, rate, burst, now):
+        self.params = params
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def backlog(self, now):
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def reserve(self, now):
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class SenderPool:
+    """Spreads SMS over several sender numbers, each held to ``rate`` per second.
+
+    A new recipient gets the sender with the shortest queue; later messages
+    to the same recipient reuse it, so a user keeps seeing one number. The
+    limits are per process: divide the carrier's rate across worker
+    processes. ``clock`` is for tests.
+    """
+
+    def __init__(self, senders, rate=1.0, burst=1, max_sticky=100_000, clock=time.monotonic):
+        if not senders:
+            raise ValueError("SenderPool needs at least one sender")
+        self._clock = clock
+        self._senders = [_Sender(params, rate, burst, clock()) for params in senders]
+        self._sticky = OrderedDict()
+        self._max_sticky = max_sticky
+        self._lock = threading.Lock()
+
+    def reserve(self, phone_number):
+        """Pick a sender for ``phone_number``.
+
+        Returns (create() keyword arguments, seconds to wait before sending).
+        """
+        with self._lock:
+            now = self._clock()
+            sender = self._sticky.get(phone_number)
+            if sender is None:
+                sender = min(self._senders, key=lambda s: s.backlog(now))
+                self._sticky[phone_number] = sender
+                if len(self._sticky) > self._max_sticky:
+                    self._sticky.popitem(last=False)
+            else:
+                self._sticky.move_to_end(phone_number)
+            return sender.params, sender.reserve(now)
+
+
+_sender_pool = None
+_sender_pool_pid = None
+
+
+def get_sender_pool():
+    global _sender_pool, _sender_pool_pid
+    if _sender_pool is None or _sender_pool_pid != os.getpid():
+        with _client_lock:
+            if _sender_pool is None or _sender_pool_pid != os.getpid():
+                service_sid = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
+                if service_sid:
+                    # Twilio picks the number within the service; we only cap the total rate
+                    senders = [{"messaging_service_sid": service_sid}]
+                    rate = float(os.getenv("TWILIO_MESSAGING_SERVICE_RATE", "10"))
+                else:
+                    numbers = os.getenv("TWILIO_PHONE_NUMBERS") or os.getenv("TWILIO_PHONE_NUMBER", "")
+                    senders = [{"from_": n.strip()} for n in numbers.split(",") if n.strip()]
+                    rate = float(os.getenv("TWILIO_SENDER_RATE", "1"))
+                _sender_pool = SenderPool(senders, rate=rate, burst=int(os.getenv("TWILIO_SENDER_BURST", "1")))
+                _sender_pool_pid = os.getpid()
+    return _sender_pool
+
+
+def otp_sms_body(otp):
+    return f"Your OTP for phone verification is: {otp}"
+
+
+@contextmanager
+def _twilio_call():
+    # Time spent in Twilio's API only, after any rate-limit wait
+    start = time.perf_counter()
+    try:
+        with tracing.span("sms.send", tracing.CLIENT, {"sms.provider": "twilio"}):
+            yield
+    except Exception:
+        metrics.SMS_ERRORS.inc("twilio")
+        raise
+    finally:
+        metrics.SMS_SECONDS.observe(time.perf_counter() - start, "twilio")
+
+
+def send_sms(phone_number, body):
+    sender, delay = get_sender_pool().reserve(phone_number)
+    if delay:
+        time.sleep(delay)
+    with _twilio_call():
+        message = get_twilio_client().messages.create(
+            body=body,
+            to=phone_number,
+            **sender
+        )
+    log.info("SMS sent", extra={"phone_number": phone_number, "sid": message.sid})
+    return message.sid
+
+
+class AsyncSMSSender:
+    """Sends SMS with create_async over one shared aiohttp session.
+
+    Each message waits for its sender's token bucket in ``sender_pool``, then
+    at most ``max_concurrency`` requests are in flight at once. Without a
+    ``sender_pool`` the process-wide one is looked up on the first send, so a
+    worker with no sender configured still starts and only its SMS fail. The
+    session is opened on first use, inside the event loop that will run the
+    sends, and must be closed with close() from that same loop.
+    """
+
+    def __init__(self, account_sid, auth_token, sender_pool=None, max_concurrency=100, timeout=30.0):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.sender_pool = sender_pool
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._client = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def _get_client(self):
+        if self._client is None:
+            from aiohttp import ClientSession, TCPConnector
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+            from twilio.rest import Client
+
+            http_client = AsyncTwilioHttpClient(pool_connections=False, timeout=self.timeout)
+            # aiohttp's default connector allows 100 connections per session
+            http_client.session = ClientSession(connector=TCPConnector(limit=self.max_concurrency))
+            client = Client(self.account_sid, self.auth_token, http_client=http_client)
+            _use_api_base_url(client)
+            self._client = client
+        return self._client
+
+    async def send(self, phone_number, body):
+        if self.sender_pool is None:
+            self.sender_pool = get_sender_pool()
+        sender, delay = self.sender_pool.reserve(phone_number)
+        if delay:
+            await asyncio.sleep(delay)
+        async with self._slots:
+            with _twilio_call():
+                message = await self._get_client().messages.create_async(
+                    body=body,
+                    to=phone_number,
+                    **sender
+                )
+        return message.sid
+
+    async def send_many(self, messages):
+        """Send (phone_number, body) pairs concurrently.
+
+        Returns [(index, error)] for the messages that could not be sent.
+        """
+        results = await asyncio.gather(*(self.send(phone_number, body) for phone_number, body in messages),
+                                       return_exceptions=True)
+        return [(index, result) for index, result in enumerate(results) if isinstance(result, Exception)]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.http_client.close()
+            self._client = None
+
+
+def get_async_sms_sender():
+    # One per event loop; the caller owns it and closes it.
+    return AsyncSMSSender(
+        os.getenv("TWILIO_ACCOUNT_SID"),
+        os.getenv("TWILIO_AUTH_TOKEN"),
+        max_concurrency=int(os.getenv("TWILIO_SMS_CONCURRENCY", "100")),
+    )
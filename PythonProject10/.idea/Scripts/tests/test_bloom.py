@@ -0,0 +1,62 @@
+import math
+
+import pytest
+
+import bloom
+
+KEYS = [f"e:user{i}@example.com" for i in range(10_000)]
+OTHERS = [f"e:other{i}@example.com" for i in range(10_000)]
+
+
+@pytest.mark.parametrize("capacity, error_rate, size, hashes", [
+    (10_000, 0.01, 95_851, 7),
+    (10_000, 0.001, 143_776, 10),
+    (10, 0.01, 9_586, 7),  # Never sized below 1,000 items
+])
+def test_sized_from_capacity_and_error_rate(capacity, error_rate, size, hashes):
+    bloom_filter = bloom.BloomFilter(capacity, error_rate)
+    assert (bloom_filter.size, bloom_filter.hashes) == (size, hashes)
+    assert len(bloom_filter._bits) == math.ceil(size / 8)
+
+
+def test_no_false_negatives_and_false_positives_near_the_error_rate():
+    bloom_filter = bloom.BloomFilter(len(KEYS), 0.01)
+    for key in KEYS:
+        bloom_filter.add(key)
+    assert all(key in bloom_filter for key in KEYS)
+    # blake2b is unkeyed, so this count is the same on every run
+    false_positives = sum(key in bloom_filter for key in OTHERS)
+    assert false_positives < len(OTHERS) * 0.02
+
+
+def _signup_filter(*emails):
+    # What warm() swaps in, without a database
+    signup_filter = bloom.SignupFilter()
+    signup_filter._filter = bloom.BloomFilter(1000)
+    for email in emails:
+        signup_filter.add(email, "+15550100")
+    return signup_filter
+
+
+def test_cold_filter_says_no_and_ignores_adds():
+    signup_filter = bloom.SignupFilter()
+    signup_filter.add("ada@example.com", "+15550100")
+    assert not signup_filter.might_exist("ada@example.com", "+15550100")
+    assert signup_filter.stats()["warm"] is False
+
+
+def test_signup_after_warm_up_is_seen_by_email_or_phone():
+    signup_filter = _signup_filter()
+    assert not signup_filter.might_exist("ada@example.com", "+15559999")
+    signup_filter.add("ada@example.com", "+15550100")
+    assert signup_filter.might_exist("ada@example.com", "+15559999")
+    assert signup_filter.might_exist("grace@example.com", "+15550100")
+
+
+def test_stats_count_checks_and_outcomes():
+    signup_filter = _signup_filter("ada@example.com")
+    signup_filter.might_exist("ada@example.com", "+15550100")
+    signup_filter.record(True)
+    signup_filter.might_exist("grace@example.com", "+15559999")
+    assert signup_filter.stats() == {"checks": 2, "maybe": 1, "hashes_saved": 1, "false_positives": 0,
+                                     "warm": True}
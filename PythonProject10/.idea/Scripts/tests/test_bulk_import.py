@@ -0,0 +1,48 @@
+import io
+import json
+
+import pytest
+
+import bulk_import
+
+VALID = {"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "phone_number": "+15550100",
+         "password": "secret"}
+
+
+@pytest.mark.parametrize("change, error", [
+    ({"phone_number": "+1" + "5" * 30}, "Invalid field phone_number"),
+    ({"first_name": "A" * 101}, "Invalid field first_name"),
+    ({"interested_in": "x" * 51}, "Invalid field interested_in"),
+    ({"last_name": 42}, "Invalid field last_name"),
+    ({"email": ""}, "Missing fields: email"),
+])
+def test_invalid_row_is_reported_not_loaded(monkeypatch, change, error):
+    loaded = []
+    monkeypatch.setattr(bulk_import, '_load_batch', lambda batch, report, send_otps: loaded.extend(batch))
+    report = bulk_import.import_users(io.StringIO(json.dumps({**VALID, **change})), 'jsonl')
+    assert loaded == []
+    assert [item["row"] for item in report["invalid"]] == [1]
+    assert report["invalid"][0]["error"].startswith(error)
+
+
+def test_non_object_json_row_is_invalid(monkeypatch):
+    monkeypatch.setattr(bulk_import, '_load_batch', lambda batch, report, send_otps: None)
+    report = bulk_import.import_users(io.StringIO("[1, 2]\n"), 'jsonl')
+    assert report["invalid"] == [{"row": 1, "error": "Row must be a JSON object"}]
+
+
+def test_valid_rows_reach_the_batch(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(bulk_import, '_load_batch', lambda batch, report, send_otps: loaded.extend(batch))
+    csv_text = "first_name,last_name,email,phone_number,password\nAda,Lovelace,ada@example.com,+15550100,secret\n"
+    bulk_import.import_users(io.StringIO(csv_text), 'csv')
+    assert [(number, row.email, row.interested_in) for number, row in loaded] == [(1, "ada@example.com", None)]
+
+
+def test_malformed_json_line_is_invalid_and_the_rest_still_load(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(bulk_import, '_load_batch', lambda batch, report, send_otps: loaded.extend(batch))
+    report = bulk_import.import_users(io.StringIO('{"first_name": \n' + json.dumps(VALID) + "\n"), 'jsonl')
+    assert [item["row"] for item in report["invalid"]] == [1]
+    assert report["invalid"][0]["error"].startswith("Row is not valid JSON")
+    assert [number for number, _ in loaded] == [2]
@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hashing
+
+
+@pytest.fixture
+def service():
+    # A thread pool in place of the spawn pool: admission control does not care which
+    service = hashing.HashingService(workers=1, max_pending=2)
+    service._executor = ThreadPoolExecutor(max_workers=1)
+    yield service
+    service.shutdown()
+
+
+def _settled(service, timeout=5):
+    # Done callbacks run just after a future's result is set
+    deadline = time.monotonic() + timeout
+    while service.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return service.stats()
+
+
+def test_jobs_past_max_pending_are_refused(service):
+    release = threading.Event()
+    futures = [service.submit(release.wait) for _ in range(2)]
+    with pytest.raises(hashing.HashingOverloaded):
+        service.submit(release.wait)
+    assert service.stats()["pending"] == 2
+    assert service.stats()["rejected"] == 1
+
+    release.set()
+    assert [future.result(timeout=5) for future in futures] == [True, True]
+    stats = _settled(service)
+    assert (stats["pending"], stats["completed"]) == (0, 2)
+    # Room again once they finished
+    assert service.submit(release.wait).result(timeout=5)
+
+
+def test_failed_job_releases_its_slot(service):
+    def fail():
+        raise ValueError("bad hash")
+
+    futures = [service.submit(fail) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    assert _settled(service)["pending"] == 0
+
+
+def test_job_the_pool_refuses_releases_its_slot(service):
+    service._executor.shutdown()
+    with pytest.raises(RuntimeError):
+        service.submit(time.sleep, 0)
+    assert service.stats()["pending"] == 0
+
+
+class _OverloadedHasher:
+    def generate_password_hash(self, password, method=None):
+        raise hashing.HashingOverloaded("full")
+
+
+def test_overloaded_signup_answers_503_with_retry_after(monkeypatch):
+    pytest.importorskip("flask_jwt_extended")
+    import app
+
+    monkeypatch.setattr(app.signup_filter, 'might_exist', lambda email, phone_number: False)
+    monkeypatch.setattr(app, 'get_hasher', _OverloadedHasher)
+    response = app.app.test_client().post("/api/signup", json={
+        "first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "phone_number": "+15550100",
+        "password": "secret", "reenter_password": "secret", "interested_in": "bonds"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.parametrize("method, normalized", [
+    ("scrypt", hashing.DEFAULT_METHOD),
+    ("scrypt:16384:8:1", "scrypt:16384:8:1"),
+    ("pbkdf2", f"pbkdf2:sha256:{hashing.DEFAULT_PBKDF2_ITERATIONS}"),
+    ("pbkdf2:sha512", f"pbkdf2:sha512:{hashing.DEFAULT_PBKDF2_ITERATIONS}"),
+    ("pbkdf2:sha256:600000", "pbkdf2:sha256:600000"),
+])
+def test_short_methods_are_spelled_out(method, normalized):
+    assert hashing._normalized(method) == normalized
+
+
+@pytest.mark.parametrize("setting, stored, rehash", [
+    # Same policy written short or in full: no rehash on every login
+    ("scrypt", f"{hashing.DEFAULT_METHOD}$salt$hash", False),
+    (hashing.DEFAULT_METHOD, f"{hashing.DEFAULT_METHOD}$salt$hash", False),
+    ("pbkdf2", f"pbkdf2:sha256:{hashing.DEFAULT_PBKDF2_ITERATIONS}$salt$hash", False),
+    ("pbkdf2:sha256", f"pbkdf2:sha256:{hashing.DEFAULT_PBKDF2_ITERATIONS}$salt$hash", False),
+    # A different policy: rehash
+    ("scrypt", "scrypt:16384:8:1$salt$hash", True),
+    ("scrypt:16384:8:1", f"{hashing.DEFAULT_METHOD}$salt$hash", True),
+    ("pbkdf2", "pbkdf2:sha256:600000$salt$hash", True),
+    ("pbkdf2:sha256:600000", f"{hashing.DEFAULT_METHOD}$salt$hash", True),
+])
+def test_needs_rehash_compares_normalized_methods(monkeypatch, setting, stored, rehash):
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", setting)
+    assert hashing.needs_rehash(stored) is rehash
+
+
+@pytest.mark.parametrize("setting", ["scrypt:4096:8:1", "pbkdf2:sha256:1000"])
+def test_fresh_hash_does_not_need_rehash(monkeypatch, setting):
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", setting)
+    assert not hashing.needs_rehash(hashing.generate_password_hash("secret", hashing.hash_method()))
+
+
+def test_werkzeug_default_scrypt_matches_the_short_form(monkeypatch):
+    # What werkzeug writes for "scrypt" is what _normalized() expects
+    monkeypatch.setenv("PASSWORD_HASH_METHOD", "scrypt")
+    assert not hashing.needs_rehash(hashing.generate_password_hash("secret", "scrypt"))
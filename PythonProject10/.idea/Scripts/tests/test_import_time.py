@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Provider SDKs that must only be imported when a message is actually sent
+LAZY_MODULES = ("twilio", "sendgrid", "python_http_client", "aiohttp", "email.mime")
+
+# Budget in ms for the cumulative `import app` time. Wall-clock time depends on
+# the host, so the check only runs where one is set for it.
+APP_BUDGET_MS = os.getenv("IMPORT_TIME_BUDGET_MS")
+
+
+def import_times(module):
+    """Run `python -X importtime -c "import <module>"` and return {name: cumulative microseconds}."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def lazily_loaded(times):
+    return sorted(name for name in times if name.startswith(LAZY_MODULES))
+
+
+@pytest.mark.parametrize("module, requires", [
+    ("app", "flask_jwt_extended"),
+    ("asgi_app", "fastapi"),
+    ("mailer", None),
+    ("sms", None),
+])
+def test_provider_sdks_are_not_imported_at_startup(module, requires):
+    if requires:
+        pytest.importorskip(requires)
+    assert lazily_loaded(import_times(module)) == []
+
+
+@pytest.mark.skipif(APP_BUDGET_MS is None, reason="set IMPORT_TIME_BUDGET_MS to check import time")
+def test_app_import_time_budget():
+    pytest.importorskip("flask_jwt_extended")
+    budget = float(APP_BUDGET_MS)
+    # Best of three, so one slow run on a busy machine does not fail the build
+    best = min(import_times("app")["app"] for _ in range(3)) / 1000
+    assert best < budget, f"import app took {best:.0f} ms (budget {budget:.0f} ms)"
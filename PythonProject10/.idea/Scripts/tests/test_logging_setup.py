@@ -0,0 +1,64 @@
+import json
+import logging
+
+import pytest
+
+import logging_setup
+import schemas
+
+
+@pytest.mark.parametrize("value, expected", [
+    ({"email": "ada@example.com", "password": "secret"}, {"email": "ada@example.com", "password": "***"}),
+    ({"otp": "123456", "email_otp": "123456", "phone_otp": "654321"}, {"otp": "***", "email_otp": "***",
+                                                                       "phone_otp": "***"}),
+    ({"access_token": "eyJ", "auth_token": "tw", "api_key": "SG."}, {"access_token": "***", "auth_token": "***",
+                                                                      "api_key": "***"}),
+    ({"Password": "secret"}, {"Password": "***"}),
+    ({"user": {"email": "ada@example.com", "reset": [{"new_password": "secret"}]}},
+     {"user": {"email": "ada@example.com", "reset": [{"new_password": "***"}]}}),
+    ("login failed password=secret otp: 123456", "login failed password=*** otp: ***"),
+    ("{'otp': '123456', 'email': 'ada@example.com'}", "{'otp': '***', 'email': 'ada@example.com'}"),
+])
+def test_redact_masks_sensitive_keys(value, expected):
+    assert logging_setup.redact(value) == expected
+
+
+def test_request_body_model_is_redacted_in_the_log_line():
+    # What app.py logs for verify-email: extra={"body": <VerifyEmailRequest>}
+    body = schemas.VerifyEmailRequest(email="ada@example.com", otp="123456")
+    record = logging.LogRecord("app", logging.DEBUG, __file__, 1, "verify-email request", (), None)
+    record.body = body
+    record.password = "secret"
+    entry = json.loads(logging_setup.JSONFormatter().format(record))
+    assert entry["body"] == {"email": "ada@example.com", "otp": "***"}
+    assert entry["password"] == "***"
+
+
+@pytest.fixture
+def fresh_logging(monkeypatch):
+    # As if configure_logging() had not run in this process yet; the root logger is restored afterwards
+    monkeypatch.setattr(logging_setup, '_handler', None)
+    monkeypatch.setattr(logging_setup, '_writer', None)
+    root = logging.getLogger()
+    monkeypatch.setattr(root, 'handlers', list(root.handlers))
+    monkeypatch.setattr(root, 'level', root.level)
+    yield root
+    if logging_setup._writer is not None:
+        logging_setup._writer.stop()
+
+
+def test_configure_logging_keeps_other_handlers(fresh_logging):
+    host = logging.NullHandler()
+    fresh_logging.addHandler(host)
+    logging_setup.configure_logging()
+    installed = logging_setup._handler
+    assert host in fresh_logging.handlers
+    assert installed in fresh_logging.handlers
+    logging_setup.configure_logging()  # a second call adds nothing
+    assert fresh_logging.handlers.count(installed) == 1
+
+
+def test_caplog_still_captures(fresh_logging, caplog):
+    logging_setup.configure_logging()
+    logging.getLogger("app").warning("still captured")
+    assert "still captured" in caplog.text
@@ -0,0 +1,181 @@
+import json
+import threading
+
+import pytest
+
+import mailer
+
+
+@pytest.fixture
+def fresh_backend(monkeypatch):
+    # get_email_backend() and get_smtp_pool() cache per process; start each test without either
+    monkeypatch.setattr(mailer, '_backend', None)
+    monkeypatch.setattr(mailer, '_pool', None)
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+    monkeypatch.setenv("SENDGRID_EMAIL", "noreply@example.com")
+    monkeypatch.setenv("EMAIL_APPCODE", "noreply@example.com")
+
+
+def _get_backend_with_timeout(timeout=5):
+    # A deadlock would hang the test run instead of failing it
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('backend', mailer.get_email_backend()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "get_email_backend() did not return"
+    return result['backend']
+
+
+@pytest.mark.parametrize("setting, expected", [
+    ("smtp", mailer.SMTPBackend),
+    ("sendgrid", mailer.SendGridBackend),
+    ("sendgrid,smtp", mailer.FallbackBackend),
+    ("smtp,sendgrid", mailer.FallbackBackend),
+])
+def test_get_email_backend(fresh_backend, monkeypatch, setting, expected):
+    if "sendgrid" in setting:
+        pytest.importorskip("sendgrid")
+    monkeypatch.setenv("EMAIL_BACKEND", setting)
+    backend = _get_backend_with_timeout()
+    assert isinstance(backend, expected)
+    assert backend.name == setting
+    assert mailer.get_email_backend() is backend
+
+
+def test_get_email_backend_rejects_unknown_name(fresh_backend, monkeypatch):
+    monkeypatch.setenv("EMAIL_BACKEND", "carrier-pigeon")
+    with pytest.raises(ValueError):
+        mailer.get_email_backend()
+
+
+class SendGridStandIn:
+    """Local HTTP stand-in for POST /v3/mail/send.
+
+    Answers 202, or ``status`` when set; personalizations addressed to
+    someone at bad.example get SendGrid's 400 pointing at their fields (only
+    the first one with ``first_error_only``), and ``sender_error`` gets a 400
+    about the from address instead.
+    """
+
+    def __init__(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        stand_in = self
+        self.requests = []
+        self.accepted = []
+        self.status = None
+        self.sender_error = False
+        self.first_error_only = False
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                stand_in.requests.append(body)
+                status, errors = stand_in.respond(body)
+                if status == 202:
+                    stand_in.accepted.extend(p["to"][0]["email"] for p in body["personalizations"])
+                payload = json.dumps({"errors": errors}).encode() if errors else b""
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, body):
+        if self.status:
+            return self.status, [{"message": "stand-in error", "field": None}]
+        if self.sender_error:
+            return 400, [{"message": "The from address does not match a verified Sender Identity.",
+                          "field": "from"}]
+        errors = [{"message": "Does not contain a valid address.", "field": f"personalizations.{index}.to.0.email"}
+                  for index, personalization in enumerate(body["personalizations"])
+                  if personalization["to"][0]["email"].endswith("@bad.example")]
+        if errors:
+            return 400, errors[:1] if self.first_error_only else errors
+        return 202, None
+
+
+@pytest.fixture
+def sendgrid_stand_in():
+    pytest.importorskip("sendgrid")
+    stand_in = SendGridStandIn()
+    yield stand_in
+    stand_in.server.shutdown()
+
+
+def _messages(count, bad=()):
+    return [(f"user{i}@{'bad' if i in bad else 'example'}.example", "Subject", f"Body {i}") for i in range(count)]
+
+
+def test_sendgrid_sends_a_batch_in_one_request(sendgrid_stand_in):
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    assert backend.send_many(_messages(5)) == []
+    assert len(sendgrid_stand_in.requests) == 1
+    request = sendgrid_stand_in.requests[0]
+    assert [p["subject"] for p in request["personalizations"]] == ["Subject"] * 5
+    assert request["personalizations"][2]["substitutions"] == {mailer.SendGridBackend.BODY_TAG: "Body 2"}
+
+
+def test_sendgrid_splits_requests_by_batch_size(sendgrid_stand_in):
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url, batch_size=2)
+    assert backend.send_many(_messages(5)) == []
+    assert [len(r["personalizations"]) for r in sendgrid_stand_in.requests] == [2, 2, 1]
+
+
+def test_sendgrid_fails_only_the_bad_recipients(sendgrid_stand_in):
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    failures = backend.send_many(_messages(1000, bad={11, 600}))
+    assert [index for index, _ in failures] == [11, 600]
+    assert failures[0][1].status_code == 400
+    # The batch, then the batch without the two named addresses
+    assert len(sendgrid_stand_in.requests) == 2
+    assert len(sendgrid_stand_in.accepted) == 998
+    assert not any(email.endswith("@bad.example") for email in sendgrid_stand_in.accepted)
+
+
+def test_sendgrid_retries_until_no_recipient_is_named(sendgrid_stand_in):
+    sendgrid_stand_in.first_error_only = True
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    failures = backend.send_many(_messages(16, bad={2, 12}))
+    assert [index for index, _ in failures] == [2, 12]
+    assert len(sendgrid_stand_in.requests) == 3
+    assert len(sendgrid_stand_in.accepted) == 14
+
+
+def test_sendgrid_does_not_retry_on_a_400_about_the_sender(sendgrid_stand_in):
+    sendgrid_stand_in.sender_error = True
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    failures = backend.send_many(_messages(1000))
+    assert len(failures) == 1000
+    assert len(sendgrid_stand_in.requests) == 1
+
+
+def test_sendgrid_does_not_retry_when_every_recipient_is_named(sendgrid_stand_in):
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    failures = backend.send_many(_messages(4, bad={0, 1, 2, 3}))
+    assert [index for index, _ in failures] == [0, 1, 2, 3]
+    assert len(sendgrid_stand_in.requests) == 1
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_sendgrid_fails_the_batch_on_rate_limit_and_server_errors(sendgrid_stand_in, status):
+    sendgrid_stand_in.status = status
+    backend = mailer.SendGridBackend("SG.test", "noreply@example.com", host=sendgrid_stand_in.url)
+    failures = backend.send_many(_messages(4))
+    assert [index for index, _ in failures] == [0, 1, 2, 3]
+    assert {error.status_code for _, error in failures} == {status}
+    assert len(sendgrid_stand_in.requests) == 1
+
+
+def test_email_backend_requires_send_many():
+    class Incomplete(mailer.EmailBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+
+import pytest
+
+import metrics
+
+REQUESTS = metrics.Counter("test_thread_requests", "Requests counted by short-lived threads.", ("route",))
+
+
+def _record_in_threads(count):
+    for _ in range(count):
+        thread = threading.Thread(target=REQUESTS.inc, args=("/api/login",))
+        thread.start()
+        thread.join()
+
+
+def _total():
+    return metrics.snapshot().get("test_thread_requests\x00/api/login", 0)
+
+
+def test_exited_threads_leave_no_shard_behind():
+    before = _total()
+    _record_in_threads(500)
+    # Only threads still running keep a shard
+    assert len(metrics._shards) <= threading.active_count()
+    assert _total() == before + 500
+
+
+def test_live_thread_keeps_counting_into_its_shard():
+    before = _total()
+    recorded, finish = threading.Event(), threading.Event()
+
+    def worker():
+        REQUESTS.inc("/api/login")
+        recorded.set()
+        finish.wait()
+        REQUESTS.inc("/api/login")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    recorded.wait()
+    assert _total() == before + 1
+    finish.set()
+    thread.join()
+    assert _total() == before + 2
+
+
+@pytest.mark.parametrize("token, authorization, allowed", [
+    ("s3cret", "Bearer s3cret", True),
+    ("s3cret", "bearer s3cret", True),
+    ("s3cret", "Bearer wrong", False),
+    ("s3cret", "Basic s3cret", False),
+    ("s3cret", None, False),
+    (None, "Bearer ", False),
+])
+def test_authorized(monkeypatch, token, authorization, allowed):
+    if token is None:
+        monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    else:
+        monkeypatch.setenv("METRICS_TOKEN", token)
+    assert metrics.authorized(authorization) is allowed
+
+
+def test_metrics_route_needs_the_token(monkeypatch):
+    pytest.importorskip("flask_jwt_extended")
+    import app
+
+    client = app.app.test_client()
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setenv("METRICS_TOKEN", "s3cret")
+    assert client.get("/metrics").status_code == 404
+    response = client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"http_requests_total" in response.data
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, '_flushed_pid', None)
+    return tmp_path
+
+
+def _series(snap):
+    return snap.get("test_thread_requests\x00/api/login", 0)
+
+
+def test_collect_all_ignores_files_that_are_not_snapshots(metrics_dir):
+    (metrics_dir / "README.json").write_text("{}")
+    (metrics_dir / "123abc.json").write_text("[]")
+    (metrics_dir / "notes.txt").write_text("hello")
+    assert _series(metrics.collect_all()) == _total()
+
+
+def test_exited_process_totals_survive_pid_reuse(metrics_dir):
+    # An exited process with this PID left its snapshot, plus one from another exited process
+    (metrics_dir / f"{os.getpid()}.json").write_text(json.dumps({"test_thread_requests\x00/api/login": 5}))
+    (metrics_dir / "999999999.json").write_text(json.dumps({"test_thread_requests\x00/api/login": 7}))
+    assert _series(metrics.collect_all()) == _total() + 7  # our own file is never read back
+
+    metrics.flush()
+    assert len(list(metrics_dir.glob("retired-*.json"))) == 1
+    assert _series(metrics.collect_all()) == _total() + 5 + 7
+    # Later flushes only replace this process's own file
+    metrics.flush()
+    assert len(list(metrics_dir.glob("retired-*.json"))) == 1
+    assert _series(metrics.collect_all()) == _total() + 5 + 7
@@ -0,0 +1,44 @@
+import pytest
+
+import migrate
+
+
+class FakeCursor:
+    """Answers the pg_index lookup with ``invalid`` (None: no such index) and records statements."""
+
+    def __init__(self, invalid):
+        self.invalid = invalid
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchone(self):
+        return None if self.invalid is None else (self.invalid,)
+
+
+def _index_statements():
+    return [statement for _, _, up_sql, _ in migrate.load_migrations()
+            for statement in migrate._statements(up_sql) if "CONCURRENTLY" in statement.upper()]
+
+
+def test_every_concurrent_index_build_is_checked():
+    statements = _index_statements()
+    assert statements
+    for statement in statements:
+        assert migrate._CONCURRENT_INDEX.match(statement), statement
+
+
+@pytest.mark.parametrize("invalid, dropped", [(True, True), (False, False), (None, False)])
+def test_invalid_index_is_dropped_before_the_build(invalid, dropped):
+    cursor = FakeCursor(invalid)
+    migrate._drop_invalid_index(cursor, "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_login_covering_idx\n"
+                                        "    ON users (email) INCLUDE (password)")
+    drops = [sql for sql in cursor.executed if sql.startswith("DROP")]
+    assert drops == (["DROP INDEX CONCURRENTLY IF EXISTS users_login_covering_idx"] if dropped else [])
+
+
+def test_other_statements_are_left_alone():
+    cursor = FakeCursor(True)
+    migrate._drop_invalid_index(cursor, "DROP INDEX CONCURRENTLY IF EXISTS users_email_lower_idx")
+    assert cursor.executed == []
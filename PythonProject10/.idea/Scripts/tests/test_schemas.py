@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import schemas
+
+SIGNUP = {"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "phone_number": "+15550100",
+          "password": "secret", "reenter_password": "secret", "interested_in": "bonds"}
+
+
+def _error(model, body):
+    with pytest.raises(schemas.InvalidRequest) as raised:
+        schemas.parse(model, body)
+    return str(raised.value)
+
+
+@pytest.mark.parametrize("model, body, message", [
+    (schemas.VerifyEmailRequest, b'{"email": "ada@example.com"}', "Missing fields: otp"),
+    (schemas.ResetPasswordRequest, b'{}', "Missing fields: identifier, otp, new_password"),
+    (schemas.VerifyEmailRequest, b'{"email": "ada@example.com", "otp": ', "Request body is not valid JSON"),
+    (schemas.VerifyEmailRequest, b'', "Request body is not valid JSON"),
+    (schemas.VerifyEmailRequest, b'["ada@example.com", "123456"]', "Request body must be a JSON object"),
+    (schemas.VerifyEmailRequest, b'{"email": 42, "otp": "123456"}',
+     "Invalid field email: Input should be a valid string"),
+])
+def test_400_messages(model, body, message):
+    assert _error(model, body) == message
+
+
+def test_missing_fields_come_before_other_problems():
+    body = json.dumps({"email": 42})
+    assert _error(schemas.VerifyEmailRequest, body) == \
+        "Missing fields: otp; Invalid field email: Input should be a valid string"
+
+
+@pytest.mark.parametrize("field, limit", [
+    ("first_name", 100), ("last_name", 100), ("email", 100), ("phone_number", 20), ("interested_in", 50),
+])
+def test_signup_fields_are_bounded_by_their_columns(field, limit):
+    assert schemas.parse(schemas.SignupRequest, json.dumps({**SIGNUP, field: "x" * limit}))
+    assert _error(schemas.SignupRequest, json.dumps({**SIGNUP, field: "x" * (limit + 1)})) == \
+        f"Invalid field {field}: String should have at most {limit} characters"
+
+
+def test_unknown_keys_are_ignored():
+    body = json.dumps({"email": "ada@example.com", "otp": "123456", "remember_me": True})
+    assert schemas.parse(schemas.VerifyEmailRequest, body) == \
+        schemas.VerifyEmailRequest(email="ada@example.com", otp="123456")
+
+
+def test_dump_encodes_response_models():
+    assert schemas.dump(schemas.VerifyPhoneResponse(message="ok", investor_id="I00010000")) == \
+        b'{"message":"ok","investor_id":"I00010000"}'
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+import sms
+
+
+@pytest.fixture
+def no_senders(monkeypatch):
+    # get_sender_pool() caches per process; start without one and with nothing to build it from
+    monkeypatch.setattr(sms, '_sender_pool', None)
+    for name in ("TWILIO_MESSAGING_SERVICE_SID", "TWILIO_PHONE_NUMBERS", "TWILIO_PHONE_NUMBER"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_async_sender_without_senders_fails_only_its_messages(no_senders):
+    # The outbox worker builds this at startup, before it knows whether any SMS are queued
+    sender = sms.get_async_sms_sender()
+    failures = asyncio.run(sender.send_many([("+15550100", "one"), ("+15550101", "two")]))
+    assert [index for index, _ in failures] == [0, 1]
+    assert all(isinstance(error, ValueError) for _, error in failures)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _pool(clock, count=1, **kwargs):
+    return sms.SenderPool([{"from_": f"+1500555{i:04d}"} for i in range(count)], clock=clock, **kwargs)
+
+
+def test_token_bucket_delays_sends_past_the_burst(clock):
+    pool = _pool(clock, rate=2.0, burst=2)
+    delays = [pool.reserve("+15550100")[1] for _ in range(4)]
+    assert delays == [0.0, 0.0, 0.5, 1.0]
+    # Refilled at 2 per second, capped at the burst
+    clock.now += 10
+    assert [pool.reserve("+15550100")[1] for _ in range(3)] == [0.0, 0.0, 0.5]
+
+
+def test_new_recipient_gets_the_least_loaded_sender(clock):
+    pool = _pool(clock, count=2)
+    first = pool.reserve("+15550100")
+    second = pool.reserve("+15550101")
+    assert first == ({"from_": "+15005550000"}, 0.0)
+    assert second == ({"from_": "+15005550001"}, 0.0)
+    # Both queues now a second long; the tie goes to the first sender
+    assert pool.reserve("+15550102") == ({"from_": "+15005550000"}, 1.0)
+    assert pool.reserve("+15550103") == ({"from_": "+15005550001"}, 1.0)
+
+
+def test_recipient_sticks_to_its_sender(clock):
+    pool = _pool(clock, count=2)
+    sender, _ = pool.reserve("+15550100")
+    pool.reserve("+15550101")
+    # Its sender has the longer queue now, but the recipient keeps seeing the same number
+    assert [pool.reserve("+15550100")[0] for _ in range(3)] == [sender] * 3
+
+
+def test_least_recently_used_recipient_is_forgotten(clock):
+    pool = _pool(clock, count=2, max_sticky=2)
+    a_sender, _ = pool.reserve("+15550100")
+    b_sender, _ = pool.reserve("+15550101")
+    pool.reserve("+15550100")  # a is now the most recently used
+    pool.reserve("+15550102")  # evicts b
+    assert list(pool._sticky) == ["+15550100", "+15550102"]
+    clock.now += 60
+    # b is placed afresh: all queues are empty again, so it gets the first sender
+    assert pool.reserve("+15550101")[0] == a_sender != b_sender
+
+
+def test_sender_pool_needs_a_sender():
+    with pytest.raises(ValueError):
+        sms.SenderPool([])
@@ -0,0 +1,148 @@
+import socket
+import socketserver
+import threading
+
+import pytest
+
+import mailer
+
+
+class SMTPStandIn:
+    """Local SMTP server speaking just enough of RFC 5321 for smtplib.
+
+    ``drop_on_mail`` answers that many MAIL commands with "421" and hangs up,
+    as a server does when it closes an idle or overloaded session, and
+    ``drop_on_noop`` does the same for NOOP.
+    """
+
+    def __init__(self):
+        stand_in = self
+        self.connections = 0
+        self.noops = 0
+        self.messages = []
+        self.drop_on_mail = 0
+        self.drop_on_noop = 0
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                stand_in.connections += 1
+                self.reply("220 stand-in ESMTP")
+                for line in self.rfile:
+                    verb = line.decode().split(" ", 1)[0].strip().upper()
+                    if verb in ("EHLO", "HELO"):
+                        self.reply("250 stand-in")
+                    elif verb == "MAIL" and stand_in.drop_on_mail:
+                        stand_in.drop_on_mail -= 1
+                        self.reply("421 4.7.0 Closing connection")
+                        return
+                    elif verb == "NOOP":
+                        stand_in.noops += 1
+                        if stand_in.drop_on_noop:
+                            stand_in.drop_on_noop -= 1
+                            self.reply("421 4.4.2 Timeout")
+                            return
+                        self.reply("250 OK")
+                    elif verb == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                        stand_in.messages.append(data)
+                        self.reply("250 OK queued")
+                    elif verb == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    elif verb in ("MAIL", "RCPT", "RSET"):
+                        self.reply("250 OK")
+                    else:
+                        self.reply("502 Command not implemented")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def smtp_stand_in():
+    stand_in = SMTPStandIn()
+    yield stand_in
+    stand_in.server.shutdown()
+    stand_in.server.server_close()
+
+
+def _pool(port, **kwargs):
+    return mailer.SMTPConnectionPool("127.0.0.1", port, None, None, use_ssl=False, timeout=5, **kwargs)
+
+
+def _messages(count):
+    return [("noreply@example.com", f"user{i}@example.com", f"Subject: OTP\r\n\r\nYour OTP: {i}") for i in range(count)]
+
+
+def test_sessions_are_reused_across_messages_and_batches(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port)
+    assert pool.send_many(_messages(3)) == []
+    assert pool.send_many(_messages(2)) == []
+    assert smtp_stand_in.connections == 1
+    assert len(smtp_stand_in.messages) == 5
+    pool.closeall()
+
+
+def test_reconnects_after_a_421(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port)
+    smtp_stand_in.drop_on_mail = 1
+    assert pool.send_many(_messages(3)) == []
+    assert smtp_stand_in.connections == 2
+    assert len(smtp_stand_in.messages) == 3
+    pool.closeall()
+
+
+def test_a_second_421_fails_only_that_message(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port)
+    smtp_stand_in.drop_on_mail = 2
+    failures = pool.send_many(_messages(3))
+    assert [index for index, _ in failures] == [0]
+    assert failures[0][1].smtp_code == 421
+    assert len(smtp_stand_in.messages) == 2
+    pool.closeall()
+
+
+def test_idle_session_is_checked_with_noop(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port, noop_after=0)
+    pool.send_many(_messages(1))
+    pool.send_many(_messages(1))
+    assert smtp_stand_in.noops == 1
+    assert smtp_stand_in.connections == 1
+    pool.closeall()
+
+
+def test_session_failing_noop_is_replaced(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port, noop_after=0)
+    pool.send_many(_messages(1))
+    smtp_stand_in.drop_on_noop = 1
+    assert pool.send_many(_messages(1)) == []
+    assert smtp_stand_in.connections == 2
+    assert len(smtp_stand_in.messages) == 2
+    pool.closeall()
+
+
+def test_session_is_retired_after_max_messages(smtp_stand_in):
+    pool = _pool(smtp_stand_in.port, max_messages=2)
+    assert pool.send_many(_messages(5)) == []
+    assert smtp_stand_in.connections == 3
+    pool.closeall()
+
+
+def test_unreachable_server_fails_the_batch_after_one_connect(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    pool = _pool(port)
+    connects = []
+    connect = pool._connect
+    monkeypatch.setattr(pool, '_connect', lambda: connects.append(1) or connect())
+    failures = pool.send_many(_messages(50))
+    assert [index for index, _ in failures] == list(range(50))
+    assert isinstance(failures[0][1], ConnectionRefusedError)
+    assert len(connects) == 1
@@ -0,0 +1,281 @@
+"""Sampled request tracing with OpenTelemetry's span model.
+
+Each /api request is the root span of a trace (or continues the caller's,
+from a W3C traceparent header); registry statements, password hashes and
+email/SMS provider calls are child spans. Messages queued in the outbox
+carry the traceparent of the request that queued them, and outbox_worker
+records their delivery as a span in that same trace, so a slow OTP can be
+followed from the signup request to the Twilio call.
+
+A trace is recorded for TRACE_SAMPLE_RATE of requests (0, the default,
+turns tracing off) and always when the incoming traceparent says the
+caller sampled it. A request that is not sampled gets a shared no-op span
+back from every call here, so it costs one ContextVar read per call site.
+
+Finished spans go onto a bounded queue (dropped when full, like log
+records) and a background thread exports them every TRACE_FLUSH_INTERVAL
+seconds as OTLP/HTTP JSON (ExportTraceServiceRequest) payloads:
+
+    TRACE_EXPORTER=file   one payload per line appended to TRACE_FILE (traces.jsonl)
+    TRACE_EXPORTER=otlp   POSTed to TRACE_OTLP_ENDPOINT (http://localhost:4318/v1/traces)
+
+Resource attribute service.name comes from OTEL_SERVICE_NAME (realoneinvest).
+"""
+import atexit
+import collections
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# OTLP SpanKind
+INTERNAL, SERVER, CLIENT, PRODUCER, CONSUMER = 1, 2, 3, 4, 5
+
+_STATUS_ERROR = 2
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current = contextvars.ContextVar('trace_span', default=None)
+_sample_rate = None
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def _rate():
+    # Read on first use rather than at import, after the app has loaded .env
+    global _sample_rate
+    if _sample_rate is None:
+        _sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    return _sample_rate
+
+
+class _NoopSpan:
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def fail(self, error):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def traceparent(self):
+        return None
+
+
+NOOP = _NoopSpan()
+
+
+class Span:
+    """One timed operation; ``with`` makes it the parent of spans started inside."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attributes', 'links', 'start', 'finish',
+                 'error', '_token')
+
+    def __init__(self, trace_id, parent_id, name, kind=INTERNAL, attributes=None, links=()):
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.links = [(link.trace_id, link.span_id) for link in links if link.trace_id]
+        self.start = time.time_ns()
+        self.finish = None
+        self.error = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(exc)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def fail(self, error):
+        """Mark the span failed without an exception, e.g. for a 500 response."""
+        self.error = error
+
+    def end(self, error=None):
+        if self.finish is None:
+            self.finish = time.time_ns()
+            if error is not None:
+                self.error = error
+            _export(self)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.finish),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.links:
+            span["links"] = [{"traceId": trace_id, "spanId": span_id} for trace_id, span_id in self.links]
+        if self.error is not None:
+            span["status"] = {"code": _STATUS_ERROR, "message": str(self.error)[:500]}
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def start_trace(name, traceparent=None, kind=SERVER, attributes=None, links=(), sampled=None):
+    """A root span for a request or job, continuing ``traceparent`` if given.
+
+    Sampled when the traceparent says so, else with TRACE_SAMPLE_RATE;
+    ``sampled=True`` forces it (while tracing is on). Returns NOOP otherwise.
+    """
+    rate = _rate()
+    if rate <= 0:
+        return NOOP
+    match = _TRACEPARENT.match(traceparent) if traceparent else None
+    if match:
+        if not int(match.group(3), 16) & 1:
+            return NOOP
+        return Span(match.group(1), match.group(2), name, kind, attributes, links)
+    if not sampled and random.random() >= rate:
+        return NOOP
+    return Span('%032x' % random.getrandbits(128), None, name, kind, attributes, links)
+
+
+def span(name, kind=INTERNAL, attributes=None):
+    """A child of the current span, or NOOP when this trace is not recorded."""
+    parent = _current.get()
+    if parent is None:
+        return NOOP
+    return Span(parent.trace_id, parent.span_id, name, kind, attributes)
+
+
+def current_traceparent():
+    """W3C traceparent of the current span, for handing the trace to background work."""
+    parent = _current.get()
+    return parent.traceparent() if parent is not None else None
+
+
+def current_trace_id():
+    parent = _current.get()
+    return parent.trace_id if parent is not None else None
+
+
+class _Exporter(threading.Thread):
+    def __init__(self):
+        super().__init__(name="trace-exporter", daemon=True)
+        self.spans = collections.deque()
+        self.max_queued = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+        self.interval = float(os.getenv("TRACE_FLUSH_INTERVAL", "1"))
+        self.kind = os.getenv("TRACE_EXPORTER", "file")
+        self.path = os.getenv("TRACE_FILE", "traces.jsonl")
+        self.endpoint = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+        self.resource = {"attributes": [
+            {"key": "service.name", "value": _otlp_value(os.getenv("OTEL_SERVICE_NAME", "realoneinvest"))},
+            {"key": "process.pid", "value": _otlp_value(os.getpid())},
+        ]}
+        self.dropped = 0
+        self.stopping = threading.Event()
+
+    def add(self, finished):
+        if len(self.spans) >= self.max_queued:
+            self.dropped += 1
+            return
+        self.spans.append(finished)
+
+    def drain(self):
+        spans = []
+        while self.spans:
+            spans.append(self.spans.popleft().to_otlp())
+        if not spans:
+            return
+        payload = json.dumps({"resourceSpans": [{"resource": self.resource, "scopeSpans": [
+            {"scope": {"name": __name__}, "spans": spans}]}]})
+        if self.kind == 'otlp':
+            import urllib.request  # http.client and email.parser; not worth loading for the file exporter
+
+            request = urllib.request.Request(self.endpoint, payload.encode(),
+                                             headers={"Content-Type": "application/json"})
+            urllib.request.urlopen(request, timeout=10).close()
+        else:
+            # One unbuffered append per payload, so lines from several workers do not interleave
+            with open(self.path, "ab", buffering=0) as f:
+                f.write(payload.encode() + b"\n")
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.drain()
+            except Exception:
+                log.warning("Trace export failed", exc_info=True)
+        self.drain()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+def _export(finished):
+    global _exporter
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = _Exporter()
+                _exporter.start()
+    _exporter.add(finished)
+
+
+def _reset_after_fork():
+    # The exporter thread does not survive fork(); the child starts its own on its first span
+    global _exporter
+    _exporter = None
+
+
+def shutdown():
+    """Export whatever is still queued."""
+    if _exporter is not None and _exporter.is_alive():
+        _exporter.stop()
+
+
+def stats():
+    return {"dropped": _exporter.dropped if _exporter else 0,
+            "queued": len(_exporter.spans) if _exporter else 0}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(shutdown)
+
+
+metrics.GaugeCallback("trace_spans", "Finished spans waiting for export, and dropped because the queue was full.",
+                      ("state",), lambda: {(state,): value for state, value in stats().items()})